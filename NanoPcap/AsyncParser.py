@@ -0,0 +1,224 @@
+
+# Copyright (c) 2015-2023 Agalmic Ventures LLC (www.agalmicventures.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import array
+
+from NanoPcap import Format, Parser
+
+class AsyncPcapParser(object):
+
+	def __init__(self, reader, strict=False, blockSize=Parser.DEFAULT_BLOCK_SIZE):
+		"""
+		Instantiates a parser for the given asyncio.StreamReader (socket, pipe, etc.)
+
+		Reads take whatever is available up to blockSize bytes, and every complete record already buffered
+		is parsed before awaiting more data, so the stream's own flow control is kept busy without
+		awaiting once per record.
+
+		:param reader: asyncio.StreamReader to parse from
+		:param strict: bool Indicating strict validation
+		:param blockSize: int The maximum size of each read
+		"""
+		if blockSize < 1:
+			raise ValueError('blockSize must be positive')
+
+		self._reader = reader
+		self._strict = strict
+		self._blockSize = blockSize
+
+		self._header = None
+		self._recordHeaderStruct = None
+
+		self._buffer = bytearray()
+		self._start = 0
+		self._offset = 0 #Of the start of the buffered data
+		self._eof = False
+
+	def header(self):
+		"""
+		Returns the PCAP file header.
+
+		:return: PcapHeader or None if it has not been read yet
+		"""
+		return self._header
+
+	async def _fill(self, n):
+		"""
+		Reads until at least n unconsumed bytes are buffered, or EOF.
+
+		:param n: int
+		"""
+		if len(self._buffer) - self._start >= n:
+			return
+
+		#Drop consumed data before growing the buffer
+		if self._start > 0:
+			del self._buffer[:self._start]
+			self._offset += self._start
+			self._start = 0
+
+		while len(self._buffer) < n and not self._eof:
+			data = await self._reader.read(max(self._blockSize, n - len(self._buffer)))
+			if len(data) == 0:
+				self._eof = True
+			else:
+				self._buffer += data
+
+	async def readHeader(self):
+		"""
+		Reads the PCAP file header, if it has not been read yet.
+
+		:return: PcapHeader
+		"""
+		if self._header is None:
+			headerSize = Format.PCAP_HEADER_STRUCT.size
+			await self._fill(headerSize)
+			if len(self._buffer) < headerSize:
+				raise ValueError('Could not read comple PCAP header (got only %d bytes)' % len(self._buffer))
+
+			self._header, self._recordHeaderStruct = Parser._parseHeader(self._buffer, self._strict)
+			self._start = headerSize
+
+		return self._header
+
+	async def parse(self):
+		"""
+		Parses the PCAP stream, reading the header first if necessary.
+
+		:return: async iterable of (PcapRecordHeader, bytes)
+		"""
+		fileHeader = await self.readHeader()
+		strict = self._strict
+		recordHeaderSize = self._recordHeaderStruct.size
+		unpackFrom = self._recordHeaderStruct.unpack_from
+
+		while True:
+			if len(self._buffer) - self._start < recordHeaderSize:
+				await self._fill(recordHeaderSize)
+				available = len(self._buffer) - self._start
+				if available == 0:
+					break #EOF
+				elif available < recordHeaderSize:
+					raise ValueError('Could not read comple PCAP record header (got only %d bytes)' % available)
+
+			recordHeader = Format.PcapRecordHeader(*unpackFrom(self._buffer, self._start),
+				fileHeader=fileHeader, strict=strict)
+
+			recordLength = recordHeaderSize + recordHeader.includedLength()
+			if len(self._buffer) - self._start < recordLength:
+				await self._fill(recordLength)
+				available = len(self._buffer) - self._start
+				if available < recordLength:
+					raise ValueError('Could not read PCAP record data (expected %d bytes; got %d)' % (
+						recordHeader.includedLength(), available - recordHeaderSize))
+
+			#Copy the data once, through a view (released before the buffer is resized)
+			start = self._start + recordHeaderSize
+			self._start += recordLength
+			with memoryview(self._buffer) as view:
+				data = bytes(view[start:self._start])
+			yield (recordHeader, data)
+
+	async def parseBatches(self, batchSize=Parser.DEFAULT_BATCH_SIZE):
+		"""
+		Parses the PCAP stream into batches of records, reading the header first if necessary. Batches
+		hold the complete records buffered so far (up to batchSize), so a batch is yielded as soon as
+		waiting would be needed rather than when it is full.
+
+		:param batchSize: int The maximum number of records per batch
+		:return: async iterable of PcapRecordBatch
+		"""
+		await self.readHeader()
+		recordHeaderSize = self._recordHeaderStruct.size
+		unpackFrom = self._recordHeaderStruct.unpack_from
+		fracNanos = self._header.fracNanos()
+
+		while True:
+			#Wait for at least one complete record
+			await self._fill(recordHeaderSize)
+			available = len(self._buffer) - self._start
+			if available == 0:
+				break #EOF
+			elif available < recordHeaderSize:
+				raise ValueError('Could not read comple PCAP record header (got only %d bytes)' % available)
+
+			includedLength = unpackFrom(self._buffer, self._start)[2]
+			await self._fill(recordHeaderSize + includedLength)
+			available = len(self._buffer) - self._start
+			if available < recordHeaderSize + includedLength:
+				raise ValueError('Could not read PCAP record data (expected %d bytes; got %d)' % (
+					includedLength, available - recordHeaderSize))
+
+			tsSecs = array.array(Format.BATCH_ARRAY_TYPECODE)
+			tsFracs = array.array(Format.BATCH_ARRAY_TYPECODE)
+			includedLengths = array.array(Format.BATCH_ARRAY_TYPECODE)
+			originalLengths = array.array(Format.BATCH_ARRAY_TYPECODE)
+			fileOffsets = array.array(Format.BATCH_ARRAY_TYPECODE)
+			dataOffsets = array.array(Format.BATCH_ARRAY_TYPECODE)
+
+			buffer = self._buffer
+			size = len(buffer)
+			batchStart = offset = self._start
+			for _ in range(batchSize):
+				if size - offset < recordHeaderSize:
+					break
+
+				tsSec, tsFrac, includedLength, originalLength = unpackFrom(buffer, offset)
+				end = offset + recordHeaderSize + includedLength
+				if end > size:
+					break
+
+				tsSecs.append(tsSec)
+				tsFracs.append(tsFrac)
+				includedLengths.append(includedLength)
+				originalLengths.append(originalLength)
+				fileOffsets.append(self._offset + offset)
+				dataOffsets.append(offset + recordHeaderSize - batchStart)
+
+				offset = end
+
+			self._start = offset
+			batch = Format.PcapRecordBatch(self._header, tsSecs, tsFracs, Format.epochNanosArray(tsSecs, tsFracs, fracNanos),
+				includedLengths, originalLengths, fileOffsets, bytes(buffer[batchStart:offset]), dataOffsets)
+			batch.validate(strict=self._strict)
+			yield batch
+
+async def parse(reader, listener, strict=False, batchSize=Parser.DEFAULT_BATCH_SIZE, blockSize=Parser.DEFAULT_BLOCK_SIZE):
+	"""
+	Parse a PCAP from the given asyncio.StreamReader, calling the (synchronous) listener as records arrive.
+
+	:param reader: asyncio.StreamReader to parse from
+	:param listener: PcapListener
+	:param strict: bool Indicating strict validation
+	:param batchSize: int The maximum number of records per batch for listeners implementing onPcapRecordBatch
+	:param blockSize: int The maximum size of each read
+	"""
+	parser = AsyncPcapParser(reader, strict=strict, blockSize=blockSize)
+	listener.onPcapHeader(await parser.readHeader())
+
+	onPcapRecordBatch = getattr(listener, 'onPcapRecordBatch', None)
+	if onPcapRecordBatch is not None:
+		async for batch in parser.parseBatches(batchSize):
+			onPcapRecordBatch(batch)
+	else:
+		onPcapRecord = listener.onPcapRecord
+		async for recordHeader, data in parser.parse():
+			onPcapRecord(recordHeader, data)
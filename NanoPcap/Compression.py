@@ -0,0 +1,500 @@
+
+# Copyright (c) 2015-2023 Agalmic Ventures LLC (www.agalmicventures.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import bz2
+import collections
+import concurrent.futures
+import gzip
+import io
+import lzma
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+
+########## Constants ##########
+
+#The default number of buffers decompressed ahead of the parser
+DEFAULT_READAHEAD_QUEUE_DEPTH = 4
+
+#The default size of each buffer decompressed ahead of the parser
+DEFAULT_READAHEAD_BUFFER_SIZE = 1024 * 1024
+
+#The default number of buffers waiting to be compressed behind the writer
+DEFAULT_WRITEBEHIND_QUEUE_DEPTH = 4
+
+#The default compression level of ParallelGzipFile (the same as gzip.open)
+DEFAULT_GZIP_LEVEL = 9
+
+#The default size of each chunk compressed in parallel (as in pigz)
+DEFAULT_PARALLEL_GZIP_CHUNK_SIZE = 128 * 1024
+
+#The size of the deflate window, and so of the dictionary primed from the previous chunk
+DEFLATE_WINDOW_SIZE = 32 * 1024
+
+#The default number of uncompressed bytes in each gzip member written, since readers can only start decompressing at
+#the start of a member (see Index.GzipCheckpointFile)
+DEFAULT_GZIP_MEMBER_SIZE = 16 * 1024 * 1024
+
+########## Codecs ##########
+
+#Maps file extensions to functions opening them (with the same signature as open)
+CODECS = {
+	'.gz': gzip.open,
+	'.bz2': bz2.open,
+	'.xz': lzma.open,
+}
+
+#Maps file extensions to the keyword argument of their open function setting the compression level
+CODEC_LEVEL_ARGUMENTS = {
+	'.gz': 'compresslevel',
+	'.bz2': 'compresslevel',
+	'.xz': 'preset',
+}
+
+def codecExtension(filename):
+	"""
+	Returns the extension of the compression codec of a file, based on its name.
+
+	:param filename: str
+	:return: str or None if the file is not compressed
+	"""
+	for extension in CODECS:
+		if filename.endswith(extension):
+			return extension
+	return None
+
+def isCompressed(filename):
+	"""
+	Returns a bool indicating if a file is compressed, based on its name.
+
+	:param filename: str
+	:return: bool
+	"""
+	return codecExtension(filename) is not None
+
+def openFile(filename, mode='rb', level=None, threads=0):
+	"""
+	Opens a file, transparently compressing or decompressing it based on its extension.
+
+	:param filename: str
+	:param mode: str
+	:param level: int The compression level when writing, or None for the codec's default
+	:param threads: int The number of threads compressing gzip files in parallel when writing (see ParallelGzipFile),
+		or 0 to compress on the calling thread
+	:return: file-like object (gzip files are written in members of DEFAULT_GZIP_MEMBER_SIZE bytes, so they can be seeked)
+	"""
+	extension = codecExtension(filename)
+	if extension is None:
+		return open(filename, mode)
+	elif 'r' in mode:
+		return CODECS[extension](filename, mode)
+	elif extension == '.gz' and threads > 0:
+		return ParallelGzipFile(open(filename, mode), level=level if level is not None else DEFAULT_GZIP_LEVEL, threads=threads)
+	elif extension == '.gz':
+		return MultiMemberGzipFile(open(filename, mode), level=level if level is not None else DEFAULT_GZIP_LEVEL)
+	elif level is not None:
+		return CODECS[extension](filename, mode, **{CODEC_LEVEL_ARGUMENTS[extension]: level})
+	return CODECS[extension](filename, mode)
+
+def isEmptyFile(filename):
+	"""
+	Returns whether a file is missing or empty, e.g. to decide whether output appended to it needs a PCAP header,
+	since compressed files opened for appending report a position of 0 even when they already have data.
+
+	:param filename: str
+	:return: bool
+	"""
+	return not os.path.exists(filename) or os.path.getsize(filename) == 0
+
+########## Readahead ##########
+
+class ReadaheadFile(io.RawIOBase):
+	"""
+	A read-only file-like object which reads (and therefore decompresses) another file on a background
+	thread, into a bounded queue of buffers. Since zlib, bz2, and lzma release the GIL, decompression
+	overlaps with parsing on the calling thread.
+
+	:param pcapFile: file-like object to read from
+	:param bufferSize: int The size of each buffer
+	:param queueDepth: int The maximum number of buffers read ahead
+	"""
+
+	def __init__(self, pcapFile, bufferSize=DEFAULT_READAHEAD_BUFFER_SIZE, queueDepth=DEFAULT_READAHEAD_QUEUE_DEPTH):
+		super().__init__()
+		if bufferSize < 1:
+			raise ValueError('bufferSize must be positive')
+		if queueDepth < 1:
+			raise ValueError('queueDepth must be positive')
+
+		self._pcapFile = pcapFile
+		self._bufferSize = bufferSize
+		self._queue = queue.Queue(queueDepth)
+		self._stopping = threading.Event()
+
+		self._buffer = b''
+		self._bufferStart = 0
+		self._eof = False
+
+		self._thread = threading.Thread(target=self._readAhead, name='ReadaheadFile', daemon=True)
+		self._thread.start()
+
+	def _put(self, item):
+		#Time out periodically so that closing is noticed even while the queue is full
+		while not self._stopping.is_set():
+			try:
+				self._queue.put(item, timeout=0.1)
+				return True
+			except queue.Full:
+				pass
+		return False
+
+	def _readAhead(self):
+		try:
+			while True:
+				data = self._pcapFile.read(self._bufferSize)
+				if not self._put(data) or len(data) == 0:
+					return
+		except Exception as e:
+			#Hand the error to the reader to raise
+			self._put(e)
+
+	def readable(self):
+		return True
+
+	def readinto(self, b):
+		view = memoryview(b).cast('B')
+		n = len(view)
+		filled = 0
+		while filled < n and not self._eof:
+			if self._bufferStart >= len(self._buffer):
+				item = self._queue.get()
+				if isinstance(item, Exception):
+					self._eof = True
+					raise item
+				elif len(item) == 0:
+					self._eof = True
+					break
+
+				self._buffer = item
+				self._bufferStart = 0
+
+			count = min(n - filled, len(self._buffer) - self._bufferStart)
+			view[filled:filled + count] = self._buffer[self._bufferStart:self._bufferStart + count]
+			self._bufferStart += count
+			filled += count
+
+		return filled
+
+	def close(self):
+		if not self.closed:
+			self._stopping.set()
+			self._thread.join()
+		super().close()
+
+########## Writebehind ##########
+
+class WritebehindFile(io.RawIOBase):
+	"""
+	A write-only file-like object which writes (and therefore compresses) to another file on a background
+	thread, from a bounded queue of buffers. Since zlib, bz2, and lzma release the GIL, compression overlaps
+	with parsing on the calling thread. Writes block while the queue is full.
+
+	Each write is copied (unless it is bytes), so callers such as Format.PcapWriter can refill their buffer
+	while the previous one is compressed. Errors on the background thread are raised by the next write or by
+	close() (once), which waits for the queued writes and then closes the other file.
+
+	:param pcapFile: file-like object to write to
+	:param queueDepth: int The maximum number of buffers waiting to be written
+	"""
+
+	def __init__(self, pcapFile, queueDepth=DEFAULT_WRITEBEHIND_QUEUE_DEPTH):
+		super().__init__()
+		if queueDepth < 1:
+			raise ValueError('queueDepth must be positive')
+
+		self._pcapFile = pcapFile
+		try:
+			self._position = pcapFile.tell()
+		except OSError:
+			#Unseekable streams (e.g. pipes) are written from the start
+			self._position = 0
+		self._queue = queue.Queue(queueDepth)
+		self._error = None
+		self._errorRaised = False
+
+		self._thread = threading.Thread(target=self._writeBehind, name='WritebehindFile', daemon=True)
+		self._thread.start()
+
+	def _writeBehind(self):
+		while True:
+			data = self._queue.get()
+			if data is None:
+				return
+
+			#Keep draining the queue after an error so that the writer never blocks
+			if self._error is None:
+				try:
+					self._pcapFile.write(data)
+				except Exception as e:
+					#Hand the error to the writer to raise
+					self._error = e
+
+	def _raiseError(self):
+		if self._error is not None:
+			self._errorRaised = True
+			raise self._error
+
+	def writable(self):
+		return True
+
+	def tell(self):
+		return self._position
+
+	def write(self, b):
+		if self.closed:
+			raise ValueError('write to closed file')
+		self._raiseError()
+		data = b if type(b) is bytes else bytes(b)
+		self._queue.put(data)
+		self._position += len(data)
+		return len(data)
+
+	def close(self):
+		if not self.closed:
+			self._queue.put(None)
+			self._thread.join()
+			try:
+				self._pcapFile.close()
+			finally:
+				super().close()
+			if not self._errorRaised:
+				self._raiseError()
+
+########## Multi-member gzip ##########
+
+class MultiMemberGzipFile(io.RawIOBase):
+	"""
+	A write-only file-like object which gzip compresses into another file as a series of gzip members, starting
+	a new one once the current one holds memberSize uncompressed bytes (between writes). Any gzip reader sees the
+	members as one stream, while Index.GzipCheckpointFile (and so the sidecar index) can start decompressing at
+	each of them, so seeking does not need to decompress from the beginning. Closing ends the last member, then
+	closes the other file.
+
+	:param output: file-like object to write to
+	:param level: int The compression level (0-9)
+	:param memberSize: int The number of uncompressed bytes after which to start a new member
+	"""
+
+	def __init__(self, output, level=DEFAULT_GZIP_LEVEL, memberSize=DEFAULT_GZIP_MEMBER_SIZE):
+		super().__init__()
+		if not 0 <= level <= 9:
+			raise ValueError('level must be between 0 and 9')
+		if memberSize < 1:
+			raise ValueError('memberSize must be positive')
+
+		self._output = output
+		self._level = level
+		self._memberSize = memberSize
+		self._memberOffset = 0
+		self._gzipFile = self._openMember()
+
+	def _openMember(self):
+		#The file name is left out of the header (like pigz -n), since it would be repeated in every member
+		return gzip.GzipFile(filename='', mode='wb', compresslevel=self._level, fileobj=self._output)
+
+	def writable(self):
+		return True
+
+	def tell(self):
+		#Like gzip.GzipFile, the position is that in the uncompressed data written
+		return self._memberOffset + (self._gzipFile.tell() if self._gzipFile is not None else 0)
+
+	def write(self, b):
+		if self.closed:
+			raise ValueError('write to closed file')
+
+		#Members are only opened once there is data for them, so there are no empty ones
+		if self._gzipFile is None:
+			self._gzipFile = self._openMember()
+		n = self._gzipFile.write(b)
+
+		if self._gzipFile.tell() >= self._memberSize:
+			self._memberOffset += self._gzipFile.tell()
+			self._gzipFile.close()
+			self._gzipFile = None
+
+		return n
+
+	def close(self):
+		if not self.closed:
+			try:
+				if self._gzipFile is not None:
+					self._gzipFile.close()
+					self._gzipFile = None
+			finally:
+				self._output.close()
+				super().close()
+
+########## Parallel gzip ##########
+
+#Thread pools shared by all ParallelGzipFiles with the same number of threads
+_executors = {}
+_executorsLock = threading.Lock()
+
+def _sharedExecutor(threads):
+	with _executorsLock:
+		executor = _executors.get(threads)
+		if executor is None:
+			executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads, thread_name_prefix='ParallelGzipFile')
+			_executors[threads] = executor
+		return executor
+
+def _deflateChunk(data, dictionary, level, last):
+	"""
+	Compresses a chunk into raw deflate blocks which can be concatenated with those of the neighbouring chunks,
+	since every chunk but the last ends with a sync flush (on a byte boundary, without a final block).
+	"""
+	if len(dictionary) > 0:
+		compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL, zlib.Z_DEFAULT_STRATEGY, dictionary)
+	else:
+		compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+	return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+class ParallelGzipFile(io.RawIOBase):
+	"""
+	A write-only file-like object which gzip compresses into another file using several threads, like pigz.
+	Data is split into chunks which are deflated independently on a thread pool (shared by all files using
+	the same number of threads), each primed with the last 32 KiB of the previous chunk as its dictionary so
+	that little compression is lost. The chunks form standard gzip members of about memberSize uncompressed
+	bytes each, which any gzip reader (including Parser.parseFile) reads as one stream, and where readers can
+	start decompressing when seeking (see MultiMemberGzipFile). Appending adds more members.
+
+	Since zlib releases the GIL, compression runs in parallel with the calling thread and itself. A bounded
+	number of chunks are in flight at once, so writes block when the threads fall behind. Closing writes the
+	rest of the data and the gzip trailer, then closes the other file.
+
+	:param output: file-like object to write to
+	:param level: int The compression level (0-9)
+	:param threads: int The number of compressing threads
+	:param chunkSize: int The number of bytes in each chunk
+	:param memberSize: int The number of uncompressed bytes after which to start a new member (at a chunk boundary)
+	"""
+
+	def __init__(self, output, level=DEFAULT_GZIP_LEVEL, threads=1, chunkSize=DEFAULT_PARALLEL_GZIP_CHUNK_SIZE,
+			memberSize=DEFAULT_GZIP_MEMBER_SIZE):
+		super().__init__()
+		if not 0 <= level <= 9:
+			raise ValueError('level must be between 0 and 9')
+		if threads < 1:
+			raise ValueError('threads must be positive')
+		if chunkSize < 1:
+			raise ValueError('chunkSize must be positive')
+		if memberSize < 1:
+			raise ValueError('memberSize must be positive')
+
+		self._output = output
+		self._level = level
+		self._chunkSize = chunkSize
+		self._memberSize = memberSize
+		self._executor = _sharedExecutor(threads)
+		self._maxPending = 2 * threads
+
+		self._buffer = bytearray()
+		self._dictionary = b''
+		self._pending = collections.deque()
+		self._crc = 0
+		self._size = 0
+		self._memberOffset = 0
+
+		self._writeHeader()
+
+	def _writeHeader(self):
+		#The gzip header (without a file name, like pigz -n)
+		extraFlags = 2 if self._level == 9 else 4 if self._level == 1 else 0
+		self._output.write(struct.pack('<BBBBIBB', 0x1f, 0x8b, 8, 0, int(time.time()), extraFlags, 255))
+
+	def writable(self):
+		return True
+
+	def tell(self):
+		#Like gzip.GzipFile, the position is that in the uncompressed data written
+		return self._memberOffset + self._size + len(self._buffer)
+
+	def write(self, b):
+		if self.closed:
+			raise ValueError('write to closed file')
+
+		with memoryview(b) as view:
+			view = view.cast('B')
+			n = len(view)
+			start = 0
+
+			#Complete the partial chunk, then submit whole chunks straight from the data
+			if len(self._buffer) > 0:
+				start = min(self._chunkSize - len(self._buffer), n)
+				self._buffer += view[:start]
+				if len(self._buffer) < self._chunkSize:
+					return n
+				self._submit(bytes(self._buffer), False)
+				self._buffer = bytearray()
+
+			while n - start >= self._chunkSize:
+				self._submit(bytes(view[start:start + self._chunkSize]), False)
+				start += self._chunkSize
+			self._buffer += view[start:]
+
+		return n
+
+	def _submit(self, chunk, last):
+		#The CRC is computed here, in order, since zlib cannot combine those of the chunks
+		self._crc = zlib.crc32(chunk, self._crc)
+		self._size += len(chunk)
+
+		#Full members end like the last one, waiting for their chunks so the trailer follows them
+		endMember = last or self._size >= self._memberSize
+		self._pending.append(self._executor.submit(_deflateChunk, chunk, self._dictionary, self._level, endMember))
+		self._dictionary = chunk[-DEFLATE_WINDOW_SIZE:]
+
+		while len(self._pending) > self._maxPending or (endMember and len(self._pending) > 0):
+			self._output.write(self._pending.popleft().result())
+
+		if endMember:
+			self._output.write(struct.pack('<II', self._crc, self._size & 0xffffffff))
+			self._memberOffset += self._size
+			self._crc = 0
+			self._size = 0
+			self._dictionary = b''
+			if not last:
+				self._writeHeader()
+
+	def close(self):
+		if not self.closed:
+			try:
+				self._submit(bytes(self._buffer), True)
+				self._buffer = bytearray()
+			finally:
+				for future in self._pending:
+					future.cancel()
+				self._output.close()
+				super().close()
@@ -0,0 +1,377 @@
+
+# Copyright (c) 2015-2023 Agalmic Ventures LLC (www.agalmicventures.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import array
+import struct
+
+from NanoPcap import Listener
+from NanoPcap.Protocols import Ethernet, IPv4, IPv6
+
+########## Constants ##########
+
+#Flows without packets for this long are evicted
+DEFAULT_IDLE_TIMEOUT_NANOS = 60 * 1000 * 1000 * 1000
+
+#The granularity of idle eviction
+DEFAULT_TICK_NANOS = 1000 * 1000 * 1000
+
+#IP protocols whose headers start with the source and destination ports (TCP, UDP, and SCTP)
+PORT_PROTOCOLS = frozenset([6, 17, 132])
+
+_PORT_STRUCT = struct.Struct('!H')
+_PORTS_STRUCT = struct.Struct('!HH')
+
+########## Keys ##########
+
+def flowKeyBytes(packet):
+	"""
+	Returns the 5-tuple of an IP packet (the IP protocol, and each endpoint's address and port) as bytes which are
+	the same for both directions. Packets without ports (e.g. ICMP or later fragments) use port 0.
+
+	The ports are read directly from the payload, so they are found even when the snaplen cuts off the rest of the
+	transport header.
+
+	:param packet: IPv4Packet or IPv6Packet
+	:return: bytes
+	"""
+	protocol = packet.protocol()
+	ports = b'\x00\x00\x00\x00'
+	if protocol in PORT_PROTOCOLS and packet.fragmentOffset() == 0:
+		payload = packet.payload()
+		if len(payload) >= _PORTS_STRUCT.size:
+			ports = bytes(payload[0:_PORTS_STRUCT.size])
+
+	source = bytes(packet.sourceIp()) + ports[0:2]
+	destination = bytes(packet.destinationIp()) + ports[2:4]
+	protocolBytes = bytes([protocol])
+	return protocolBytes + source + destination if source <= destination else protocolBytes + destination + source
+
+def flowKeyToString(keyBytes, separator='_'):
+	"""
+	Converts the result of flowKeyBytes into a string, e.g. TCP_10.0.0.1:22_10.0.0.2:50000.
+
+	:param keyBytes: bytes
+	:param separator: str
+	:return: str
+	"""
+	ipProtocol = IPv4.IP_PROTOCOL_ID_TO_IP_PROTOCOL.get(keyBytes[0])
+	protocol = ipProtocol.protocol() if ipProtocol is not None else '%d' % keyBytes[0]
+
+	endpointLength = (len(keyBytes) - 1) // 2
+	endpoints = [protocol]
+	for start in (1, 1 + endpointLength):
+		address = keyBytes[start:start + endpointLength - 2]
+		port = _PORT_STRUCT.unpack_from(keyBytes, start + endpointLength - 2)[0]
+		if len(address) == 4:
+			endpoints.append('%s:%d' % (IPv4.ipAddressToString(address), port))
+		else:
+			endpoints.append('[%s]:%d' % (IPv6.ipv6AddressToString(address), port))
+
+	return separator.join(endpoints)
+
+########## Flows ##########
+
+class Flow(object):
+	"""
+	Represents the counters of a flow, as emitted when it is evicted from a FlowTable.
+	"""
+
+	__slots__ = ('_key', '_packets', '_bytes', '_firstNanos', '_lastNanos')
+
+	def __init__(self, key, packets, bytes, firstNanos, lastNanos):
+		self._key = key
+		self._packets = packets
+		self._bytes = bytes
+		self._firstNanos = firstNanos
+		self._lastNanos = lastNanos
+
+	def __repr__(self):
+		return 'Flow(%r, %d, %d, %d, %d)' % (self._key, self._packets, self._bytes, self._firstNanos, self._lastNanos)
+
+	def key(self):
+		"""
+		Returns the key of the flow (e.g. from flowKeyBytes).
+
+		:return: hashable
+		"""
+		return self._key
+
+	def packets(self):
+		"""
+		Returns the number of packets in the flow.
+
+		:return: int
+		"""
+		return self._packets
+
+	def bytes(self):
+		"""
+		Returns the number of bytes (of original lengths) in the flow.
+
+		:return: int
+		"""
+		return self._bytes
+
+	def firstNanos(self):
+		"""
+		Returns the epoch nanoseconds of the first packet in the flow.
+
+		:return: int
+		"""
+		return self._firstNanos
+
+	def lastNanos(self):
+		"""
+		Returns the epoch nanoseconds of the last packet in the flow.
+
+		:return: int
+		"""
+		return self._lastNanos
+
+	def durationNanos(self):
+		"""
+		Returns the nanoseconds between the first and last packets in the flow.
+
+		:return: int
+		"""
+		return self._lastNanos - self._firstNanos
+
+class FlowTable(object):
+	"""
+	Tracks the counters of flows by key, evicting flows which have been idle for a timeout (in packet time) so that
+	memory is bounded by the number of concurrently active flows rather than all flows.
+
+	Counters are kept in arrays indexed by slot, with slots of evicted flows reused. Idle flows are found with a
+	timer wheel of one bucket per tick: each flow is in the bucket of the tick it would expire at if it saw no more
+	packets, and is only moved (to its new expiry) when that bucket is reached, so packets never touch the wheel.
+	"""
+
+	__slots__ = ('_onFlowEvicted', '_idleTimeoutNanos', '_tickNanos', '_slots', '_keys', '_freeSlots',
+		'_packets', '_bytes', '_firstNanos', '_lastNanos', '_wheel', '_tick')
+
+	def __init__(self, onFlowEvicted, idleTimeoutNanos=DEFAULT_IDLE_TIMEOUT_NANOS, tickNanos=DEFAULT_TICK_NANOS):
+		"""
+		:param onFlowEvicted: function taking a Flow, called as each flow is evicted
+		:param idleTimeoutNanos: int nanoseconds without packets after which a flow is evicted
+		:param tickNanos: int granularity of eviction (flows are evicted within a tick after their timeout)
+		"""
+		if idleTimeoutNanos <= 0:
+			raise ValueError('idleTimeoutNanos must be positive')
+		if tickNanos <= 0:
+			raise ValueError('tickNanos must be positive')
+
+		self._onFlowEvicted = onFlowEvicted
+		self._idleTimeoutNanos = idleTimeoutNanos
+		self._tickNanos = tickNanos
+
+		#Slots by key, and keys by slot (None for free slots)
+		self._slots = {}
+		self._keys = []
+		self._freeSlots = []
+
+		#Counters by slot
+		self._packets = array.array('Q')
+		self._bytes = array.array('Q')
+		self._firstNanos = array.array('q')
+		self._lastNanos = array.array('q')
+
+		#Expiry ticks always fall within one revolution of the current tick
+		wheelSize = -(-idleTimeoutNanos // tickNanos) + 2
+		self._wheel = [[] for _ in range(wheelSize)]
+		self._tick = None
+
+	def __len__(self):
+		return len(self._slots)
+
+	def __contains__(self, key):
+		return key in self._slots
+
+	def idleTimeoutNanos(self):
+		"""
+		Returns the nanoseconds without packets after which a flow is evicted.
+
+		:return: int
+		"""
+		return self._idleTimeoutNanos
+
+	def _expiryTick(self, slot):
+		#Round up so flows are never evicted before their timeout
+		return -(-(self._lastNanos[slot] + self._idleTimeoutNanos) // self._tickNanos)
+
+	def _flow(self, slot):
+		return Flow(self._keys[slot], self._packets[slot], self._bytes[slot], self._firstNanos[slot], self._lastNanos[slot])
+
+	def _evict(self, slot):
+		flow = self._flow(slot)
+		del self._slots[flow.key()]
+		self._keys[slot] = None
+		self._freeSlots.append(slot)
+		self._onFlowEvicted(flow)
+
+	def advance(self, epochNanos):
+		"""
+		Advances the time of the table, evicting flows which have been idle for the timeout. Time never goes
+		backwards, so earlier times are ignored.
+
+		:param epochNanos: int
+		"""
+		tick = epochNanos // self._tickNanos
+		if self._tick is None:
+			self._tick = tick
+			return
+		elif tick <= self._tick:
+			return
+
+		#Visit each bucket at most once, even after long gaps
+		wheel = self._wheel
+		wheelSize = len(wheel)
+		for currentTick in range(max(self._tick + 1, tick - wheelSize + 1), tick + 1):
+			index = currentTick % wheelSize
+			bucket = wheel[index]
+			if len(bucket) == 0:
+				continue
+
+			wheel[index] = []
+			for slot in bucket:
+				expiryTick = self._expiryTick(slot)
+				if expiryTick <= currentTick:
+					self._evict(slot)
+				else:
+					wheel[expiryTick % wheelSize].append(slot)
+
+		self._tick = tick
+
+	def sample(self, key, epochNanos, length):
+		"""
+		Counts a packet of a flow, adding the flow if it is new.
+
+		:param key: hashable (e.g. from flowKeyBytes)
+		:param epochNanos: int
+		:param length: int bytes
+		"""
+		self.advance(epochNanos)
+
+		slot = self._slots.get(key)
+		if slot is not None:
+			self._packets[slot] += 1
+			self._bytes[slot] += length
+			if epochNanos > self._lastNanos[slot]:
+				self._lastNanos[slot] = epochNanos
+			return
+
+		if len(self._freeSlots) > 0:
+			slot = self._freeSlots.pop()
+			self._keys[slot] = key
+			self._packets[slot] = 1
+			self._bytes[slot] = length
+			self._firstNanos[slot] = epochNanos
+			self._lastNanos[slot] = epochNanos
+		else:
+			slot = len(self._keys)
+			self._keys.append(key)
+			self._packets.append(1)
+			self._bytes.append(length)
+			self._firstNanos.append(epochNanos)
+			self._lastNanos.append(epochNanos)
+
+		self._slots[key] = slot
+		self._wheel[self._expiryTick(slot) % len(self._wheel)].append(slot)
+
+	def flow(self, key):
+		"""
+		Returns the counters of an active flow.
+
+		:param key: hashable
+		:return: Flow or None
+		"""
+		slot = self._slots.get(key)
+		return self._flow(slot) if slot is not None else None
+
+	def flows(self):
+		"""
+		Returns the counters of every active flow.
+
+		:return: list of Flow
+		"""
+		return [self._flow(slot) for slot in self._slots.values()]
+
+	def evictAll(self):
+		"""
+		Evicts every active flow (e.g. at the end of a capture), in order of their last packets.
+		"""
+		slots = sorted(self._slots.values(), key=lambda slot: self._lastNanos[slot])
+		for slot in slots:
+			self._evict(slot)
+
+		for bucket in self._wheel:
+			del bucket[:]
+
+########## Listener ##########
+
+class PcapFlowTableListener(Listener.PcapListener):
+	"""
+	Adds the IP packets of a PCAP (Ethernet, IPv4, or IPv6) to a FlowTable by their 5-tuples, and evicts the
+	remaining flows when closed.
+	"""
+
+	def __init__(self, flowTable):
+		self._flowTable = flowTable
+		self._packetType = None
+		self._skipped = 0
+
+	def flowTable(self):
+		"""
+		Returns the flow table.
+
+		:return: FlowTable
+		"""
+		return self._flowTable
+
+	def skipped(self):
+		"""
+		Returns the number of records which were not IP packets.
+
+		:return: int
+		"""
+		return self._skipped
+
+	def onPcapHeader(self, header):
+		for packetType in [Ethernet.EthernetPacket, IPv4.IPv4Packet, IPv6.IPv6Packet]:
+			if header.network() == packetType.LINKTYPE:
+				self._packetType = packetType
+				return
+
+		raise ValueError('Unsupported link type %d' % header.network())
+
+	def onPcapRecord(self, recordHeader, data):
+		packet = self._packetType(data)
+		if self._packetType is Ethernet.EthernetPacket:
+			packet = packet.payloadPacket()
+
+		#The network layer must be complete to find the ports
+		if packet is None or len(data) < packet.HEADER_LENGTH:
+			self._skipped += 1
+			return
+
+		self._flowTable.sample(flowKeyBytes(packet), recordHeader.epochNanos(), recordHeader.originalLength())
+
+	def close(self):
+		self._flowTable.evictAll()
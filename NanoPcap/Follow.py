@@ -0,0 +1,113 @@
+
+# Copyright (c) 2015-2023 Agalmic Ventures LLC (www.agalmicventures.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import io
+import time
+
+#The default initial interval between polls for more data, in seconds
+DEFAULT_POLL_INTERVAL = 0.1
+
+#The default maximum interval between polls, in seconds
+DEFAULT_MAX_POLL_INTERVAL = 2.0
+
+#The default factor the poll interval grows by while no data arrives
+DEFAULT_POLL_BACKOFF = 2.0
+
+class FollowFile(io.RawIOBase):
+	"""
+	A read-only file-like object which follows a file that is still being written (like tail -f): reads
+	at EOF wait for more data rather than returning short. Polls start at pollInterval and back off by a
+	factor of backoff up to maxPollInterval while the file is idle, resetting when data arrives.
+
+	readinto() returns as soon as any data is available, while read(n) waits for all n bytes, so parsers
+	resume exactly where they left off -- including in the middle of a partially written record.
+
+	:param pcapFile: file-like object to follow (regular files return new data after EOF)
+	:param pollInterval: float The initial interval between polls, in seconds
+	:param maxPollInterval: float The maximum interval between polls, in seconds
+	:param backoff: float The factor the interval grows by after each empty poll
+	:param idleTimeout: float The number of seconds without data after which EOF is real (None waits forever)
+	:param onPoll: callable Called (without arguments) before each wait, e.g. to flush output (optional)
+	"""
+
+	def __init__(self, pcapFile, pollInterval=DEFAULT_POLL_INTERVAL, maxPollInterval=DEFAULT_MAX_POLL_INTERVAL,
+			backoff=DEFAULT_POLL_BACKOFF, idleTimeout=None, onPoll=None):
+		super().__init__()
+		if pollInterval <= 0:
+			raise ValueError('pollInterval must be positive')
+		if maxPollInterval < pollInterval:
+			raise ValueError('maxPollInterval must be at least pollInterval')
+		if backoff < 1:
+			raise ValueError('backoff must be at least 1')
+
+		self._pcapFile = pcapFile
+		self._pollInterval = pollInterval
+		self._maxPollInterval = maxPollInterval
+		self._backoff = backoff
+		self._idleTimeout = idleTimeout
+		self._onPoll = onPoll
+
+	def readable(self):
+		return True
+
+	def seekable(self):
+		return self._pcapFile.seekable()
+
+	def seek(self, offset, whence=io.SEEK_SET):
+		return self._pcapFile.seek(offset, whence)
+
+	def tell(self):
+		return self._pcapFile.tell()
+
+	def readinto(self, b):
+		view = memoryview(b).cast('B')
+		if len(view) == 0:
+			return 0
+
+		interval = self._pollInterval
+		idleSince = time.monotonic()
+		readinto = getattr(self._pcapFile, 'readinto1', None) or self._pcapFile.readinto
+		while True:
+			count = readinto(view)
+			if count:
+				return count
+			elif self._idleTimeout is not None and time.monotonic() - idleSince >= self._idleTimeout:
+				return 0 #Idle for long enough that this is really EOF
+
+			if self._onPoll is not None:
+				self._onPoll()
+			time.sleep(interval)
+			interval = min(interval * self._backoff, self._maxPollInterval)
+
+	def read(self, n=-1):
+		if n is None or n < 0:
+			return self.readall()
+
+		#Unlike readinto, wait for everything requested
+		data = bytearray(n)
+		view = memoryview(data)
+		filled = 0
+		while filled < n:
+			count = self.readinto(view[filled:])
+			if not count:
+				break #EOF
+			filled += count
+		return bytes(view[:filled])
@@ -23,9 +23,13 @@
 
 #TODO: support inverted byte order
 
+import array
 import datetime
+import io
+import os
 import struct
 import sys
+import time
 
 ########## Constants ##########
 
@@ -41,6 +45,23 @@ MICROS_PER_SECOND = 1000 * 1000
 NANOS_PER_SECOND = MICROS_PER_SECOND * 1000
 
 PCAP_DEFAULT_TIME_RESOLUTION = NANOS_PER_SECOND
+PCAP_DEFAULT_FRAC_NANOS = NANOS_PER_SECOND // PCAP_DEFAULT_TIME_RESOLUTION
+
+#All columns of a PcapRecordBatch use unsigned 64-bit integers
+BATCH_ARRAY_TYPECODE = 'Q'
+
+#Defaults for PcapWriter
+DEFAULT_WRITER_BUFFER_SIZE = 1024 * 1024
+DEFAULT_WRITER_FLUSH_INTERVAL = 1.0
+
+#The most buffers a single os.writev call may be given (IOV_MAX on Linux)
+WRITEV_MAX_SEGMENTS = 1024
+
+#Record data at least this long is passed to os.writev by reference, since below it copying is cheaper
+WRITEV_MIN_DATA_LENGTH = 8 * 1024
+
+#Allocates an object without calling its constructor (see PcapRecordHeader.unchecked)
+_newObject = object.__new__
 
 ########## Structs ##########
 
@@ -56,6 +77,23 @@ PCAP_RECORD_HEADER_STRUCT_PATTERN = 'IIII'
 PCAP_RECORD_HEADER_STRUCT = struct.Struct(PCAP_RECORD_HEADER_STRUCT_PATTERN)
 PCAP_RECORD_HEADER_STRUCT_INVERTED = struct.Struct(_structInvert + PCAP_RECORD_HEADER_STRUCT_PATTERN)
 
+_RECORD_HEADER_SIZE = PCAP_RECORD_HEADER_STRUCT.size
+_packRecordHeaderInto = PCAP_RECORD_HEADER_STRUCT.pack_into
+
+########## Functions ##########
+
+def epochNanosArray(tsSecs, tsFracs, fracNanos):
+	"""
+	Computes the timestamps of many records at once as nanoseconds since epoch, as for
+	PcapRecordHeader.epochNanos().
+
+	:param tsSecs: iterable of int The timestamp seconds.
+	:param tsFracs: iterable of int The timestamp fractions.
+	:param fracNanos: int The nanoseconds per unit of fraction (see PcapHeader.fracNanos).
+	:return: array of int
+	"""
+	return array.array(BATCH_ARRAY_TYPECODE, [tsSec * NANOS_PER_SECOND + tsFrac * fracNanos for tsSec, tsFrac in zip(tsSecs, tsFracs)])
+
 ########## Types ##########
 
 class PcapHeader(object):
@@ -71,7 +109,7 @@ class PcapHeader(object):
 	:param network: int The network type ID.
 	"""
 
-	__slots__ = ['_magicNumber', '_timeResolution', '_versionMajor', '_versionMinor', '_tzOffset', '_sigfigs', '_snaplen', '_network']
+	__slots__ = ['_magicNumber', '_timeResolution', '_fracNanos', '_versionMajor', '_versionMinor', '_tzOffset', '_sigfigs', '_snaplen', '_network']
 
 	def __init__(self, magicNumber, versionMajor, versionMinor, tzOffset, sigfigs, snaplen, network):
 		if magicNumber < 0:
@@ -89,6 +127,7 @@ class PcapHeader(object):
 
 		self._magicNumber = magicNumber
 		self._timeResolution = 1000 * 1000 * 1000 if magicNumber == PCAP_NS_MAGIC_NUMBER else 1000 * 1000
+		self._fracNanos = NANOS_PER_SECOND // self._timeResolution
 		self._versionMajor = versionMajor
 		self._versionMinor = versionMinor
 		self._tzOffset = tzOffset
@@ -96,6 +135,15 @@ class PcapHeader(object):
 		self._snaplen = snaplen
 		self._network = network
 
+	def copy(self):
+		"""
+		Returns a copy of this header, which can be edited independently.
+
+		:return: PcapHeader
+		"""
+		return PcapHeader(self._magicNumber, self._versionMajor, self._versionMinor, self._tzOffset,
+			self._sigfigs, self._snaplen, self._network)
+
 	def magicNumber(self):
 		"""
 		Returns the magic number.
@@ -122,6 +170,15 @@ class PcapHeader(object):
 		"""
 		return self._timeResolution
 
+	def fracNanos(self):
+		"""
+		Returns the number of nanoseconds per unit of ts_frac (1000 for microsecond resolution, 1 for
+		nanosecond resolution), precomputed so converting timestamps needs no division.
+
+		:return: int
+		"""
+		return self._fracNanos
+
 	def versionMajor(self):
 		"""
 		Returns the major version number.
@@ -224,7 +281,7 @@ class PcapRecordHeader(object):
 	:param strict: bool Flag indicating whether to validate strictly (default False).
 	"""
 
-	__slots__ = ['_fileHeader', '_tsSec', '_tsFrac', '_includedLength', '_originalLength']
+	__slots__ = ['_fileHeader', '_fracNanos', '_tsSec', '_tsFrac', '_includedLength', '_originalLength']
 
 	def __init__(self, tsSec, tsFrac, includedLength, originalLength, fileHeader=None, strict=False):
 		#Basic validation for types
@@ -249,11 +306,44 @@ class PcapRecordHeader(object):
 				raise ValueError('file snaplen < included_length (%d < %d)' % (fileHeader.snaplen(), includedLength))
 
 		self._fileHeader = fileHeader
+		self._fracNanos = fileHeader._fracNanos if fileHeader is not None else PCAP_DEFAULT_FRAC_NANOS
 		self._tsSec = tsSec
 		self._tsFrac = tsFrac
 		self._includedLength = includedLength
 		self._originalLength = originalLength
 
+	@staticmethod
+	def unchecked(tsSec, tsFrac, includedLength, originalLength, fileHeader=None):
+		"""
+		Constructs a record header without any validation, for values which are already known to be valid
+		(e.g. from a trusted file, or from a batch which was validated as a whole). This is roughly twice
+		as fast as the constructor.
+
+		:param tsSec: int The timestamp seconds.
+		:param tsFrac: int The timestamp fraction.
+		:param includedLength: int The included length.
+		:param originalLength: int The original length.
+		:param fileHeader: PcapHeader The file's header (optional).
+		:return: PcapRecordHeader
+		"""
+		recordHeader = _newObject(PcapRecordHeader)
+		recordHeader._fileHeader = fileHeader
+		recordHeader._fracNanos = fileHeader._fracNanos if fileHeader is not None else PCAP_DEFAULT_FRAC_NANOS
+		recordHeader._tsSec = tsSec
+		recordHeader._tsFrac = tsFrac
+		recordHeader._includedLength = includedLength
+		recordHeader._originalLength = originalLength
+		return recordHeader
+
+	def copy(self):
+		"""
+		Returns a copy of this record header (sharing the file header), which can be edited independently.
+
+		:return: PcapRecordHeader
+		"""
+		return PcapRecordHeader.unchecked(self._tsSec, self._tsFrac, self._includedLength, self._originalLength,
+			fileHeader=self._fileHeader)
+
 	def fileHeader(self):
 		"""
 		Returns the file header that this record came from (used for time resolution).
@@ -272,6 +362,15 @@ class PcapRecordHeader(object):
 		"""
 		return self._fileHeader.timeResolution() if self._fileHeader is not None else PCAP_DEFAULT_TIME_RESOLUTION
 
+	def fracNanos(self):
+		"""
+		Returns the number of nanoseconds per unit of the timestamp fraction, taken from the file header
+		when the record is constructed (see PcapHeader.fracNanos).
+
+		:return: int
+		"""
+		return self._fracNanos
+
 	def tsSec(self):
 		"""
 		Returns the seconds portion of the timestamp.
@@ -303,7 +402,7 @@ class PcapRecordHeader(object):
 
 		:return: int
 		"""
-		return self._tsSec * NANOS_PER_SECOND + self._tsFrac * int(NANOS_PER_SECOND / self.timeResolution())
+		return self._tsSec * NANOS_PER_SECOND + self._tsFrac * self._fracNanos
 
 	def epochSecondsFloat(self):
 		"""
@@ -379,3 +478,412 @@ class PcapRecordHeader(object):
 		:param output: file like object
 		"""
 		output.write(self.asBytes())
+
+class PcapFlyweightRecordHeader(PcapRecordHeader):
+	"""
+	A PcapRecordHeader which flyweight parsers reuse for every record, refilling its fields in place
+	rather than allocating a new header per record.
+
+	WARNING: the fields change as parsing proceeds, so listeners which keep record headers beyond the
+	callback must keep a copy() instead (as PcapRecordingListener does). Copies are plain PcapRecordHeaders.
+	"""
+
+	__slots__ = []
+
+	def refill(self, tsSec, tsFrac, includedLength, originalLength, strict=False):
+		"""
+		Overwrites the fields with those of the next record, validating them exactly like the constructor.
+
+		:param tsSec: int The timestamp seconds.
+		:param tsFrac: int The timestamp fraction.
+		:param includedLength: int The included length.
+		:param originalLength: int The original length.
+		:param strict: bool Flag indicating whether to validate strictly (default False).
+		"""
+		PcapRecordHeader.__init__(self, tsSec, tsFrac, includedLength, originalLength, fileHeader=self._fileHeader, strict=strict)
+
+	def refillUnchecked(self, tsSec, tsFrac, includedLength, originalLength):
+		"""
+		Overwrites the fields with those of the next record, without any validation (see PcapRecordHeader.unchecked).
+
+		:param tsSec: int The timestamp seconds.
+		:param tsFrac: int The timestamp fraction.
+		:param includedLength: int The included length.
+		:param originalLength: int The original length.
+		"""
+		self._tsSec = tsSec
+		self._tsFrac = tsFrac
+		self._includedLength = includedLength
+		self._originalLength = originalLength
+
+class PcapRecordBatch(object):
+	"""
+	Represents a batch of PCAP records as a struct of arrays, which allows statistics to be computed
+	without constructing a PcapRecordHeader per record. All arrays have one entry per record. The data
+	of record i is data()[dataOffsets()[i]:dataOffsets()[i] + includedLengths()[i]].
+
+	:param fileHeader: PcapHeader The file's header.
+	:param tsSecs: array of int The timestamp seconds.
+	:param tsFracs: array of int The timestamp fractions.
+	:param epochNanos: array of int The timestamps as nanoseconds since epoch.
+	:param includedLengths: array of int The included lengths.
+	:param originalLengths: array of int The original lengths.
+	:param fileOffsets: array of int The offset of each record header in the file.
+	:param data: bytes-like object The buffer holding all the records' data.
+	:param dataOffsets: array of int The offset of each record's data in the data buffer.
+	"""
+
+	__slots__ = ['_fileHeader', '_tsSecs', '_tsFracs', '_epochNanos', '_includedLengths', '_originalLengths',
+		'_fileOffsets', '_data', '_dataOffsets']
+
+	def __init__(self, fileHeader, tsSecs, tsFracs, epochNanos, includedLengths, originalLengths, fileOffsets, data, dataOffsets):
+		self._fileHeader = fileHeader
+		self._tsSecs = tsSecs
+		self._tsFracs = tsFracs
+		self._epochNanos = epochNanos
+		self._includedLengths = includedLengths
+		self._originalLengths = originalLengths
+		self._fileOffsets = fileOffsets
+		self._data = data
+		self._dataOffsets = dataOffsets
+
+	def __len__(self):
+		return len(self._tsSecs)
+
+	def validate(self, strict=False):
+		"""
+		Validates the whole batch at once, with the same rules as PcapRecordHeader.
+
+		:param strict: bool Flag indicating whether to validate strictly (default False).
+		"""
+		if len(self._tsSecs) == 0:
+			return
+
+		#Lengths and timestamps are unsigned, so only the upper bounds need checking
+		timeResolution = self._fileHeader.timeResolution() if self._fileHeader is not None else PCAP_DEFAULT_TIME_RESOLUTION
+		maxTsFrac = max(self._tsFracs)
+		if maxTsFrac >= timeResolution:
+			raise ValueError('tsFrac is too large (%s)' % maxTsFrac)
+
+		if strict:
+			for includedLength, originalLength in zip(self._includedLengths, self._originalLengths):
+				if originalLength < includedLength:
+					raise ValueError('original_length < included_length (%d < %d)' % (originalLength, includedLength))
+
+			maxIncludedLength = max(self._includedLengths)
+			if self._fileHeader is not None and self._fileHeader.snaplen() < maxIncludedLength:
+				raise ValueError('file snaplen < included_length (%d < %d)' % (self._fileHeader.snaplen(), maxIncludedLength))
+
+	def fileHeader(self):
+		"""
+		Returns the file header that these records came from.
+
+		:return: PcapHeader
+		"""
+		return self._fileHeader
+
+	def tsSecs(self):
+		"""
+		Returns the seconds portions of the timestamps.
+
+		:return: array of int
+		"""
+		return self._tsSecs
+
+	def tsFracs(self):
+		"""
+		Returns the fraction portions of the timestamps.
+
+		:return: array of int
+		"""
+		return self._tsFracs
+
+	def epochNanos(self):
+		"""
+		Returns the timestamps as nanoseconds since epoch.
+
+		:return: array of int
+		"""
+		return self._epochNanos
+
+	def includedLengths(self):
+		"""
+		Returns the number of bytes included in the file for each packet.
+
+		:return: array of int
+		"""
+		return self._includedLengths
+
+	def originalLengths(self):
+		"""
+		Returns the original number of bytes in each packet.
+
+		:return: array of int
+		"""
+		return self._originalLengths
+
+	def fileOffsets(self):
+		"""
+		Returns the offset of each record header in the file.
+
+		:return: array of int
+		"""
+		return self._fileOffsets
+
+	def data(self):
+		"""
+		Returns the buffer holding the data of all the records.
+
+		:return: bytes-like object
+		"""
+		return self._data
+
+	def dataOffsets(self):
+		"""
+		Returns the offset of each record's data in the data buffer.
+
+		:return: array of int
+		"""
+		return self._dataOffsets
+
+	def recordData(self, i):
+		"""
+		Returns the data of the i-th record without copying it.
+
+		:param i: int
+		:return: memoryview
+		"""
+		start = self._dataOffsets[i]
+		return memoryview(self._data)[start:start + self._includedLengths[i]]
+
+	def recordHeader(self, i):
+		"""
+		Constructs a record header for the i-th record. Since the parsers validate batches as a whole
+		(see validate()), the header is constructed without validating it again.
+
+		:param i: int
+		:return: PcapRecordHeader
+		"""
+		return PcapRecordHeader.unchecked(self._tsSecs[i], self._tsFracs[i], self._includedLengths[i], self._originalLengths[i],
+			fileHeader=self._fileHeader)
+
+	def records(self):
+		"""
+		Iterates the records in the batch like PcapParser.parse() would.
+
+		:return: iterable of (PcapRecordHeader, memoryview)
+		"""
+		for i in range(len(self._tsSecs)):
+			yield (self.recordHeader(i), self.recordData(i))
+
+	def asNumpy(self):
+		"""
+		Returns the arrays of the batch as NumPy arrays without copying them (requires NumPy).
+
+		:return: dict of str to numpy.ndarray
+		"""
+		import numpy
+
+		return {
+			'tsSec': numpy.frombuffer(self._tsSecs, dtype=numpy.uint64),
+			'tsFrac': numpy.frombuffer(self._tsFracs, dtype=numpy.uint64),
+			'epochNanos': numpy.frombuffer(self._epochNanos, dtype=numpy.uint64),
+			'includedLength': numpy.frombuffer(self._includedLengths, dtype=numpy.uint64),
+			'originalLength': numpy.frombuffer(self._originalLengths, dtype=numpy.uint64),
+			'fileOffset': numpy.frombuffer(self._fileOffsets, dtype=numpy.uint64),
+			'data': numpy.frombuffer(self._data, dtype=numpy.uint8),
+			'dataOffset': numpy.frombuffer(self._dataOffsets, dtype=numpy.uint64),
+		}
+
+########## Writing ##########
+
+class PcapWriter(object):
+	"""
+	Writes a PCAP file header and records to an output stream, batching them into large writes. Record headers
+	are packed in place into a reusable buffer (along with the record data) rather than into new bytes objects,
+	so each flush is a single write, which matters most for compressed streams. For plain files, record data of
+	at least WRITEV_MIN_DATA_LENGTH bytes is passed to os.writev (where available) by reference instead of being
+	copied into the buffer.
+
+	The buffer is flushed when it is full, when a record is written flushInterval seconds or more after the last
+	flush, and by flush() and close(). Nothing is written between calls, so callers which may stop writing for a
+	while should flush() themselves.
+
+	:param output: file like object The stream to write to, which is closed by close().
+	:param bufferSize: int The number of bytes to buffer before writing.
+	:param flushInterval: float The most seconds between flushes while writing, or None for no limit.
+	:param writev: bool Flag indicating whether to use os.writev for plain files (default True).
+	"""
+
+	__slots__ = ['_output', '_flushInterval', '_fileno', '_buffer', '_capacity', '_length', '_segments',
+		'_segmentStart', '_segmentBytes', '_lastFlush']
+
+	def __init__(self, output, bufferSize=DEFAULT_WRITER_BUFFER_SIZE, flushInterval=DEFAULT_WRITER_FLUSH_INTERVAL, writev=True):
+		if bufferSize < PCAP_RECORD_HEADER_STRUCT.size:
+			raise ValueError('bufferSize must be at least %d' % PCAP_RECORD_HEADER_STRUCT.size)
+
+		self._output = output
+		self._flushInterval = flushInterval
+
+		#Writing around the file object is only safe for unwrapped files
+		self._fileno = None
+		if writev and hasattr(os, 'writev') and type(output) in (io.BufferedWriter, io.FileIO):
+			output.flush()
+			self._fileno = output.fileno()
+
+		self._buffer = bytearray(bufferSize)
+		self._capacity = bufferSize
+		self._length = 0
+
+		#Pending writev segments: alternating views of the buffer and large record data (see _writeDirect)
+		self._segments = []
+		self._segmentStart = 0
+		self._segmentBytes = 0
+
+		self._lastFlush = time.monotonic()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, excType, excValue, traceback):
+		self.close()
+
+	def output(self):
+		"""
+		Returns the stream being written to. Anything written to it directly must be preceded by a flush().
+
+		:return: file like object
+		"""
+		return self._output
+
+	def tell(self):
+		"""
+		Returns the position in the output, including buffered bytes.
+
+		:return: int
+		"""
+		return self._output.tell() + self._length + self._segmentBytes
+
+	def write(self, data):
+		"""
+		Writes raw bytes (in order with the records).
+
+		:param data: bytes-like object
+		"""
+		length = self._length
+		end = length + len(data)
+		if end > self._capacity:
+			self.flush()
+			if len(data) > self._capacity:
+				if self._fileno is not None:
+					#Bypass the file object like the records do, since anything it buffered would be written out of order
+					self._segments.append(data if type(data) is bytes else bytes(data))
+					self._segmentBytes += len(data)
+					self.flush()
+				else:
+					self._output.write(data)
+				return
+			length = 0
+			end = len(data)
+
+		self._buffer[length:end] = data
+		self._length = end
+
+	def writeHeader(self, header):
+		"""
+		Writes a PCAP file header.
+
+		:param header: PcapHeader
+		"""
+		self.write(header.asBytes())
+
+	def writeRecord(self, recordHeader, data):
+		"""
+		Writes a record. The record header is written as is, so its included length should match the data.
+
+		:param recordHeader: PcapRecordHeader
+		:param data: bytes-like object
+		"""
+		length = self._length
+		start = length + _RECORD_HEADER_SIZE
+		end = start + len(data)
+		if end > self._capacity or (self._fileno is not None and len(data) >= WRITEV_MIN_DATA_LENGTH):
+			self._writeDirect(recordHeader, data)
+			return
+
+		buffer = self._buffer
+		_packRecordHeaderInto(buffer, length, recordHeader._tsSec, recordHeader._tsFrac,
+			recordHeader._includedLength, recordHeader._originalLength)
+		buffer[start:end] = data
+		self._length = end
+
+		if self._flushInterval is not None and time.monotonic() - self._lastFlush >= self._flushInterval:
+			self.flush()
+
+	def _writeDirect(self, recordHeader, data):
+		"""
+		Writes a record which does not fit in the buffer, or whose data is long enough to be passed to os.writev.
+		"""
+		if self._length + _RECORD_HEADER_SIZE > self._capacity:
+			self.flush()
+
+		length = self._length
+		_packRecordHeaderInto(self._buffer, length, recordHeader._tsSec, recordHeader._tsFrac,
+			recordHeader._includedLength, recordHeader._originalLength)
+		self._length = length + _RECORD_HEADER_SIZE
+
+		if self._fileno is not None:
+			#Reference the buffer up to here, then the data (only immutable bytes may be kept until the flush)
+			self._segments.append(memoryview(self._buffer)[self._segmentStart:self._length])
+			self._segments.append(data if type(data) is bytes else bytes(data))
+			self._segmentStart = self._length
+			self._segmentBytes += len(data)
+			if self._segmentBytes >= self._capacity or len(self._segments) >= WRITEV_MAX_SEGMENTS:
+				self.flush()
+		else:
+			self.flush()
+			self._output.write(data)
+
+	def flush(self):
+		"""
+		Writes everything buffered to the output stream. Compressed streams may still buffer it internally.
+		"""
+		if self._fileno is not None:
+			#The file object is bypassed entirely, since anything it buffered would be written out of order
+			segments = self._segments
+			if self._length > self._segmentStart:
+				segments.append(memoryview(self._buffer)[self._segmentStart:self._length])
+
+			i = 0
+			chunk = None
+			while i < len(segments):
+				chunk = segments[i:i + WRITEV_MAX_SEGMENTS]
+				written = os.writev(self._fileno, chunk)
+
+				#Skip what was written, resuming partway through a segment after a partial write
+				for segment in chunk:
+					if written < len(segment):
+						break
+					written -= len(segment)
+					i += 1
+				if written > 0:
+					segments[i] = memoryview(segments[i])[written:]
+
+			#Release the views of the buffer before it is reused
+			del chunk
+			self._segments = []
+			self._segmentStart = 0
+			self._segmentBytes = 0
+		elif self._length > 0:
+			with memoryview(self._buffer) as view:
+				self._output.write(view[:self._length])
+
+		self._length = 0
+		self._lastFlush = time.monotonic()
+
+	def close(self):
+		"""
+		Flushes and closes the output stream.
+		"""
+		self.flush()
+		self._output.close()
@@ -0,0 +1,485 @@
+
+# Copyright (c) 2015-2023 Agalmic Ventures LLC (www.agalmicventures.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import array
+import bisect
+import io
+import os
+import struct
+import zlib
+
+from NanoPcap import Format
+
+########## Constants ##########
+
+INDEX_MAGIC = b'NPIX'
+INDEX_VERSION = 2
+
+INDEX_FILE_EXTENSION = '.idx'
+
+#The default number of records between index entries
+DEFAULT_INDEX_INTERVAL = 1024
+
+#The default number of uncompressed bytes between gzip decompressor snapshots
+DEFAULT_CHECKPOINT_SPACING = 16 * 1024 * 1024
+
+#The size of the reads from compressed files (and the maximum output of each decompression step)
+GZIP_CHUNK_SIZE = 128 * 1024
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+########## Structs ##########
+
+#Sidecar files are always little endian so they can be shared between machines
+INDEX_HEADER_STRUCT = struct.Struct('<4sIQQQQQ')
+INDEX_ENTRY_STRUCT = struct.Struct('<QQQ')
+INDEX_GZIP_MEMBER_STRUCT = struct.Struct('<QQ')
+
+########## Helpers ##########
+
+def indexFileName(filename):
+	"""
+	Returns the name of the sidecar index file for a PCAP.
+
+	:param filename: str
+	:return: str
+	"""
+	return filename + INDEX_FILE_EXTENSION
+
+########## Types ##########
+
+class PcapIndex(object):
+	"""
+	Represents a sampled index of the records in a PCAP file, allowing parsers to seek by time or
+	record number without scanning from the beginning.
+
+	Each entry holds the offset and number of a record, along with the highest timestamp of any
+	record before it. Because that timestamp never decreases, seeking by time is correct even for
+	captures which are not in time order.
+
+	Offsets are always uncompressed. For gzip files, the index also holds the (uncompressed, compressed)
+	offsets of the gzip members, where decompression can start without any prior state.
+
+	:param interval: int The number of records between entries.
+	:param fileSize: int The size of the indexed file.
+	:param fileMtimeNs: int The modification time of the indexed file in nanoseconds.
+	:param epochNanos: array of int The highest timestamp of any record before each entry.
+	:param byteOffsets: array of int The offset of each entry's record header.
+	:param recordNumbers: array of int The number of each entry's record (starting at 0).
+	:param gzipMembers: list of (int, int) The offsets of each gzip member (optional).
+	"""
+
+	__slots__ = ['_interval', '_fileSize', '_fileMtimeNs', '_epochNanos', '_byteOffsets', '_recordNumbers', '_gzipMembers']
+
+	def __init__(self, interval, fileSize, fileMtimeNs, epochNanos, byteOffsets, recordNumbers, gzipMembers=None):
+		if interval < 1:
+			raise ValueError('interval must be positive')
+		if not len(epochNanos) == len(byteOffsets) == len(recordNumbers):
+			raise ValueError('Index arrays must have the same length')
+
+		self._interval = interval
+		self._fileSize = fileSize
+		self._fileMtimeNs = fileMtimeNs
+		self._epochNanos = epochNanos
+		self._byteOffsets = byteOffsets
+		self._recordNumbers = recordNumbers
+		self._gzipMembers = gzipMembers if gzipMembers is not None else []
+
+	def __len__(self):
+		return len(self._byteOffsets)
+
+	def interval(self):
+		"""
+		Returns the number of records between entries.
+
+		:return: int
+		"""
+		return self._interval
+
+	def fileSize(self):
+		"""
+		Returns the size of the indexed file.
+
+		:return: int
+		"""
+		return self._fileSize
+
+	def fileMtimeNs(self):
+		"""
+		Returns the modification time of the indexed file in nanoseconds.
+
+		:return: int
+		"""
+		return self._fileMtimeNs
+
+	def gzipMembers(self):
+		"""
+		Returns the (uncompressed, compressed) offsets of each gzip member, if the file is compressed.
+
+		:return: list of (int, int)
+		"""
+		return self._gzipMembers
+
+	def entry(self, i):
+		"""
+		Returns the i-th entry.
+
+		:param i: int
+		:return: (epochNanos, byteOffset, recordNumber)
+		"""
+		return (self._epochNanos[i], self._byteOffsets[i], self._recordNumbers[i])
+
+	def isFresh(self, filename):
+		"""
+		Returns a bool indicating if the index still matches the file (by size and modification time).
+
+		:param filename: str
+		:return: bool
+		"""
+		try:
+			stat = os.stat(filename)
+		except OSError:
+			return False
+
+		return stat.st_size == self._fileSize and stat.st_mtime_ns == self._fileMtimeNs
+
+	def findTime(self, epochNanos):
+		"""
+		Finds the last entry before which every record is earlier than the given time.
+
+		:param epochNanos: int
+		:return: (byteOffset, recordNumber) or None if the index is empty
+		"""
+		if len(self._byteOffsets) == 0:
+			return None
+
+		i = max(bisect.bisect_left(self._epochNanos, epochNanos) - 1, 0)
+		return (self._byteOffsets[i], self._recordNumbers[i])
+
+	def findRecord(self, recordNumber):
+		"""
+		Finds the last entry at or before the given record number.
+
+		:param recordNumber: int
+		:return: (byteOffset, recordNumber) or None if the index is empty
+		"""
+		if len(self._byteOffsets) == 0:
+			return None
+
+		i = max(bisect.bisect_right(self._recordNumbers, recordNumber) - 1, 0)
+		return (self._byteOffsets[i], self._recordNumbers[i])
+
+	def findOffset(self, byteOffset):
+		"""
+		Finds the first entry at or after the given byte offset.
+
+		:param byteOffset: int
+		:return: (byteOffset, recordNumber) or None if there is no such entry
+		"""
+		i = bisect.bisect_left(self._byteOffsets, byteOffset)
+		if i >= len(self._byteOffsets):
+			return None
+
+		return (self._byteOffsets[i], self._recordNumbers[i])
+
+	def asBytes(self):
+		"""
+		Returns the index as bytes.
+
+		:return: bytes
+		"""
+		parts = [INDEX_HEADER_STRUCT.pack(INDEX_MAGIC, INDEX_VERSION, self._interval,
+			self._fileSize, self._fileMtimeNs, len(self), len(self._gzipMembers))]
+		for i in range(len(self)):
+			parts.append(INDEX_ENTRY_STRUCT.pack(*self.entry(i)))
+		for member in self._gzipMembers:
+			parts.append(INDEX_GZIP_MEMBER_STRUCT.pack(*member))
+		return b''.join(parts)
+
+	def writeToFile(self, output):
+		"""
+		Writes this as bytes to a file.
+
+		:param output: file like object
+		"""
+		output.write(self.asBytes())
+
+class GzipCheckpointFile(io.RawIOBase):
+	"""
+	A seekable, read-only view of the decompressed contents of a gzip file (including files with
+	multiple members), which allows seeking without decompressing from the beginning each time.
+
+	As data is decompressed, the decompressor state is snapshotted every spacing bytes, and the start of
+	each gzip member is recorded. Seeking restores the closest preceding checkpoint and inflates forward
+	from there. Snapshots only live in memory, but member offsets can be saved in a PcapIndex and passed
+	back in to jump directly into multi-member files.
+
+	NOTE: persisting access points within a member (as zran does) would need an inflater primed with the bits
+	before a deflate block boundary, which Python's zlib cannot do, so single member files (e.g. from the gzip
+	command) are always inflated from the start when opened again. NanoPcap writes gzip files in members of
+	Compression.DEFAULT_GZIP_MEMBER_SIZE bytes (see Compression.MultiMemberGzipFile) to avoid this.
+
+	:param rawFile: file-like object of the compressed data (must be seekable to seek backwards)
+	:param spacing: int The number of uncompressed bytes between snapshots
+	:param gzipMembers: list of (int, int) Known (uncompressed, compressed) offsets of gzip members (optional)
+	"""
+
+	def __init__(self, rawFile, spacing=DEFAULT_CHECKPOINT_SPACING, gzipMembers=None):
+		super().__init__()
+		self._rawFile = rawFile
+		self._spacing = spacing
+
+		#Checkpoints are (uncompressed offset, compressed offset, decompressor or None at member starts)
+		start = rawFile.tell()
+		self._checkpoints = [(0, start, None)]
+		self._checkpointOffsets = [0]
+		self._gzipMembers = [(0, start)]
+		for uncompressedOffset, compressedOffset in gzipMembers or []:
+			self._addCheckpoint(uncompressedOffset, compressedOffset, None)
+
+		self._restore(self._checkpoints[0])
+
+	def _addCheckpoint(self, uncompressedOffset, compressedOffset, decompressor):
+		#Only checkpoints past the last are recorded, which keeps them sorted even after seeking backwards
+		if uncompressedOffset <= self._checkpointOffsets[-1]:
+			return
+
+		self._checkpoints.append((uncompressedOffset, compressedOffset, decompressor))
+		self._checkpointOffsets.append(uncompressedOffset)
+		if decompressor is None:
+			self._gzipMembers.append((uncompressedOffset, compressedOffset))
+
+	def _restore(self, checkpoint):
+		uncompressedOffset, compressedOffset, decompressor = checkpoint
+		self._rawFile.seek(compressedOffset)
+		self._compressedOffset = compressedOffset
+		self._pending = b''
+		#Copy the snapshot so that the checkpoint can be restored again later
+		self._decompressor = decompressor.copy() if decompressor is not None else None
+		self._decompressedOffset = uncompressedOffset
+		self._output = b''
+		self._outputStart = 0
+
+	def _decompress(self):
+		"""
+		Decompresses the next chunk of data into the output buffer.
+
+		:return: bool indicating if any data was decompressed (False at EOF)
+		"""
+		while True:
+			if len(self._pending) == 0:
+				self._pending = self._rawFile.read(GZIP_CHUNK_SIZE)
+				self._compressedOffset += len(self._pending)
+				if len(self._pending) == 0:
+					if self._decompressor is not None:
+						raise EOFError('Compressed file ended before the end-of-stream marker was reached')
+					return False
+
+			#Start a new member if necessary
+			if self._decompressor is None:
+				if self._pending[:len(GZIP_MAGIC)] != GZIP_MAGIC[:len(self._pending)]:
+					raise ValueError('Not a gzipped file (%r)' % self._pending[:len(GZIP_MAGIC)])
+				self._addCheckpoint(self._decompressedOffset, self._compressedOffset - len(self._pending), None)
+				self._decompressor = zlib.decompressobj(wbits=31)
+
+			output = self._decompressor.decompress(self._pending, GZIP_CHUNK_SIZE)
+			if self._decompressor.eof:
+				self._pending = self._decompressor.unused_data
+				self._decompressor = None
+			else:
+				self._pending = self._decompressor.unconsumed_tail
+
+			if len(output) > 0:
+				self._output = output
+				self._outputStart = 0
+				self._decompressedOffset += len(output)
+
+				#Snapshot at the end of this output, with the raw file positioned after the consumed input
+				if self._decompressor is not None and self._decompressedOffset - self._checkpointOffsets[-1] >= self._spacing:
+					self._addCheckpoint(self._decompressedOffset, self._compressedOffset - len(self._pending),
+						self._decompressor.copy())
+				return True
+
+	def checkpointCount(self):
+		"""
+		Returns the number of checkpoints (snapshots and member starts) recorded so far.
+
+		:return: int
+		"""
+		return len(self._checkpoints)
+
+	def gzipMembers(self):
+		"""
+		Returns the (uncompressed, compressed) offsets of each gzip member discovered so far.
+
+		:return: list of (int, int)
+		"""
+		return self._gzipMembers
+
+	def readable(self):
+		return True
+
+	def seekable(self):
+		return True
+
+	def tell(self):
+		return self._decompressedOffset - (len(self._output) - self._outputStart)
+
+	def readinto(self, b):
+		view = memoryview(b).cast('B')
+		n = len(view)
+		filled = 0
+		while filled < n:
+			if self._outputStart >= len(self._output) and not self._decompress():
+				break #EOF
+
+			count = min(n - filled, len(self._output) - self._outputStart)
+			view[filled:filled + count] = self._output[self._outputStart:self._outputStart + count]
+			self._outputStart += count
+			filled += count
+
+		return filled
+
+	def seek(self, offset, whence=io.SEEK_SET):
+		if whence == io.SEEK_CUR:
+			offset += self.tell()
+		elif whence != io.SEEK_SET:
+			raise ValueError('Seek from end not supported')
+		if offset < 0:
+			raise ValueError('Negative seek offset %d' % offset)
+
+		#Restore the closest checkpoint, unless just reading forward is at least as close
+		current = self.tell()
+		i = bisect.bisect_right(self._checkpointOffsets, offset) - 1
+		if offset < current or self._checkpointOffsets[i] > current:
+			self._restore(self._checkpoints[i])
+
+		#Inflate forward, discarding the output
+		remaining = offset - self.tell()
+		while remaining > 0:
+			if self._outputStart >= len(self._output) and not self._decompress():
+				break #EOF
+
+			count = min(remaining, len(self._output) - self._outputStart)
+			self._outputStart += count
+			remaining -= count
+
+		return self.tell()
+
+########## Functions ##########
+
+def buildIndex(parser, filename, interval=DEFAULT_INDEX_INTERVAL, gzipFile=None):
+	"""
+	Builds an index of a PCAP by parsing all of it.
+
+	:param parser: PcapParser or PcapMmapParser positioned at the first record of the file
+	:param filename: str The name of the file being parsed (for freshness checks)
+	:param interval: int The number of records between entries
+	:param gzipFile: GzipCheckpointFile The file being parsed, if compressed, to record its gzip members
+	:return: PcapIndex
+	"""
+	#Stat first, so that files modified while being indexed appear stale
+	stat = os.stat(filename)
+
+	epochNanos = array.array(Format.BATCH_ARRAY_TYPECODE)
+	byteOffsets = array.array(Format.BATCH_ARRAY_TYPECODE)
+	recordNumbers = array.array(Format.BATCH_ARRAY_TYPECODE)
+
+	maxEpochNanos = 0
+	recordNumber = 0
+	for batch in parser.parseBatches():
+		batchEpochNanos = batch.epochNanos()
+		batchFileOffsets = batch.fileOffsets()
+		for i in range(len(batch)):
+			if recordNumber % interval == 0:
+				epochNanos.append(maxEpochNanos)
+				byteOffsets.append(batchFileOffsets[i])
+				recordNumbers.append(recordNumber)
+
+			if batchEpochNanos[i] > maxEpochNanos:
+				maxEpochNanos = batchEpochNanos[i]
+			recordNumber += 1
+
+	gzipMembers = gzipFile.gzipMembers() if gzipFile is not None else None
+	return PcapIndex(interval, stat.st_size, stat.st_mtime_ns, epochNanos, byteOffsets, recordNumbers, gzipMembers=gzipMembers)
+
+def readIndex(indexFile):
+	"""
+	Reads an index from a file-like object.
+
+	:param indexFile: file-like object to read from
+	:return: PcapIndex
+	"""
+	headerBytes = indexFile.read(INDEX_HEADER_STRUCT.size)
+	if len(headerBytes) != INDEX_HEADER_STRUCT.size:
+		raise ValueError('Could not read complete index header (got only %d bytes)' % len(headerBytes))
+
+	magic, version, interval, fileSize, fileMtimeNs, count, gzipMemberCount = INDEX_HEADER_STRUCT.unpack(headerBytes)
+	if magic != INDEX_MAGIC:
+		raise ValueError('Index has invalid magic %r' % magic)
+	if version != INDEX_VERSION:
+		raise ValueError('Index has unsupported version %d' % version)
+
+	entryBytes = indexFile.read(count * INDEX_ENTRY_STRUCT.size)
+	if len(entryBytes) != count * INDEX_ENTRY_STRUCT.size:
+		raise ValueError('Could not read index entries (expected %d bytes; got %d)' % (
+			count * INDEX_ENTRY_STRUCT.size, len(entryBytes)))
+
+	epochNanos = array.array(Format.BATCH_ARRAY_TYPECODE)
+	byteOffsets = array.array(Format.BATCH_ARRAY_TYPECODE)
+	recordNumbers = array.array(Format.BATCH_ARRAY_TYPECODE)
+	for entryEpochNanos, byteOffset, recordNumber in INDEX_ENTRY_STRUCT.iter_unpack(entryBytes):
+		epochNanos.append(entryEpochNanos)
+		byteOffsets.append(byteOffset)
+		recordNumbers.append(recordNumber)
+
+	gzipMemberBytes = indexFile.read(gzipMemberCount * INDEX_GZIP_MEMBER_STRUCT.size)
+	if len(gzipMemberBytes) != gzipMemberCount * INDEX_GZIP_MEMBER_STRUCT.size:
+		raise ValueError('Could not read index gzip members (expected %d bytes; got %d)' % (
+			gzipMemberCount * INDEX_GZIP_MEMBER_STRUCT.size, len(gzipMemberBytes)))
+	gzipMembers = list(INDEX_GZIP_MEMBER_STRUCT.iter_unpack(gzipMemberBytes))
+
+	return PcapIndex(interval, fileSize, fileMtimeNs, epochNanos, byteOffsets, recordNumbers, gzipMembers=gzipMembers)
+
+def writeIndexFile(index, filename):
+	"""
+	Writes the sidecar index file for a PCAP.
+
+	:param index: PcapIndex
+	:param filename: str The name of the PCAP (not the index)
+	"""
+	with open(indexFileName(filename), 'wb') as indexFile:
+		index.writeToFile(indexFile)
+
+def loadIndexFile(filename):
+	"""
+	Loads the sidecar index file for a PCAP if there is one and it is still fresh.
+
+	:param filename: str The name of the PCAP (not the index)
+	:return: PcapIndex or None
+	"""
+	try:
+		with open(indexFileName(filename), 'rb') as indexFile:
+			index = readIndex(indexFile)
+	except FileNotFoundError:
+		return None
+
+	return index if index.isFresh(filename) else None
@@ -19,9 +19,20 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import time
+
+from NanoPcap import Format
+
 class PcapListener(object):
 	"""
 	Represents a generic PCAP event listener.
+
+	Listeners may also implement onPcapRecordBatch(batch), which takes a PcapRecordBatch. When it is
+	present, the parse functions call it instead of onPcapRecord, amortizing the dispatch over many records.
+
+	Listeners may also implement merge(other), which combines the results of another listener of the same
+	type which saw the records immediately following those seen by this one. This allows files to be parsed
+	in parallel shards (see Parallel.parseFileParallel).
 	"""
 
 	def onPcapHeader(self, header):
@@ -36,8 +47,11 @@ class PcapListener(object):
 		"""
 		Called once per record in the file.
 
+		NOTE: flyweight parsers pass the same PcapFlyweightRecordHeader for every record, so listeners which
+		keep record headers must keep a copy() of them.
+
 		:param record_header: PcapRecordHeader
-		:param data: bytes
+		:param data: bytes (or memoryview when memory mapped)
 		"""
 		raise NotImplementedError('PcapListener.onPcapRecord is pure virtual!')
 
@@ -52,6 +66,12 @@ class PcapDoNothingListener(object):
 	def onPcapRecord(self, recordHeader, data):
 		pass #Do nothing
 
+	def onPcapRecordBatch(self, batch):
+		pass #Do nothing
+
+	def merge(self, other):
+		pass #Do nothing
+
 class PcapRecordingListener(object):
 	"""
 	Implementation of PcapListener which records headers for later use.
@@ -84,4 +104,120 @@ class PcapRecordingListener(object):
 		self._header = header
 
 	def onPcapRecord(self, recordHeader, data):
+		#Flyweight headers are refilled with the next record, so they must be copied
+		if isinstance(recordHeader, Format.PcapFlyweightRecordHeader):
+			recordHeader = recordHeader.copy()
 		self._recordHeaders.append(recordHeader)
+
+	def onPcapRecordBatch(self, batch):
+		self._recordHeaders.extend(batch.recordHeader(i) for i in range(len(batch)))
+
+	def merge(self, other):
+		if self._header is None:
+			self._header = other._header
+
+		self._recordHeaders.extend(other._recordHeaders)
+
+class PcapBatchAdapterListener(object):
+	"""
+	Adapts a per-record PcapListener into one which receives batches, calling onPcapRecord once per record
+	in each batch. Record data is copied into bytes so the wrapped listener sees what PcapParser.parse()
+	would yield.
+
+	:param listener: PcapListener The listener to forward events to.
+	"""
+
+	def __init__(self, listener):
+		self._listener = listener
+
+	def listener(self):
+		"""
+		Returns the wrapped listener.
+
+		:return: PcapListener
+		"""
+		return self._listener
+
+	def onPcapHeader(self, header):
+		self._listener.onPcapHeader(header)
+
+	def onPcapRecord(self, recordHeader, data):
+		self._listener.onPcapRecord(recordHeader, data)
+
+	def onPcapRecordBatch(self, batch):
+		onPcapRecord = self._listener.onPcapRecord
+		for i in range(len(batch)):
+			onPcapRecord(batch.recordHeader(i), bytes(batch.recordData(i)))
+
+	def merge(self, other):
+		self._listener.merge(other._listener)
+
+class PcapCompositeListener(object):
+	"""
+	Implementation of PcapListener which forwards events to several child listeners, so that they share a
+	single parse of the file. Since listeners may edit the headers they are given (e.g. to truncate records),
+	each child receives its own copy of the file header and of each record header.
+
+	Children implementing onPcapRecordBatch receive whole batches; the others receive each record in turn,
+	with the record data copied into bytes once and shared.
+
+	:param listeners: list of PcapListener
+	:param timed: bool Indicating the time spent in each child should be measured (see timings())
+	"""
+
+	def __init__(self, listeners, timed=False):
+		self._listeners = list(listeners)
+		self._timed = timed
+		self._timings = [0.0] * len(self._listeners)
+
+	def listeners(self):
+		"""
+		Returns the child listeners.
+
+		:return: list of PcapListener
+		"""
+		return self._listeners
+
+	def timings(self):
+		"""
+		Returns the total time spent in the callbacks of each child listener, if timed.
+
+		:return: list of float seconds, in the same order as listeners()
+		"""
+		return self._timings
+
+	def _call(self, i, callback, *args):
+		if self._timed:
+			start = time.perf_counter()
+			callback(*args)
+			self._timings[i] += time.perf_counter() - start
+		else:
+			callback(*args)
+
+	def onPcapHeader(self, header):
+		for i, listener in enumerate(self._listeners):
+			self._call(i, listener.onPcapHeader, header.copy())
+
+	def onPcapRecord(self, recordHeader, data):
+		for i, listener in enumerate(self._listeners):
+			self._call(i, listener.onPcapRecord, recordHeader.copy(), data)
+
+	def onPcapRecordBatch(self, batch):
+		datas = None
+		for i, listener in enumerate(self._listeners):
+			onPcapRecordBatch = getattr(listener, 'onPcapRecordBatch', None)
+			if onPcapRecordBatch is not None:
+				self._call(i, onPcapRecordBatch, batch)
+			else:
+				if datas is None:
+					datas = [bytes(batch.recordData(j)) for j in range(len(batch))]
+				self._call(i, self._forwardRecords, listener.onPcapRecord, batch, datas)
+
+	def _forwardRecords(self, onPcapRecord, batch, datas):
+		for j, data in enumerate(datas):
+			onPcapRecord(batch.recordHeader(j), data)
+
+	def merge(self, other):
+		for listener, otherListener in zip(self._listeners, other._listeners):
+			listener.merge(otherListener)
+		self._timings = [t + u for t, u in zip(self._timings, other._timings)]
@@ -0,0 +1,293 @@
+
+# Copyright (c) 2015-2023 Agalmic Ventures LLC (www.agalmicventures.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import array
+import concurrent.futures
+import multiprocessing
+import os
+import queue
+import traceback
+from multiprocessing import resource_tracker, shared_memory
+
+from NanoPcap import Compression, Format, Index, Parser
+
+#How long to wait for messages from partition workers before checking whether they are still alive
+_PARTITION_POLL_INTERVAL = 1.0
+
+def shardFile(filename, shards, strict=False):
+	"""
+	Splits an uncompressed PCAP into contiguous byte ranges starting on record boundaries. Boundaries
+	come from the sidecar index when it is fresh, and are otherwise found by resynchronizing on record
+	headers (see PcapMmapParser.findRecordBoundary).
+
+	:param filename: str
+	:param shards: int The desired number of shards (fewer are returned for small files)
+	:param strict: bool Indicating strict validation
+	:return: list of (startOffset, endOffset)
+	"""
+	if shards < 1:
+		raise ValueError('shards must be positive')
+
+	index = Index.loadIndexFile(filename)
+	with open(filename, 'rb') as pcapFile, Parser.PcapMmapParser(pcapFile, strict=strict) as parser:
+		start = Format.PCAP_HEADER_STRUCT.size
+		size = parser.size()
+		shardSize = (size - start) // shards
+
+		boundaries = [start]
+		for i in range(1, shards):
+			target = start + i * shardSize
+			if index is not None:
+				entry = index.findOffset(target)
+				boundary = entry[0] if entry is not None else size
+			else:
+				boundary = parser.findRecordBoundary(max(target, boundaries[-1]))
+
+			if boundary > boundaries[-1] and boundary < size:
+				boundaries.append(boundary)
+		boundaries.append(size)
+
+	return list(zip(boundaries[:-1], boundaries[1:]))
+
+def _parseShard(filename, startOffset, endOffset, listenerFactory, strict, batchSize, trusted):
+	"""
+	Parses the records starting in a byte range of a PCAP (in a worker process).
+
+	:return: PcapListener
+	"""
+	listener = listenerFactory()
+	with open(filename, 'rb') as pcapFile, Parser.PcapMmapParser(pcapFile, strict=strict, trusted=trusted) as parser:
+		parser.setRange(startOffset, endOffset)
+		Parser._dispatch(parser, listener, batchSize)
+	return listener
+
+def parseFileParallel(filename, listenerFactory, processes=None, shards=None, strict=False, batchSize=Parser.DEFAULT_BATCH_SIZE,
+		trusted=False):
+	"""
+	Parses an uncompressed PCAP in parallel. The file is split into shards (see shardFile) which are each
+	parsed into a fresh listener in a pool of processes, and the listeners are then combined in file order
+	with merge(), so the result matches a serial parse for listeners implementing merge() correctly.
+
+	NOTE: listenerFactory, the listeners, and anything they reference must be picklable.
+
+	:param filename: str The file to parse
+	:param listenerFactory: callable returning a new PcapListener implementing merge()
+	:param processes: int The number of worker processes (defaults to the number of CPUs)
+	:param shards: int The number of shards (defaults to the number of processes)
+	:param strict: bool Indicating strict validation
+	:param batchSize: int The maximum number of records per batch for listeners implementing onPcapRecordBatch
+	:param trusted: bool Indicating records should not be validated, e.g. for files written by this library
+	:return: PcapListener The merged listener
+	"""
+	if Compression.isCompressed(filename):
+		raise ValueError('Compressed files cannot be parsed in parallel')
+
+	processes = processes or os.cpu_count() or 1
+	ranges = shardFile(filename, shards or processes, strict=strict)
+
+	with concurrent.futures.ProcessPoolExecutor(min(processes, len(ranges))) as executor:
+		futures = [executor.submit(_parseShard, filename, startOffset, endOffset, listenerFactory, strict, batchSize, trusted)
+			for startOffset, endOffset in ranges]
+		listeners = [future.result() for future in futures]
+
+	listener = listeners[0]
+	for shardListener in listeners[1:]:
+		listener.merge(shardListener)
+	return listener
+
+########## Partitioning ##########
+
+#The columns of a PcapRecordBatch which are copied into shared memory ahead of its data, in order
+_PARTITION_COLUMNS = ['tsSecs', 'tsFracs', 'epochNanos', 'includedLengths', 'originalLengths', 'fileOffsets', 'dataOffsets']
+
+def _partitionBatch(header, buffer, count, indices):
+	"""
+	Constructs a batch of the records with the given indices from a batch in shared memory (see parseFilePartitioned).
+
+	:return: PcapRecordBatch
+	"""
+	columns = []
+	columnSize = count * array.array(Format.BATCH_ARRAY_TYPECODE).itemsize
+	for i in range(len(_PARTITION_COLUMNS)):
+		with buffer[i * columnSize:(i + 1) * columnSize] as columnBytes, columnBytes.cast(Format.BATCH_ARRAY_TYPECODE) as column:
+			columns.append(array.array(Format.BATCH_ARRAY_TYPECODE, [column[j] for j in indices]))
+
+	tsSecs, tsFracs, epochNanos, includedLengths, originalLengths, fileOffsets, dataOffsets = columns
+	data = buffer[len(_PARTITION_COLUMNS) * columnSize:]
+	return Format.PcapRecordBatch(header, tsSecs, tsFracs, epochNanos, includedLengths, originalLengths, fileOffsets, data, dataOffsets)
+
+def _partitionWorker(workerIndex, listenerFactory, header, inputQueue, outputQueue):
+	"""
+	Feeds the records of one partition to a listener (in a worker process), acknowledging each batch once done
+	with its shared memory.
+	"""
+	try:
+		listener = listenerFactory()
+		listener.onPcapHeader(header)
+		onPcapRecordBatch = getattr(listener, 'onPcapRecordBatch', None)
+		onPcapRecord = listener.onPcapRecord
+
+		while True:
+			item = inputQueue.get()
+			if item is None:
+				break
+
+			batchId, name, count, indices = item
+			sharedMemory = shared_memory.SharedMemory(name=name)
+			try:
+				batch = _partitionBatch(header, sharedMemory.buf, count, indices)
+				if onPcapRecordBatch is not None:
+					onPcapRecordBatch(batch)
+				else:
+					#Copy the data, since the shared memory is reused once acknowledged
+					for i in range(len(batch)):
+						onPcapRecord(batch.recordHeader(i), bytes(batch.recordData(i)))
+				batch.data().release()
+				del batch
+			finally:
+				sharedMemory.close()
+			outputQueue.put(('ack', batchId))
+
+		close = getattr(listener, 'close', None)
+		if close is not None:
+			close()
+		outputQueue.put(('result', workerIndex, listener))
+	except BaseException:
+		outputQueue.put(('error', workerIndex, traceback.format_exc()))
+
+def parseFilePartitioned(filename, listenerFactory, partitionerFactory, processes=None, strict=False,
+		batchSize=Parser.DEFAULT_BATCH_SIZE, blockSize=0, trusted=False, maxBatchesInFlight=None):
+	"""
+	Parses a PCAP on the calling process, distributing its records among worker processes by partition, so that
+	work which depends only on a part of the records (e.g. a flow) runs in parallel. Each worker feeds its own
+	listener, which sees all of the records of its partitions in file order. Unlike parseFileParallel, compressed
+	files are supported, since they are read sequentially.
+
+	Each batch is copied once into a block of shared memory, and only the indices of their records are sent to
+	each worker, so records are not pickled. At most maxBatchesInFlight batches are in shared memory at once, so
+	the parse waits for slow workers.
+
+	NOTE: listenerFactory and the listeners must be picklable. Listeners implementing close() are closed in
+	their worker. Listeners implementing onPcapRecordBatch must not keep the batches, since their data is in
+	shared memory which is reused.
+
+	:param filename: str The file to parse
+	:param listenerFactory: callable returning a new PcapListener
+	:param partitionerFactory: callable taking the PcapHeader and returning a function from record data to an int
+		partition (of any size, since it is taken modulo the number of processes)
+	:param processes: int The number of worker processes (defaults to the number of CPUs)
+	:param strict: bool Indicating strict validation
+	:param batchSize: int The maximum number of records per batch
+	:param blockSize: int The size of the blocks to read the file in, or 0 to read each record directly
+	:param trusted: bool Indicating records should not be validated, e.g. for files written by this library
+	:param maxBatchesInFlight: int The most batches in shared memory at once (defaults to twice the processes)
+	:return: list of PcapListener, one per worker
+	"""
+	processes = processes or os.cpu_count() or 1
+	maxBatchesInFlight = maxBatchesInFlight or 2 * processes
+
+	with Compression.openFile(filename, 'rb') as pcapFile:
+		parser = Parser.PcapParser(pcapFile, strict=strict, blockSize=blockSize, trusted=trusted)
+		header = parser.header()
+		partition = partitionerFactory(header)
+
+		#Start the resource tracker before the workers so that they share it, rather than each starting their own
+		#which would consider the shared memory they attach to leaked when they exit
+		resource_tracker.ensure_running()
+
+		context = multiprocessing.get_context()
+		outputQueue = context.Queue()
+		inputQueues = [context.Queue() for _ in range(processes)]
+		workers = [context.Process(target=_partitionWorker, args=(i, listenerFactory, header, inputQueues[i], outputQueue),
+			name='PartitionWorker-%d' % i, daemon=True) for i in range(processes)]
+		for worker in workers:
+			worker.start()
+
+		#Batches in shared memory, with the number of workers which have yet to acknowledge them
+		inFlight = {}
+		listeners = [None] * processes
+
+		def receive():
+			exited = set()
+			while True:
+				try:
+					message = outputQueue.get(timeout=_PARTITION_POLL_INTERVAL)
+					break
+				except queue.Empty:
+					#Workers which had already exited on the previous timeout cannot have a message in transit
+					for i, worker in enumerate(workers):
+						if worker.exitcode is not None and listeners[i] is None:
+							if i in exited:
+								raise RuntimeError('Partition worker %d exited with code %d' % (i, worker.exitcode))
+							exited.add(i)
+
+			if message[0] == 'ack':
+				entry = inFlight[message[1]]
+				entry[1] -= 1
+				if entry[1] == 0:
+					del inFlight[message[1]]
+					entry[0].close()
+					entry[0].unlink()
+			elif message[0] == 'result':
+				listeners[message[1]] = message[2]
+			else:
+				raise RuntimeError('Partition worker %d failed:\n%s' % (message[1], message[2]))
+
+		try:
+			for batchId, batch in enumerate(parser.parseBatches(batchSize)):
+				while len(inFlight) >= maxBatchesInFlight:
+					receive()
+
+				#Assign each record to a worker
+				indices = [array.array(Format.BATCH_ARRAY_TYPECODE) for _ in range(processes)]
+				for i in range(len(batch)):
+					indices[partition(batch.recordData(i)) % processes].append(i)
+
+				#Copy the columns and then the data into shared memory
+				data = batch.data()
+				columns = [getattr(batch, column)() for column in _PARTITION_COLUMNS]
+				columnSize = len(batch) * columns[0].itemsize
+				sharedMemory = shared_memory.SharedMemory(create=True, size=len(columns) * columnSize + len(data))
+				offset = 0
+				for column in columns:
+					sharedMemory.buf[offset:offset + columnSize] = memoryview(column).cast('B')
+					offset += columnSize
+				sharedMemory.buf[offset:offset + len(data)] = data
+
+				recipients = [i for i in range(processes) if len(indices[i]) > 0]
+				inFlight[batchId] = [sharedMemory, len(recipients)]
+				for i in recipients:
+					inputQueues[i].put((batchId, sharedMemory.name, len(batch), indices[i]))
+
+			for inputQueue in inputQueues:
+				inputQueue.put(None)
+			while len(inFlight) > 0 or any(listener is None for listener in listeners):
+				receive()
+		finally:
+			for worker in workers:
+				if worker.is_alive() and any(listener is None for listener in listeners):
+					worker.terminate()
+				worker.join()
+			for sharedMemory, _ in inFlight.values():
+				sharedMemory.close()
+				sharedMemory.unlink()
+
+	return listeners
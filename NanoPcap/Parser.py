@@ -19,39 +19,211 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import gzip
+import array
+import contextlib
+import mmap
+import os
 
-from NanoPcap import Format
+from NanoPcap import Compression, Follow, Format, Index
+
+#The default maximum number of records per PcapRecordBatch
+DEFAULT_BATCH_SIZE = 4096
+
+#The default size of the blocks read from files when block reads are used (by default, only for compressed files,
+#since reading each record directly is faster for plain files; see Tools/Benchmark.py to compare them on an input)
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+#The number of consecutive plausible record headers required to accept a record boundary when resynchronizing
+DEFAULT_RESYNC_RECORDS = 8
+
+#The largest record length accepted when resynchronizing, unless the snaplen is larger
+RESYNC_MAX_RECORD_LENGTH = 256 * 1024
+
+#The largest difference in seconds accepted between the timestamps of records when resynchronizing (both
+#between the first record of the file and a candidate, and between a candidate and the records following it)
+RESYNC_MAX_GAP_SECONDS = 24 * 60 * 60
+
+def _parseHeader(headerBytes, strict):
+	"""
+	Parses a PCAP file header, detecting the byte order.
+
+	:param headerBytes: bytes-like object of at least PCAP_HEADER_STRUCT.size bytes
+	:param strict: bool Indicating strict validation
+	:return: (PcapHeader, struct.Struct) of the header and the record header struct to use
+	"""
+	#Unpack the header and check for inverted byte order
+	headerValues = Format.PCAP_HEADER_STRUCT.unpack_from(headerBytes)
+	if headerValues[0] in [Format.PCAP_MAGIC_NUMBER_INVERTED, Format.PCAP_NS_MAGIC_NUMBER_INVERTED]:
+		headerValues = Format.PCAP_HEADER_STRUCT_INVERTED.unpack_from(headerBytes)
+		recordHeaderStruct = Format.PCAP_RECORD_HEADER_STRUCT_INVERTED
+	else:
+		if strict and headerValues[0] not in [Format.PCAP_MAGIC_NUMBER, Format.PCAP_NS_MAGIC_NUMBER]:
+			raise ValueError('PCAP header has invalid magic %X' % headerValues[0])
+
+		recordHeaderStruct = Format.PCAP_RECORD_HEADER_STRUCT
+
+	return Format.PcapHeader(*headerValues), recordHeaderStruct
+
+def _checkValidation(strict, trusted):
+	"""
+	Checks that a combination of validation options makes sense.
+
+	:param strict: bool Indicating strict validation
+	:param trusted: bool Indicating records should not be validated
+	"""
+	if strict and trusted:
+		raise ValueError('strict and trusted are mutually exclusive')
+
+class _StreamReader(object):
+	"""
+	Reads directly from a file-like object, one read() per request. This is the default, since the file object's
+	own buffering is already done in C, and is also used for objects which do not support readinto().
+
+	:param pcapFile: file-like object to read from
+	:param offset: int The offset of the file-like object's current position
+	"""
+
+	def __init__(self, pcapFile, offset=0):
+		self._pcapFile = pcapFile
+		self._offset = offset
+
+	def offset(self):
+		"""
+		Returns the offset of the next byte to be read.
+
+		:return: int
+		"""
+		return self._offset
+
+	def read(self, n):
+		"""
+		Reads the next n bytes (or fewer at EOF).
+
+		:param n: int
+		:return: bytes
+		"""
+		data = self._pcapFile.read(n)
+		self._offset += len(data)
+		return data
+
+class _BlockReader(object):
+	"""
+	Reads a file-like object in large blocks into a reusable buffer and hands out views of that buffer,
+	so that records cost no I/O calls of their own. Requests which straddle the end of the buffered data
+	move the leftover bytes to the front of the buffer before refilling it (growing it if necessary).
+
+	NOTE: each read costs a Python level call, so this is slower than _StreamReader for plain files, and only
+	opted into (with a block size) for inputs where a benchmark shows it wins, e.g. some decompressors.
+
+	:param pcapFile: file-like object to read from (must support readinto)
+	:param blockSize: int The size of the buffer
+	:param offset: int The offset of the file-like object's current position
+	"""
+
+	def __init__(self, pcapFile, blockSize, offset=0):
+		#Prefer readinto1 so that streams return what is available rather than block for a full buffer
+		self._readinto = getattr(pcapFile, 'readinto1', None) or pcapFile.readinto
+		self._buffer = bytearray(blockSize)
+		self._view = memoryview(self._buffer)
+		self._start = 0
+		self._end = 0
+		self._offset = offset
+
+	def offset(self):
+		"""
+		Returns the offset of the next byte to be read.
+
+		:return: int
+		"""
+		return self._offset
+
+	def read(self, n):
+		"""
+		Reads the next n bytes (or fewer at EOF). The result is only valid until the next call.
+
+		:param n: int
+		:return: memoryview
+		"""
+		if self._end - self._start < n:
+			self._fill(n)
+
+		start = self._start
+		end = min(start + n, self._end)
+		self._start = end
+		self._offset += end - start
+		return self._view[start:end]
+
+	def _fill(self, n):
+		remaining = self._end - self._start
+		if n > len(self._buffer):
+			#Records larger than the buffer need a bigger one
+			buffer = bytearray(max(n, 2 * len(self._buffer)))
+			view = memoryview(buffer)
+			view[:remaining] = self._view[self._start:self._end]
+			self._buffer = buffer
+			self._view = view
+		else:
+			self._view[:remaining] = self._view[self._start:self._end]
+
+		self._start = 0
+		self._end = remaining
+		while self._end < n:
+			count = self._readinto(self._view[self._end:])
+			if not count:
+				break #EOF
+			self._end += count
+
+def _makeReader(pcapFile, blockSize, offset):
+	"""
+	Creates the most efficient reader for the given file-like object.
+
+	:param pcapFile: file-like object to read from
+	:param blockSize: int The block size, or 0 or None to read exactly what is needed
+	:param offset: int The offset of the file-like object's current position
+	:return: _BlockReader or _StreamReader
+	"""
+	if blockSize and hasattr(pcapFile, 'readinto'):
+		return _BlockReader(pcapFile, blockSize, offset=offset)
+	return _StreamReader(pcapFile, offset=offset)
 
 class PcapParser(object):
 
-	def __init__(self, pcapFile, strict=False):
+	def __init__(self, pcapFile, strict=False, blockSize=0, index=None, trusted=False, flyweight=False, allowTruncated=False):
 		"""
 		Instantiates a parser for the given file-like object (file, socket, etc.)
 
+		By default, each record is read directly from the file-like object. A positive blockSize opts into
+		reading blocks of that many bytes into a reusable buffer instead, which may help slow file-like
+		objects such as decompressors (see Tools/Benchmark.py to measure it on a given input).
+
+		NOTE: reads block, so use AsyncParser.AsyncPcapParser for asyncio streams.
+
 		:param pcapFile: file-like object to parse from
 		:param strict: bool Indicating strict validation
+		:param blockSize: int The size of the blocks to read, or 0 to read each record directly
+		:param index: PcapIndex The index to use for seeking (optional)
+		:param trusted: bool Indicating records should not be validated, e.g. for files written by this library
+		:param flyweight: bool Indicating parse() should reuse one PcapFlyweightRecordHeader for every record
+		:param allowTruncated: bool Indicating an incomplete record at the end of the input ends parsing rather than
+			raising, e.g. for files which stopped being written mid-record (see truncatedBytes)
 		"""
+		_checkValidation(strict, trusted)
 		self._pcapFile = pcapFile
 		self._strict = strict
+		self._trusted = trusted
+		self._flyweight = flyweight
+		self._blockSize = blockSize
+		self._index = index
+		self._allowTruncated = allowTruncated
+		self._truncatedBytes = 0
 
 		#Read the header first
 		headerBytes = pcapFile.read(Format.PCAP_HEADER_STRUCT.size)
 		if len(headerBytes) != Format.PCAP_HEADER_STRUCT.size:
 			raise ValueError('Could not read comple PCAP header (got only %d bytes)' % len(headerBytes))
 
-		#Unpack the header and check for inverted byte order
-		headerValues = Format.PCAP_HEADER_STRUCT.unpack(headerBytes)
-		if headerValues[0] in [Format.PCAP_MAGIC_NUMBER_INVERTED, Format.PCAP_NS_MAGIC_NUMBER_INVERTED]:
-			headerValues = Format.PCAP_HEADER_STRUCT_INVERTED.unpack(headerBytes)
-			self._recordHeaderStruct = Format.PCAP_RECORD_HEADER_STRUCT_INVERTED
-		else:
-			if strict and headerValues[0] not in [Format.PCAP_MAGIC_NUMBER, Format.PCAP_NS_MAGIC_NUMBER]:
-				raise ValueError('PCAP header has invalid magic %X' % headerValues[0])
-
-			self._recordHeaderStruct = Format.PCAP_RECORD_HEADER_STRUCT
-
-		self._header = Format.PcapHeader(*headerValues)
+		self._header, self._recordHeaderStruct = _parseHeader(headerBytes, strict)
+		self._reader = _makeReader(pcapFile, blockSize, Format.PCAP_HEADER_STRUCT.size)
 
 	def header(self):
 		"""
@@ -61,52 +233,625 @@ class PcapParser(object):
 		"""
 		return self._header
 
+	def index(self):
+		"""
+		Returns the index used for seeking, if any.
+
+		:return: PcapIndex or None
+		"""
+		return self._index
+
+	def setIndex(self, index):
+		"""
+		Sets the index used for seeking.
+
+		:param index: PcapIndex or None
+		"""
+		self._index = index
+
+	def truncatedBytes(self):
+		"""
+		Returns the number of bytes of the incomplete record which ended parsing, if any (see allowTruncated).
+
+		:return: int
+		"""
+		return self._truncatedBytes
+
+	def _seek(self, offset):
+		self._pcapFile.seek(offset)
+		self._reader = _makeReader(self._pcapFile, self._blockSize, offset)
+
+	def _skipRecord(self):
+		"""
+		Skips the next record.
+
+		:return: int The timestamp of the skipped record, or None at EOF
+		"""
+		recordHeaderBytes = self._reader.read(self._recordHeaderStruct.size)
+		if len(recordHeaderBytes) != self._recordHeaderStruct.size:
+			return None
+
+		tsSec, tsFrac, includedLength, _ = self._recordHeaderStruct.unpack(recordHeaderBytes)
+		self._reader.read(includedLength)
+		return tsSec * Format.NANOS_PER_SECOND + tsFrac * self._header.fracNanos()
+
+	def seekRecord(self, recordNumber):
+		"""
+		Positions the parser so that parsing resumes at the given record number (starting at 0), using
+		the index to skip most of the preceding records. The file must be seekable.
+
+		:param recordNumber: int
+		"""
+		entry = self._index.findRecord(recordNumber) if self._index is not None else None
+		offset, currentRecordNumber = entry if entry is not None else (Format.PCAP_HEADER_STRUCT.size, 0)
+
+		self._seek(offset)
+		while currentRecordNumber < recordNumber and self._skipRecord() is not None:
+			currentRecordNumber += 1
+
+	def seekTime(self, epochNanos):
+		"""
+		Positions the parser so that parsing resumes at the first record at or after the given time,
+		using the index to skip most of the preceding records. The file must be seekable.
+
+		NOTE: for captures not in time order, later records may still be earlier than the given time.
+
+		:param epochNanos: int
+		"""
+		entry = self._index.findTime(epochNanos) if self._index is not None else None
+		offset = entry[0] if entry is not None else Format.PCAP_HEADER_STRUCT.size
+
+		self._seek(offset)
+		while True:
+			offset = self._reader.offset()
+			recordEpochNanos = self._skipRecord()
+			if recordEpochNanos is None:
+				break #EOF
+			elif recordEpochNanos >= epochNanos:
+				self._seek(offset)
+				break
+
 	def parse(self):
 		"""
 		Parses the PCAP file.
 
+		NOTE: in flyweight mode, the same record header is yielded each time (refilled with the next record).
+
 		:return: iterable of (PcapRecordHeader, data)
 		"""
+		reader = self._reader
+		recordHeaderSize = self._recordHeaderStruct.size
+		unpack = self._recordHeaderStruct.unpack
+		flyweight = Format.PcapFlyweightRecordHeader(0, 0, 0, 0, fileHeader=self._header) if self._flyweight else None
+
+		#Without blocks, read straight from the file object (keeping the reader's offset up to date inline), since
+		#a Python level call per read costs more than the reads themselves
+		direct = isinstance(reader, _StreamReader)
+		read = self._pcapFile.read if direct else reader.read
+
 		#And now, walk 1 record at a time
 		while True:
-			recordHeaderBytes = self._pcapFile.read(self._recordHeaderStruct.size)
+			recordHeaderBytes = read(recordHeaderSize)
 			if len(recordHeaderBytes) == 0:
 				break #EOF
-			elif len(recordHeaderBytes) != self._recordHeaderStruct.size:
+			elif len(recordHeaderBytes) != recordHeaderSize:
+				if self._allowTruncated:
+					self._truncatedBytes = len(recordHeaderBytes)
+					break
 				raise ValueError('Could not read comple PCAP record header (got only %d bytes)' % len(recordHeaderBytes))
 
-			recordHeader = Format.PcapRecordHeader(
-				*self._recordHeaderStruct.unpack(recordHeaderBytes),
-				fileHeader=self._header, strict=self._strict)
+			if flyweight is not None:
+				recordHeader = flyweight
+				if self._trusted:
+					recordHeader.refillUnchecked(*unpack(recordHeaderBytes))
+				else:
+					recordHeader.refill(*unpack(recordHeaderBytes), strict=self._strict)
+			elif self._trusted:
+				recordHeader = Format.PcapRecordHeader.unchecked(*unpack(recordHeaderBytes), fileHeader=self._header)
+			else:
+				recordHeader = Format.PcapRecordHeader(
+					*unpack(recordHeaderBytes),
+					fileHeader=self._header, strict=self._strict)
 
-			data = self._pcapFile.read(recordHeader.includedLength())
+			if direct:
+				data = read(recordHeader.includedLength())
+				reader._offset += recordHeaderSize + len(data)
+			else:
+				#Copy the data, since the reader reuses its buffer
+				data = bytes(read(recordHeader.includedLength()))
 			if len(data) != recordHeader.includedLength():
+				if self._allowTruncated:
+					self._truncatedBytes = recordHeaderSize + len(data)
+					break
 				raise ValueError('Could not read PCAP record data (expected %d bytes; got %d)' % (
 					recordHeader.includedLength(), len(data)))
 
 			yield (recordHeader, data)
 
-def parseFile(filename, listener, strict=False):
+	def parseBatches(self, batchSize=DEFAULT_BATCH_SIZE):
+		"""
+		Parses the PCAP file into batches of records, each with one contiguous data buffer.
+
+		:param batchSize: int The maximum number of records per batch
+		:return: iterable of PcapRecordBatch
+		"""
+		reader = self._reader
+		read = reader.read
+		recordHeaderSize = self._recordHeaderStruct.size
+		unpack = self._recordHeaderStruct.unpack
+		fracNanos = self._header.fracNanos()
+
+		eof = False
+		while not eof:
+			tsSecs = array.array(Format.BATCH_ARRAY_TYPECODE)
+			tsFracs = array.array(Format.BATCH_ARRAY_TYPECODE)
+			includedLengths = array.array(Format.BATCH_ARRAY_TYPECODE)
+			originalLengths = array.array(Format.BATCH_ARRAY_TYPECODE)
+			fileOffsets = array.array(Format.BATCH_ARRAY_TYPECODE)
+			data = bytearray()
+			dataOffsets = array.array(Format.BATCH_ARRAY_TYPECODE)
+
+			for _ in range(batchSize):
+				offset = reader.offset()
+				recordHeaderBytes = read(recordHeaderSize)
+				if len(recordHeaderBytes) == 0:
+					eof = True
+					break
+				elif len(recordHeaderBytes) != recordHeaderSize:
+					if self._allowTruncated:
+						self._truncatedBytes = len(recordHeaderBytes)
+						eof = True
+						break
+					raise ValueError('Could not read comple PCAP record header (got only %d bytes)' % len(recordHeaderBytes))
+
+				tsSec, tsFrac, includedLength, originalLength = unpack(recordHeaderBytes)
+				recordData = read(includedLength)
+				if len(recordData) != includedLength:
+					if self._allowTruncated:
+						self._truncatedBytes = recordHeaderSize + len(recordData)
+						eof = True
+						break
+					raise ValueError('Could not read PCAP record data (expected %d bytes; got %d)' % (
+						includedLength, len(recordData)))
+
+				tsSecs.append(tsSec)
+				tsFracs.append(tsFrac)
+				includedLengths.append(includedLength)
+				originalLengths.append(originalLength)
+				fileOffsets.append(offset)
+				dataOffsets.append(len(data))
+				data += recordData
+
+			if len(tsSecs) > 0:
+				batch = Format.PcapRecordBatch(self._header, tsSecs, tsFracs, Format.epochNanosArray(tsSecs, tsFracs, fracNanos),
+					includedLengths, originalLengths, fileOffsets, data, dataOffsets)
+				if not self._trusted:
+					batch.validate(strict=self._strict)
+				yield batch
+
+class PcapMmapParser(object):
+
+	def __init__(self, pcapFile, strict=False, index=None, trusted=False, flyweight=False):
+		"""
+		Instantiates a parser which memory maps the given file object. Record data is yielded as
+		memoryview slices into the map rather than copied bytes, so it is only touched when used.
+
+		NOTE: the file must be an uncompressed, regular file (anything with a real fileno()).
+
+		:param pcapFile: file object to parse from
+		:param strict: bool Indicating strict validation
+		:param index: PcapIndex The index to use for seeking (optional)
+		:param trusted: bool Indicating records should not be validated, e.g. for files written by this library
+		:param flyweight: bool Indicating parse() should reuse one PcapFlyweightRecordHeader for every record
+		"""
+		_checkValidation(strict, trusted)
+		self._strict = strict
+		self._trusted = trusted
+		self._flyweight = flyweight
+		self._index = index
+		self._offset = Format.PCAP_HEADER_STRUCT.size
+
+		size = os.fstat(pcapFile.fileno()).st_size
+		if size < Format.PCAP_HEADER_STRUCT.size:
+			raise ValueError('Could not read comple PCAP header (got only %d bytes)' % size)
+
+		self._map = mmap.mmap(pcapFile.fileno(), 0, access=mmap.ACCESS_READ)
+		self._data = memoryview(self._map)
+		self._endOffset = size
+
+		self._header, self._recordHeaderStruct = _parseHeader(self._data, strict)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, excType, excValue, traceback):
+		self.close()
+
+	def close(self):
+		"""
+		Releases the memory map. If any record data is still referenced (e.g. by a listener), the
+		map stays alive until the last of it is released.
+		"""
+		if self._data is None:
+			return
+
+		self._data.release()
+		self._data = None
+		try:
+			self._map.close()
+		except BufferError:
+			pass #Slices are still exported -- the map is freed when they are collected
+
+	def header(self):
+		"""
+		Returns the PCAP file header.
+
+		:return: PcapHeader
+		"""
+		return self._header
+
+	def index(self):
+		"""
+		Returns the index used for seeking, if any.
+
+		:return: PcapIndex or None
+		"""
+		return self._index
+
+	def setIndex(self, index):
+		"""
+		Sets the index used for seeking.
+
+		:param index: PcapIndex or None
+		"""
+		self._index = index
+
+	def _recordAt(self, offset):
+		"""
+		Reads the timestamp and length of the record at the given offset.
+
+		:param offset: int
+		:return: (epochNanos, recordLength) or None at EOF
+		"""
+		if len(self._data) - offset < self._recordHeaderStruct.size:
+			return None
+
+		tsSec, tsFrac, includedLength, _ = self._recordHeaderStruct.unpack_from(self._data, offset)
+		epochNanos = tsSec * Format.NANOS_PER_SECOND + tsFrac * self._header.fracNanos()
+		return (epochNanos, self._recordHeaderStruct.size + includedLength)
+
+	def size(self):
+		"""
+		Returns the size of the mapped file.
+
+		:return: int
+		"""
+		return len(self._data)
+
+	def setRange(self, startOffset, endOffset):
+		"""
+		Restricts parsing to the records starting at or after startOffset and before endOffset. Both
+		should be record boundaries (or the end of the file), e.g. from findRecordBoundary().
+
+		:param startOffset: int
+		:param endOffset: int
+		"""
+		self._offset = max(startOffset, Format.PCAP_HEADER_STRUCT.size)
+		self._endOffset = min(endOffset, len(self._data))
+
+	def _isPlausibleRecord(self, offset, maxIncludedLength, minTsSec, maxTsSec):
+		"""
+		Checks if the bytes at the given offset could be a record header.
+
+		:param offset: int
+		:param maxIncludedLength: int
+		:param minTsSec: int The earliest plausible timestamp seconds
+		:param maxTsSec: int or None The latest plausible timestamp seconds
+		:return: (tsSec, recordLength) or None if the record is not plausible
+		"""
+		if len(self._data) - offset < self._recordHeaderStruct.size:
+			return None
+
+		tsSec, tsFrac, includedLength, originalLength = self._recordHeaderStruct.unpack_from(self._data, offset)
+		if tsFrac >= self._header.timeResolution() or includedLength > maxIncludedLength or includedLength > originalLength:
+			return None
+		elif tsSec < minTsSec or (maxTsSec is not None and tsSec > maxTsSec):
+			return None
+
+		recordLength = self._recordHeaderStruct.size + includedLength
+		if offset + recordLength > len(self._data):
+			return None
+		return (tsSec, recordLength)
+
+	def findRecordBoundary(self, offset, records=DEFAULT_RESYNC_RECORDS):
+		"""
+		Finds the first record boundary at or after the given offset, without parsing from the start of
+		the file. A boundary is accepted when it begins a chain of plausible record headers (see the RESYNC_*
+		constants) that is the given number of records long or ends exactly at the end of the file.
+
+		NOTE: this is a heuristic -- packet data which happens to look like a chain of record headers will
+		be mistaken for a boundary. Real boundaries failing the checks (e.g. after a long gap) are skipped,
+		which is harmless for sharding. Use an index for exact boundaries.
+
+		:param offset: int
+		:param records: int The number of consecutive plausible records required
+		:return: int The offset of the boundary, or the size of the file if none was found
+		"""
+		size = len(self._data)
+		start = Format.PCAP_HEADER_STRUCT.size
+		if size - start < self._recordHeaderStruct.size:
+			return size
+
+		#Anchoring to the first record rejects chains misaligned within record headers, whose "seconds" are
+		#really fractions or lengths
+		maxIncludedLength = max(self._header.snaplen(), RESYNC_MAX_RECORD_LENGTH)
+		minTsSec = self._recordHeaderStruct.unpack_from(self._data, start)[0] - RESYNC_MAX_GAP_SECONDS
+
+		for candidate in range(max(offset, start), size):
+			record = self._isPlausibleRecord(candidate, maxIncludedLength, minTsSec, None)
+			if record is None:
+				continue
+
+			chainMinTsSec = record[0] - RESYNC_MAX_GAP_SECONDS
+			chainMaxTsSec = record[0] + RESYNC_MAX_GAP_SECONDS
+			current = candidate + record[1]
+			for _ in range(records - 1):
+				if current == size:
+					break
+				record = self._isPlausibleRecord(current, maxIncludedLength, chainMinTsSec, chainMaxTsSec)
+				if record is None:
+					break
+				current += record[1]
+			else:
+				return candidate
+
+			if current == size:
+				return candidate
+
+		return size
+
+	def seekRecord(self, recordNumber):
+		"""
+		Positions the parser so that parsing resumes at the given record number (starting at 0), using
+		the index to skip most of the preceding records.
+
+		:param recordNumber: int
+		"""
+		entry = self._index.findRecord(recordNumber) if self._index is not None else None
+		offset, currentRecordNumber = entry if entry is not None else (Format.PCAP_HEADER_STRUCT.size, 0)
+
+		while currentRecordNumber < recordNumber:
+			record = self._recordAt(offset)
+			if record is None:
+				break #EOF
+			offset = min(offset + record[1], len(self._data))
+			currentRecordNumber += 1
+		self._offset = offset
+
+	def seekTime(self, epochNanos):
+		"""
+		Positions the parser so that parsing resumes at the first record at or after the given time,
+		using the index to skip most of the preceding records.
+
+		NOTE: for captures not in time order, later records may still be earlier than the given time.
+
+		:param epochNanos: int
+		"""
+		entry = self._index.findTime(epochNanos) if self._index is not None else None
+		offset = entry[0] if entry is not None else Format.PCAP_HEADER_STRUCT.size
+
+		while True:
+			record = self._recordAt(offset)
+			if record is None or record[0] >= epochNanos:
+				break
+			offset = min(offset + record[1], len(self._data))
+		self._offset = offset
+
+	def parse(self):
+		"""
+		Parses the PCAP file.
+
+		NOTE: in flyweight mode, the same record header is yielded each time (refilled with the next record).
+
+		:return: iterable of (PcapRecordHeader, memoryview)
+		"""
+		data = self._data
+		size = len(data)
+		fileHeader = self._header
+		strict = self._strict
+		trusted = self._trusted
+		recordHeaderSize = self._recordHeaderStruct.size
+		unpackFrom = self._recordHeaderStruct.unpack_from
+		unchecked = Format.PcapRecordHeader.unchecked
+		flyweight = Format.PcapFlyweightRecordHeader(0, 0, 0, 0, fileHeader=fileHeader) if self._flyweight else None
+
+		endOffset = self._endOffset
+		offset = self._offset
+		while offset < endOffset:
+			if size - offset < recordHeaderSize:
+				raise ValueError('Could not read comple PCAP record header (got only %d bytes)' % (size - offset))
+
+			if flyweight is not None:
+				recordHeader = flyweight
+				if trusted:
+					recordHeader.refillUnchecked(*unpackFrom(data, offset))
+				else:
+					recordHeader.refill(*unpackFrom(data, offset), strict=strict)
+			elif trusted:
+				recordHeader = unchecked(*unpackFrom(data, offset), fileHeader=fileHeader)
+			else:
+				recordHeader = Format.PcapRecordHeader(*unpackFrom(data, offset), fileHeader=fileHeader, strict=strict)
+			offset += recordHeaderSize
+
+			end = offset + recordHeader.includedLength()
+			if end > size:
+				raise ValueError('Could not read PCAP record data (expected %d bytes; got %d)' % (
+					recordHeader.includedLength(), size - offset))
+
+			yield (recordHeader, data[offset:end])
+			offset = end
+
+	def parseBatches(self, batchSize=DEFAULT_BATCH_SIZE):
+		"""
+		Parses the PCAP file into batches of records. Rather than copying, the data buffer of each batch
+		is a memoryview of the mapped region spanned by its records.
+
+		:param batchSize: int The maximum number of records per batch
+		:return: iterable of PcapRecordBatch
+		"""
+		data = self._data
+		size = len(data)
+		recordHeaderSize = self._recordHeaderStruct.size
+		unpackFrom = self._recordHeaderStruct.unpack_from
+		fracNanos = self._header.fracNanos()
+
+		endOffset = self._endOffset
+		offset = self._offset
+		while offset < endOffset:
+			tsSecs = array.array(Format.BATCH_ARRAY_TYPECODE)
+			tsFracs = array.array(Format.BATCH_ARRAY_TYPECODE)
+			includedLengths = array.array(Format.BATCH_ARRAY_TYPECODE)
+			originalLengths = array.array(Format.BATCH_ARRAY_TYPECODE)
+			fileOffsets = array.array(Format.BATCH_ARRAY_TYPECODE)
+			dataOffsets = array.array(Format.BATCH_ARRAY_TYPECODE)
+
+			batchStart = offset
+			for _ in range(batchSize):
+				if offset >= endOffset:
+					break
+				elif size - offset < recordHeaderSize:
+					raise ValueError('Could not read comple PCAP record header (got only %d bytes)' % (size - offset))
+
+				tsSec, tsFrac, includedLength, originalLength = unpackFrom(data, offset)
+				end = offset + recordHeaderSize + includedLength
+				if end > size:
+					raise ValueError('Could not read PCAP record data (expected %d bytes; got %d)' % (
+						includedLength, size - offset - recordHeaderSize))
+
+				tsSecs.append(tsSec)
+				tsFracs.append(tsFrac)
+				includedLengths.append(includedLength)
+				originalLengths.append(originalLength)
+				fileOffsets.append(offset)
+				dataOffsets.append(offset + recordHeaderSize - batchStart)
+
+				offset = end
+
+			batch = Format.PcapRecordBatch(self._header, tsSecs, tsFracs, Format.epochNanosArray(tsSecs, tsFracs, fracNanos),
+				includedLengths, originalLengths, fileOffsets, data[batchStart:offset], dataOffsets)
+			if not self._trusted:
+				batch.validate(strict=self._strict)
+			yield batch
+
+def parseFile(filename, listener, strict=False, mmap=False, batchSize=DEFAULT_BATCH_SIZE, blockSize=None,
+		startRecord=None, startTime=None, readahead=0, follow=False, pollInterval=Follow.DEFAULT_POLL_INTERVAL,
+		maxPollInterval=Follow.DEFAULT_MAX_POLL_INTERVAL, idleTimeout=None, onPoll=None, trusted=False, flyweight=False):
 	"""
-	Parse a PCAP with the given filename.
+	Parse a PCAP with the given filename. Compressed files are decompressed based on their extension
+	(see Compression.CODECS).
+
+	When starting at a given record or time, the sidecar index (see Index.indexFileName) is used to
+	skip most of the file if it exists and is still fresh.
+
+	When following, the file is parsed as it is written (see Follow.FollowFile), until it has been idle
+	for idleTimeout seconds. Listeners implementing onPcapRecordBatch only see each batch once it is full.
+	If the file stops being written in the middle of a record, parsing stops after the last complete one.
 
 	:param filename: str The file to parse
 	:param listener: PcapListener
 	:param strict: bool Indicating strict validation
+	:param mmap: bool Indicating the file should be memory mapped (ignored for compressed files)
+	:param batchSize: int The maximum number of records per batch for listeners implementing onPcapRecordBatch
+	:param blockSize: int The size of the blocks to read, or 0 to read each record directly (ignored when memory mapped;
+		defaults to DEFAULT_BLOCK_SIZE for compressed files, where blocks are faster, and 0 otherwise)
+	:param startRecord: int The number of the first record to parse (optional)
+	:param startTime: int The epoch nanoseconds of the earliest record to parse (optional)
+	:param readahead: int The number of blocks to decompress ahead on a background thread (compressed files only; ignored when seeking)
+	:param follow: bool Indicating the file should be followed as it is written (uncompressed files only; disables mmap)
+	:param pollInterval: float The initial interval between polls for more data when following, in seconds
+	:param maxPollInterval: float The maximum interval between polls when following, in seconds
+	:param idleTimeout: float The number of idle seconds after which following stops (None follows forever)
+	:param onPoll: callable Called before each wait for more data when following (optional)
+	:param trusted: bool Indicating records should not be validated, e.g. for files written by this library
+	:param flyweight: bool Indicating one record header should be reused for every record passed to onPcapRecord,
+		so listeners must copy() record headers they keep (see Format.PcapFlyweightRecordHeader)
+	:return: int The number of bytes of an incomplete record left unparsed at the end of a followed file (otherwise 0)
 	"""
-	with gzip.open(filename, 'rb') if filename.endswith('.gz') else open(filename, 'rb') as pcapFile:
-		parse(pcapFile, listener, strict=strict)
+	if startRecord is not None and startTime is not None:
+		raise ValueError('Only one of startRecord and startTime may be given')
+
+	seeking = startRecord is not None or startTime is not None
+	index = Index.loadIndexFile(filename) if seeking else None
+
+	extension = Compression.codecExtension(filename)
+	if follow and extension is not None:
+		raise ValueError('Compressed files cannot be followed')
 
-def parse(pcapFile, listener, strict=False):
+	if blockSize is None:
+		blockSize = DEFAULT_BLOCK_SIZE if extension is not None else 0
+
+	with open(filename, 'rb') as rawFile, contextlib.ExitStack() as stack:
+		if extension is None:
+			pcapFile = rawFile
+			if follow:
+				pcapFile = stack.enter_context(Follow.FollowFile(rawFile, pollInterval=pollInterval,
+					maxPollInterval=maxPollInterval, idleTimeout=idleTimeout, onPoll=onPoll))
+		elif extension == '.gz' and seeking:
+			#Checkpoints allow starting to inflate at the gzip member closest to the target
+			gzipMembers = index.gzipMembers() if index is not None else None
+			pcapFile = stack.enter_context(Index.GzipCheckpointFile(rawFile, gzipMembers=gzipMembers))
+		else:
+			pcapFile = stack.enter_context(Compression.CODECS[extension](rawFile, 'rb'))
+
+			if readahead > 0 and not seeking:
+				bufferSize = blockSize or Compression.DEFAULT_READAHEAD_BUFFER_SIZE
+				pcapFile = stack.enter_context(Compression.ReadaheadFile(pcapFile, bufferSize=bufferSize, queueDepth=readahead))
+
+		if mmap and extension is None and not follow:
+			parser = stack.enter_context(PcapMmapParser(pcapFile, strict=strict, index=index, trusted=trusted, flyweight=flyweight))
+		else:
+			parser = PcapParser(pcapFile, strict=strict, blockSize=blockSize, index=index, trusted=trusted, flyweight=flyweight,
+				allowTruncated=follow)
+
+		if startRecord is not None:
+			parser.seekRecord(startRecord)
+		elif startTime is not None:
+			parser.seekTime(startTime)
+
+		_dispatch(parser, listener, batchSize)
+		return parser.truncatedBytes() if follow else 0
+
+def parse(pcapFile, listener, strict=False, batchSize=DEFAULT_BATCH_SIZE, blockSize=0, trusted=False, flyweight=False):
 	"""
 	Parse a PCAP from the given file-like object (file, socket, etc.)
 
 	:param pcapFile: file-like object to parse from
 	:param listener: PcapListener
 	:param strict: bool Indicating strict validation
+	:param batchSize: int The maximum number of records per batch for listeners implementing onPcapRecordBatch
+	:param blockSize: int The size of the blocks to read, or 0 to read each record directly
+	:param trusted: bool Indicating records should not be validated, e.g. for files written by this library
+	:param flyweight: bool Indicating one record header should be reused for every record passed to onPcapRecord,
+		so listeners must copy() record headers they keep (see Format.PcapFlyweightRecordHeader)
+	"""
+	parser = PcapParser(pcapFile, strict=strict, blockSize=blockSize, trusted=trusted, flyweight=flyweight)
+	_dispatch(parser, listener, batchSize)
+
+def _dispatch(parser, listener, batchSize):
+	"""
+	Feeds the events from a parser to a listener, in batches if the listener supports them.
+
+	:param parser: PcapParser or PcapMmapParser
+	:param listener: PcapListener
+	:param batchSize: int The maximum number of records per batch
 	"""
-	parser = PcapParser(pcapFile, strict=strict)
 	listener.onPcapHeader(parser.header())
 
-	for recordHeader, data in parser.parse():
-		listener.onPcapRecord(recordHeader, data)
+	onPcapRecordBatch = getattr(listener, 'onPcapRecordBatch', None)
+	if onPcapRecordBatch is not None:
+		for batch in parser.parseBatches(batchSize):
+			onPcapRecordBatch(batch)
+	else:
+		onPcapRecord = listener.onPcapRecord
+		for recordHeader, data in parser.parse():
+			onPcapRecord(recordHeader, data)
@@ -0,0 +1,59 @@
+
+# Copyright (c) 2015-2023 Agalmic Ventures LLC (www.agalmicventures.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import collections
+import functools
+
+DEFAULT_CACHE_SIZE = 4096
+
+#Memoized functions by name
+_caches = collections.OrderedDict()
+
+def memoize(name, maxSize=DEFAULT_CACHE_SIZE):
+	"""
+	Returns a decorator which memoizes a function of hashable arguments (e.g. addresses as bytes) in a bounded
+	cache, which evicts the least recently used results and counts hits and misses.
+
+	:param name: str name of the cache (see cacheInfo)
+	:param maxSize: int the most results to keep
+	:return: function
+	"""
+	def decorator(function):
+		cached = functools.lru_cache(maxsize=maxSize)(function)
+		_caches[name] = cached
+		return cached
+
+	return decorator
+
+def cacheInfo():
+	"""
+	Returns the statistics of each cache.
+
+	:return: dict from str name to functools CacheInfo (hits, misses, maxsize, currsize)
+	"""
+	return collections.OrderedDict((name, cached.cache_info()) for name, cached in _caches.items())
+
+def clearCaches():
+	"""
+	Clears every cache, including its statistics.
+	"""
+	for cached in _caches.values():
+		cached.cache_clear()
@@ -19,38 +19,83 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from . import IPv4
+import struct
+
+from . import AddressCache, IPv4, IPv6
 
 #TODO: parse MAC address
-#TODO: support https://en.wikipedia.org/wiki/IEEE_802.1Q
+
+@AddressCache.memoize('Ethernet.macAddressToString')
+def _macAddressToString(mac, separator):
+	return separator.join('%02X' % b for b in mac)
+
+@AddressCache.memoize('Ethernet.macPairToKey')
+def _macPairToKey(lower, upper, separator):
+	return ''.join([_macAddressToString(lower, ':'), separator, _macAddressToString(upper, ':')])
 
 def macAddressToString(mac, separator=':'):
 	"""
-	Converts a MAC address from bytes into a string.
+	Converts a MAC address from bytes into a string (memoized, see AddressCache).
 
 	:param mac: bytes
 	:param separator: str
 	:return: str
 	"""
-	return separator.join('%02X' % b for b in mac)
+	return _macAddressToString(bytes(mac), separator)
 
 def macPairToKey(mac1, mac2, separator='_'):
 	"""
-	Converts a pair of MAC addresses from bytes into a key.
+	Converts a pair of MAC addresses from bytes into a key (memoized, see AddressCache).
 
 	:param mac1: bytes
 	:param mac2: bytes
 	:param separator: str
 	:return: str
 	"""
+	#Copy any views so the cache neither holds onto buffers nor compares views
+	mac1 = bytes(mac1)
+	mac2 = bytes(mac2)
 	if mac1 < mac2:
-		lower = mac1
-		upper = mac2
+		return _macPairToKey(mac1, mac2, separator)
 	else:
-		lower = mac2
-		upper = mac1
+		return _macPairToKey(mac2, mac1, separator)
 
-	return ''.join([macAddressToString(lower), separator, macAddressToString(upper)])
+def macKeyBytesToKey(keyBytes, separator='_'):
+	"""
+	Converts a pair of MAC addresses from the bytes of EthernetPacket.keyBytes into a key.
+
+	:param keyBytes: bytes
+	:param separator: str
+	:return: str
+	"""
+	return macPairToKey(keyBytes[0:6], keyBytes[6:12], separator=separator)
+
+def vlanIdsToString(vlanIds, separator='.'):
+	"""
+	Converts a stack of VLAN IDs (outermost first) into a string.
+
+	:param vlanIds: tuple of int
+	:param separator: str
+	:return: str
+	"""
+	return separator.join('%d' % vlanId for vlanId in vlanIds)
+
+def vlanKeyBytesToKey(keyBytes, separator='_'):
+	"""
+	Converts VLAN IDs and a pair of MAC addresses from the bytes of EthernetPacket.vlanKeyBytes into a key, which
+	is the same as the MAC address key for untagged frames.
+
+	:param keyBytes: bytes
+	:param separator: str
+	:return: str
+	"""
+	vlanCount = keyBytes[0]
+	macKey = macKeyBytesToKey(keyBytes[1 + 2 * vlanCount:], separator=separator)
+	if vlanCount == 0:
+		return macKey
+
+	vlanIds = struct.unpack_from('!%dH' % vlanCount, keyBytes, 1)
+	return ''.join(['vlan', vlanIdsToString(vlanIds), separator, macKey])
 
 ########## Types ##########
 
@@ -59,6 +104,8 @@ class Ethertype(object):
 	Represents an Ethertype.
 	"""
 
+	__slots__ = ('_id', '_protocol', '_packetType')
+
 	def __init__(self, id, protocol, packetType=None):
 		self._id = id
 		self._protocol = protocol
@@ -98,9 +145,11 @@ ETHERTYPES = [
 	Ethertype(0x809B, 'Apple Talk'),
 	Ethertype(0x80F3, 'Apple Talk ARP'),
 	Ethertype(0x8100, 'VLAN-tagged Frame'),
+	Ethertype(0x88A8, 'Provider Bridging (QinQ)'),
+	Ethertype(0x9100, 'VLAN-tagged Frame (Legacy QinQ)'),
 	Ethertype(0x8137, 'IPX'),
 	Ethertype(0x8204, 'QNX Qnet'),
-	Ethertype(0x86DD, 'IPv6'),
+	Ethertype(0x86DD, 'IPv6', packetType=IPv6.IPv6Packet),
 	Ethertype(0x8808, 'Ethernet Flow Control'),
 	Ethertype(0x8819, 'CobraNet'),
 	Ethertype(0x8847, 'MPLS Unicast'),
@@ -124,21 +173,83 @@ for ethertype in ETHERTYPES:
 	assert(ethertype.protocol() not in ETHERTYPE_PROTOCOL_TO_ETHERTYPE)
 	ETHERTYPE_PROTOCOL_TO_ETHERTYPE[ethertype.protocol()] = ethertype
 
+#Tags which are skipped to find the inner ethertype
+VLAN_ETHERTYPE_IDS = frozenset([0x8100, 0x88A8, 0x9100])
+MPLS_ETHERTYPE_IDS = frozenset([0x8847, 0x8848])
+
+#MPLS doesn't say what is below the label stack, so guess from the IP version
+MPLS_IP_VERSION_TO_ETHERTYPE_ID = {
+	4: 0x0800,
+	6: 0x86DD,
+}
+
 ########## Packet ##########
 
 class EthernetPacket(object):
 	"""
-	Represents an Ethernet packet and allows extracting its information.
+	Represents an Ethernet packet and allows extracting its information. Any VLAN tags and MPLS labels are skipped
+	to find the inner ethertype, and the payload decoded (see payloadPacket), on first access.
 
 	https://en.wikipedia.org/wiki/Ethernet_frame
 	"""
 
 	LINKTYPE = 1
 
+	HEADER_LENGTH = 14
+
+	__slots__ = ('_data', '_key', '_ethertype', '_innerEthertypeId', '_payloadOffset', '_vlanIds', '_mplsLabels',
+		'_payloadPacket')
+
 	def __init__(self, data):
-		self._data = data
+		self._data = memoryview(data)
 		self._key = None
 		self._ethertype = None
+		self._innerEthertypeId = None
+		self._payloadOffset = None
+		self._vlanIds = None
+		self._mplsLabels = None
+		self._payloadPacket = None
+
+	def _walkTags(self):
+		"""
+		Skips the VLAN tags and MPLS labels after the MAC addresses, reading each from the data directly.
+		"""
+		data = self._data
+		end = len(data)
+		if end < 14:
+			#Truncated frames are treated as untagged, with an empty payload and no ethertype
+			self._innerEthertypeId = 0
+			self._payloadOffset = end
+			self._vlanIds = ()
+			self._mplsLabels = ()
+			return
+
+		offset = 12
+		ethertypeId = data[12] << 8 | data[13]
+
+		vlanIds = []
+		while ethertypeId in VLAN_ETHERTYPE_IDS and offset + 6 <= end:
+			vlanIds.append((data[offset + 2] & 0x0F) << 8 | data[offset + 3])
+			offset += 4
+			ethertypeId = data[offset] << 8 | data[offset + 1]
+		offset += 2
+
+		mplsLabels = []
+		if ethertypeId in MPLS_ETHERTYPE_IDS:
+			while offset + 4 <= end:
+				mplsLabels.append(data[offset] << 12 | data[offset + 1] << 4 | data[offset + 2] >> 4)
+				bottomOfStack = data[offset + 2] & 0x01
+				offset += 4
+				if bottomOfStack:
+					break
+
+			if offset < end:
+				ethertypeId = MPLS_IP_VERSION_TO_ETHERTYPE_ID.get(data[offset] >> 4, ethertypeId)
+
+		self._innerEthertypeId = ethertypeId
+		self._payloadOffset = min(offset, end)
+		self._vlanIds = tuple(vlanIds)
+		self._mplsLabels = tuple(mplsLabels)
 
 	def key(self):
 		"""
@@ -151,41 +262,90 @@ class EthernetPacket(object):
 
 		return self._key
 
-	def destinationMac(self):
+	def keyBytes(self):
+		"""
+		Returns this packet's MAC addresses (in the same order for both directions) as 12 bytes which are equal
+		exactly when the keys are, e.g. for hashing flows without formatting their keys. keyToString converts
+		them into the key.
+
+		:return: bytes
+		"""
+		macs = bytes(self._data[0:12])
+		return macs if macs[0:6] <= macs[6:12] else macs[6:12] + macs[0:6]
+
+	def keyInt(self):
 		"""
-		Extracts the destination MAC address from the data.
+		Returns this packet's MAC addresses (in the same order for both directions) as a 96 bit integer.
+
+		:return: int
+		"""
+		return int.from_bytes(self.keyBytes(), 'big')
+
+	@staticmethod
+	def keyToString(keyBytes):
+		"""
+		Converts the result of keyBytes into the same string as key.
+
+		:param keyBytes: bytes
+		:return: str
+		"""
+		return macKeyBytesToKey(keyBytes)
+
+	def vlanKeyBytes(self):
+		"""
+		Returns this packet's VLAN IDs and MAC addresses as bytes which are equal exactly when both are, e.g. for
+		hashing flows by VLAN. vlanKeyToString converts them into a key.
 
 		:return: bytes
 		"""
+		vlanIds = self.vlanIds()
+		return struct.pack('!B%dH' % len(vlanIds), len(vlanIds), *vlanIds) + self.keyBytes()
+
+	@staticmethod
+	def vlanKeyToString(keyBytes):
+		"""
+		Converts the result of vlanKeyBytes into a key, e.g. vlan100_02:00:00:00:00:01_02:00:00:00:00:02.
+
+		:param keyBytes: bytes
+		:return: str
+		"""
+		return vlanKeyBytesToKey(keyBytes)
+
+	def destinationMac(self):
+		"""
+		Extracts the destination MAC address from the data (as a view, without copying).
+
+		:return: memoryview
+		"""
 		return self._data[0:6]
 
 	def sourceMac(self):
 		"""
-		Extracts the source MAC address from the data.
+		Extracts the source MAC address from the data (as a view, without copying).
 
-		:return: bytes
+		:return: memoryview
 		"""
 		return self._data[6:12]
 
 	def ethertypeBytes(self):
 		"""
-		Extracts the source MAC address from the data.
+		Extracts the ethertype from the data (as a view, without copying).
 
-		:return: bytes
+		:return: memoryview
 		"""
 		return self._data[12:14]
 
 	def ethertypeId(self):
 		"""
-		Returns the ethertype as a numeric value.
+		Returns the (outer) ethertype as a numeric value.
 
 		:return: int
 		"""
-		return self._data[12] * 256 + self._data[13]
+		return self._data[12] << 8 | self._data[13]
 
 	def ethertype(self):
 		"""
-		Returns the ethertype as an object with useful helpers.
+		Returns the (outer) ethertype as an object with useful helpers.
 
 		:return: Ethertype
 		"""
@@ -194,18 +354,100 @@ class EthernetPacket(object):
 
 		return self._ethertype
 
+	def innerEthertypeId(self):
+		"""
+		Returns the ethertype of the payload after any VLAN tags and MPLS labels as a numeric value. Below MPLS
+		labels, this is guessed from the IP version, and otherwise left as the MPLS ethertype. Frames too short to
+		have an ethertype have 0.
+
+		:return: int
+		"""
+		if self._innerEthertypeId is None:
+			self._walkTags()
+
+		return self._innerEthertypeId
+
+	def innerEthertype(self):
+		"""
+		Returns the ethertype of the payload after any VLAN tags and MPLS labels as an object with useful helpers.
+
+		:return: Ethertype
+		"""
+		return ETHERTYPE_ID_TO_ETHERTYPE.get(self.innerEthertypeId())
+
+	def vlanIds(self):
+		"""
+		Returns the VLAN IDs of any 802.1Q or QinQ tags, outermost first.
+
+		:return: tuple of int
+		"""
+		if self._vlanIds is None:
+			self._walkTags()
+
+		return self._vlanIds
+
+	def vlanId(self):
+		"""
+		Returns the VLAN ID of the outermost tag, if any.
+
+		:return: int or None
+		"""
+		vlanIds = self.vlanIds()
+		return vlanIds[0] if len(vlanIds) > 0 else None
+
+	def mplsLabels(self):
+		"""
+		Returns the labels of the MPLS label stack, if any, outermost first.
+
+		:return: tuple of int
+		"""
+		if self._mplsLabels is None:
+			self._walkTags()
+
+		return self._mplsLabels
+
+	def payloadOffset(self):
+		"""
+		Returns the offset of the payload after any VLAN tags and MPLS labels.
+
+		:return: int
+		"""
+		if self._payloadOffset is None:
+			self._walkTags()
+
+		return self._payloadOffset
+
 	def payload(self):
 		"""
-		Extracts the payload from the data.
+		Extracts the payload after any VLAN tags and MPLS labels from the data (as a view, without copying),
+		assuming the frame check sequence was captured.
 
-		:return: bytes
+		:return: memoryview
+		"""
+		return self._data[self.payloadOffset():-4]
+
+	def payloadPacket(self):
+		"""
+		Decodes the payload by its inner ethertype (see ETHERTYPES), unless it is unsupported or too short. This
+		does not assume the frame check sequence was captured, since the network layer knows its own length.
+
+		:return: IPv4Packet, IPv6Packet, or None
 		"""
-		return self._data[14:-4]
+		if self._payloadPacket is None:
+			ethertype = self.innerEthertype()
+			packetType = ethertype.packetType() if ethertype is not None else None
+			payloadOffset = self._payloadOffset
+			if packetType is None or len(self._data) < payloadOffset + packetType.HEADER_LENGTH:
+				return None
+
+			self._payloadPacket = packetType(self._data[payloadOffset:])
+
+		return self._payloadPacket
 
 	def crcBytes(self):
 		"""
-		Extracts the source MAC address from the data.
+		Extracts the frame check sequence from the data (as a view, without copying).
 
-		:return: bytes
+		:return: memoryview
 		"""
 		return self._data[-4:]
@@ -19,52 +19,148 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import struct
+
+from . import AddressCache, TCP, UDP
+
+@AddressCache.memoize('IPv4.ipAddressToString')
+def _ipAddressToString(ip, separator):
+	return separator.join('%d' % b for b in ip)
+
+@AddressCache.memoize('IPv4.ipPairToKey')
+def _ipPairToKey(lower, upper, separator):
+	return ''.join([_ipAddressToString(lower, '.'), separator, _ipAddressToString(upper, '.')])
+
 def ipAddressToString(ip, separator='.'):
 	"""
-	Converts an IPv4 address from bytes into a string.
+	Converts an IPv4 address from bytes into a string (memoized, see AddressCache).
 
 	:param ip: bytes
 	:param separator: str
 	:return: str
 	"""
-	return separator.join('%d' % b for b in ip)
+	return _ipAddressToString(bytes(ip), separator)
 
 def ipPairToKey(ip1, ip2, separator='_'):
 	"""
-	Converts a pair of IPv4 addresses from bytes into a key.
+	Converts a pair of IPv4 addresses from bytes into a key (memoized, see AddressCache).
 
 	:param ip1: bytes
 	:param ip2: bytes
 	:param separator: str
 	:return: str
 	"""
+	#Copy any views so the cache neither holds onto buffers nor compares views
+	ip1 = bytes(ip1)
+	ip2 = bytes(ip2)
 	if ip1 < ip2:
-		lower = ip1
-		upper = ip2
+		return _ipPairToKey(ip1, ip2, separator)
 	else:
-		lower = ip2
-		upper = ip1
+		return _ipPairToKey(ip2, ip1, separator)
+
+def ipKeyBytesToKey(keyBytes, separator='_'):
+	"""
+	Converts a pair of IPv4 addresses from the bytes of IPv4Packet.keyBytes into a key.
+
+	:param keyBytes: bytes
+	:param separator: str
+	:return: str
+	"""
+	return ipPairToKey(keyBytes[0:4], keyBytes[4:8], separator=separator)
+
+########## Types ##########
+
+class IpProtocol(object):
+	"""
+	Represents an IP protocol (the protocol field of IPv4 or the next header field of IPv6).
+	"""
+
+	__slots__ = ('_id', '_protocol', '_packetType')
+
+	def __init__(self, id, protocol, packetType=None):
+		self._id = id
+		self._protocol = protocol
+		self._packetType = packetType
+
+	def id(self):
+		"""
+		Returns the numeric value of the IP protocol.
+
+		:return: int
+		"""
+		return self._id
+
+	def protocol(self):
+		"""
+		Returns the name of the IP protocol.
 
-	return ''.join([ipAddressToString(lower), separator, ipAddressToString(upper)])
+		:return: str
+		"""
+		return self._protocol
+
+	def packetType(self):
+		"""
+		Returns the class of the Packet of this IP protocol.
+
+		:return: Packet or None
+		"""
+		return self._packetType
+
+IP_PROTOCOLS = [
+	IpProtocol(1, 'ICMP'),
+	IpProtocol(2, 'IGMP'),
+	IpProtocol(4, 'IPv4 Encapsulation'),
+	IpProtocol(TCP.TCPPacket.PROTOCOL, 'TCP', packetType=TCP.TCPPacket),
+	IpProtocol(UDP.UDPPacket.PROTOCOL, 'UDP', packetType=UDP.UDPPacket),
+	IpProtocol(41, 'IPv6 Encapsulation'),
+	IpProtocol(47, 'GRE'),
+	IpProtocol(50, 'ESP'),
+	IpProtocol(51, 'AH'),
+	IpProtocol(58, 'ICMPv6'),
+	IpProtocol(89, 'OSPF'),
+	IpProtocol(103, 'PIM'),
+	IpProtocol(112, 'VRRP'),
+	IpProtocol(132, 'SCTP'),
+]
+
+IP_PROTOCOL_ID_TO_IP_PROTOCOL = {}
+for ipProtocol in IP_PROTOCOLS:
+	assert(ipProtocol.id() not in IP_PROTOCOL_ID_TO_IP_PROTOCOL)
+	IP_PROTOCOL_ID_TO_IP_PROTOCOL[ipProtocol.id()] = ipProtocol
 
 ########## Packet ##########
 
 class IPv4Packet(object):
 	"""
-	Represents an IPv4 packet and allows extracting its information.
+	Represents an IPv4 packet and allows extracting its information. The header is unpacked on first access, and
+	the payload decoded (see payloadPacket) on first access as well.
 
 	https://en.wikipedia.org/wiki/IPv4#Packet_structure
 	"""
 
 	LINKTYPE = 228
 
+	#Everything up to the addresses, which are sliced instead
+	HEADER = struct.Struct('!BBHHHBBH')
+	HEADER_LENGTH = 20
+
+	__slots__ = ('_data', '_key', '_header', '_payloadPacket')
+
 	def __init__(self, data):
-		self._data = data
+		self._data = memoryview(data)
 		self._key = None
+		self._header = None
+		self._payloadPacket = None
+
+	def _fields(self):
+		if self._header is None:
+			self._header = self.HEADER.unpack_from(self._data)
+
+		return self._header
 
 	def key(self):
 		"""
-		Returns this packet's MAC addresses as a key that can be used.
+		Returns this packet's IP addresses as a key that can be used.
 
 		:return: str
 		"""
@@ -73,13 +169,42 @@ class IPv4Packet(object):
 
 		return self._key
 
+	def keyBytes(self):
+		"""
+		Returns this packet's IP addresses (in the same order for both directions) as 8 bytes which are equal
+		exactly when the keys are, e.g. for hashing flows without formatting their keys. keyToString converts
+		them into the key.
+
+		:return: bytes
+		"""
+		ips = bytes(self._data[12:20])
+		return ips if ips[0:4] <= ips[4:8] else ips[4:8] + ips[0:4]
+
+	def keyInt(self):
+		"""
+		Returns this packet's IP addresses (in the same order for both directions) as a 64 bit integer.
+
+		:return: int
+		"""
+		return int.from_bytes(self.keyBytes(), 'big')
+
+	@staticmethod
+	def keyToString(keyBytes):
+		"""
+		Converts the result of keyBytes into the same string as key.
+
+		:param keyBytes: bytes
+		:return: str
+		"""
+		return ipKeyBytesToKey(keyBytes)
+
 	def version(self):
 		"""
 		Extracts the version.
 
 		:return: int
 		"""
-		return self._data[0] & 0x0F
+		return self._fields()[0] >> 4
 
 	def ihl(self):
 		"""
@@ -87,7 +212,7 @@ class IPv4Packet(object):
 
 		:return: int
 		"""
-		return self._data[0] >> 4
+		return self._fields()[0] & 0x0F
 
 	def headerLength(self):
 		"""
@@ -97,13 +222,61 @@ class IPv4Packet(object):
 		"""
 		return self.ihl() * 4
 
+	def dscp(self):
+		"""
+		Extracts the DSCP.
+
+		:return: int
+		"""
+		return self._fields()[1] >> 2
+
+	def ecn(self):
+		"""
+		Extracts the ECN.
+
+		:return: int
+		"""
+		return self._fields()[1] & 0x03
+
+	def totalLength(self):
+		"""
+		Extracts the total length of the header and payload.
+
+		:return: int
+		"""
+		return self._fields()[2]
+
+	def identification(self):
+		"""
+		Extracts the identification.
+
+		:return: int
+		"""
+		return self._fields()[3]
+
+	def flags(self):
+		"""
+		Extracts the flags (0x2 is don't fragment, 0x1 is more fragments).
+
+		:return: int
+		"""
+		return self._fields()[4] >> 13
+
+	def fragmentOffset(self):
+		"""
+		Extracts the fragment offset (in units of 8 bytes).
+
+		:return: int
+		"""
+		return self._fields()[4] & 0x1FFF
+
 	def ttl(self):
 		"""
 		Extracts the TTL.
 
 		:return: int
 		"""
-		return self._data[8]
+		return self._fields()[5]
 
 	def protocol(self):
 		"""
@@ -111,32 +284,79 @@ class IPv4Packet(object):
 
 		:return: int
 		"""
-		return self._data[9]
+		return self._fields()[6]
 
-	#TODO: others
+	def ipProtocol(self):
+		"""
+		Returns the IP protocol as an object with useful helpers.
+
+		:return: IpProtocol or None
+		"""
+		return IP_PROTOCOL_ID_TO_IP_PROTOCOL.get(self.protocol())
+
+	def checksum(self):
+		"""
+		Extracts the header checksum.
+
+		:return: int
+		"""
+		return self._fields()[7]
 
 	def sourceIp(self):
 		"""
-		Extracts the source IP.
+		Extracts the source IP (as a view, without copying).
 
-		:return: bytes
+		:return: memoryview
 		"""
 		return self._data[12:16]
 
 	def destinationIp(self):
 		"""
-		Extracts the destination IP.
+		Extracts the destination IP (as a view, without copying).
 
-		:return: bytes
+		:return: memoryview
 		"""
 		return self._data[16:20]
 
-	#TODO: options (even though they are little used)
+	def options(self):
+		"""
+		Extracts the options (even though they are little used) as a view, without copying.
+
+		:return: memoryview
+		"""
+		return self._data[self.HEADER_LENGTH:self.headerLength()]
 
 	def payload(self):
 		"""
-		Extracts the payload from the data.
+		Extracts the payload from the data (as a view, without copying), excluding any link layer padding.
 
-		:return: bytes
+		:return: memoryview
+		"""
+		headerLength = self.headerLength()
+		totalLength = self.totalLength()
+		if totalLength < headerLength:
+			#e.g. segmentation offload, which leaves the total length 0
+			return self._data[headerLength:]
+
+		return self._data[headerLength:totalLength]
+
+	def payloadPacket(self):
+		"""
+		Decodes the payload by its IP protocol (see IP_PROTOCOLS), unless it is unsupported, too short, or not
+		the first fragment.
+
+		:return: TCPPacket, UDPPacket, or None
 		"""
-		return self._data[self.headerLength():]
+		if self._payloadPacket is None:
+			ipProtocol = IP_PROTOCOL_ID_TO_IP_PROTOCOL.get(self.protocol())
+			packetType = ipProtocol.packetType() if ipProtocol is not None else None
+			if packetType is None or self.fragmentOffset() != 0:
+				return None
+
+			payload = self.payload()
+			if len(payload) < packetType.HEADER_LENGTH:
+				return None
+
+			self._payloadPacket = packetType(payload)
+
+		return self._payloadPacket
@@ -0,0 +1,323 @@
+
+# Copyright (c) 2015-2023 Agalmic Ventures LLC (www.agalmicventures.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import socket
+import struct
+
+from . import AddressCache, IPv4
+
+@AddressCache.memoize('IPv6.ipv6AddressToString')
+def _ipv6AddressToString(ip):
+	return socket.inet_ntop(socket.AF_INET6, ip)
+
+@AddressCache.memoize('IPv6.ipv6PairToKey')
+def _ipv6PairToKey(lower, upper, separator):
+	return ''.join([_ipv6AddressToString(lower), separator, _ipv6AddressToString(upper)])
+
+def ipv6AddressToString(ip):
+	"""
+	Converts an IPv6 address from bytes into its canonical (compressed) string (memoized, see AddressCache).
+
+	:param ip: bytes
+	:return: str
+	"""
+	return _ipv6AddressToString(bytes(ip))
+
+def ipv6PairToKey(ip1, ip2, separator='_'):
+	"""
+	Converts a pair of IPv6 addresses from bytes into a key (memoized, see AddressCache).
+
+	:param ip1: bytes
+	:param ip2: bytes
+	:param separator: str
+	:return: str
+	"""
+	#Copy any views so the cache neither holds onto buffers nor compares views
+	ip1 = bytes(ip1)
+	ip2 = bytes(ip2)
+	if ip1 < ip2:
+		return _ipv6PairToKey(ip1, ip2, separator)
+	else:
+		return _ipv6PairToKey(ip2, ip1, separator)
+
+def ipv6KeyBytesToKey(keyBytes, separator='_'):
+	"""
+	Converts a pair of IPv6 addresses from the bytes of IPv6Packet.keyBytes into a key.
+
+	:param keyBytes: bytes
+	:param separator: str
+	:return: str
+	"""
+	return ipv6PairToKey(keyBytes[0:16], keyBytes[16:32], separator=separator)
+
+########## Extension Headers ##########
+
+NEXT_HEADER_HOP_BY_HOP = 0
+NEXT_HEADER_ROUTING = 43
+NEXT_HEADER_FRAGMENT = 44
+NEXT_HEADER_AH = 51
+NEXT_HEADER_NONE = 59
+NEXT_HEADER_DESTINATION_OPTIONS = 60
+
+#Extension headers whose length is in 8 byte units, not counting the first 8 bytes
+EXTENSION_HEADERS = frozenset([
+	NEXT_HEADER_HOP_BY_HOP,
+	NEXT_HEADER_ROUTING,
+	NEXT_HEADER_DESTINATION_OPTIONS,
+	135, #Mobility
+	139, #HIP
+	140, #Shim6
+])
+
+FRAGMENT_HEADER_LENGTH = 8
+
+########## Packet ##########
+
+class IPv6Packet(object):
+	"""
+	Represents an IPv6 packet and allows extracting its information. The header is unpacked, the extension headers
+	walked, and the payload decoded (see payloadPacket) on first access.
+
+	https://en.wikipedia.org/wiki/IPv6_packet
+	"""
+
+	LINKTYPE = 229
+
+	#Everything up to the addresses, which are sliced instead
+	HEADER = struct.Struct('!IHBB')
+	HEADER_LENGTH = 40
+
+	__slots__ = ('_data', '_key', '_header', '_protocol', '_payloadOffset', '_fragmentOffset', '_payloadPacket')
+
+	def __init__(self, data):
+		self._data = memoryview(data)
+		self._key = None
+		self._header = None
+		self._protocol = None
+		self._payloadOffset = None
+		self._fragmentOffset = 0
+		self._payloadPacket = None
+
+	def _fields(self):
+		if self._header is None:
+			self._header = self.HEADER.unpack_from(self._data)
+
+		return self._header
+
+	def _walkExtensionHeaders(self):
+		"""
+		Finds the upper layer protocol and its offset by following the next header fields, reading the few bytes
+		needed from the data directly rather than slicing each extension header.
+		"""
+		data = self._data
+		end = len(data)
+		nextHeader = self._fields()[2]
+		offset = self.HEADER_LENGTH
+		while offset + 2 <= end:
+			if nextHeader in EXTENSION_HEADERS:
+				length = (data[offset + 1] + 1) * 8
+			elif nextHeader == NEXT_HEADER_FRAGMENT:
+				length = FRAGMENT_HEADER_LENGTH
+				if offset + 4 <= end:
+					self._fragmentOffset = (data[offset + 2] << 8 | data[offset + 3]) >> 3
+			elif nextHeader == NEXT_HEADER_AH:
+				length = (data[offset + 1] + 2) * 4
+			else:
+				break
+
+			nextHeader = data[offset]
+			offset += length
+
+		self._protocol = nextHeader
+		self._payloadOffset = min(offset, end)
+
+	def key(self):
+		"""
+		Returns this packet's IP addresses as a key that can be used.
+
+		:return: str
+		"""
+		if self._key is None:
+			self._key = ipv6PairToKey(self.sourceIp(), self.destinationIp())
+
+		return self._key
+
+	def keyBytes(self):
+		"""
+		Returns this packet's IP addresses (in the same order for both directions) as 32 bytes which are equal
+		exactly when the keys are, e.g. for hashing flows without formatting their keys. keyToString converts
+		them into the key.
+
+		:return: bytes
+		"""
+		ips = bytes(self._data[8:40])
+		return ips if ips[0:16] <= ips[16:32] else ips[16:32] + ips[0:16]
+
+	def keyInt(self):
+		"""
+		Returns this packet's IP addresses (in the same order for both directions) as a 256 bit integer (each
+		address being 128 bits).
+
+		:return: int
+		"""
+		return int.from_bytes(self.keyBytes(), 'big')
+
+	@staticmethod
+	def keyToString(keyBytes):
+		"""
+		Converts the result of keyBytes into the same string as key.
+
+		:param keyBytes: bytes
+		:return: str
+		"""
+		return ipv6KeyBytesToKey(keyBytes)
+
+	def version(self):
+		"""
+		Extracts the version.
+
+		:return: int
+		"""
+		return self._fields()[0] >> 28
+
+	def trafficClass(self):
+		"""
+		Extracts the traffic class.
+
+		:return: int
+		"""
+		return (self._fields()[0] >> 20) & 0xFF
+
+	def flowLabel(self):
+		"""
+		Extracts the flow label.
+
+		:return: int
+		"""
+		return self._fields()[0] & 0xFFFFF
+
+	def payloadLength(self):
+		"""
+		Extracts the payload length (including extension headers).
+
+		:return: int
+		"""
+		return self._fields()[1]
+
+	def nextHeader(self):
+		"""
+		Extracts the next header, which is either the first extension header or the IP protocol.
+
+		:return: int
+		"""
+		return self._fields()[2]
+
+	def hopLimit(self):
+		"""
+		Extracts the hop limit.
+
+		:return: int
+		"""
+		return self._fields()[3]
+
+	def protocol(self):
+		"""
+		Returns the IP protocol (TCP, UDP, etc.) after any extension headers.
+
+		:return: int
+		"""
+		if self._protocol is None:
+			self._walkExtensionHeaders()
+
+		return self._protocol
+
+	def ipProtocol(self):
+		"""
+		Returns the IP protocol after any extension headers as an object with useful helpers.
+
+		:return: IpProtocol or None
+		"""
+		return IPv4.IP_PROTOCOL_ID_TO_IP_PROTOCOL.get(self.protocol())
+
+	def fragmentOffset(self):
+		"""
+		Returns the fragment offset (in units of 8 bytes) from the fragment header, or 0 if there is none.
+
+		:return: int
+		"""
+		if self._protocol is None:
+			self._walkExtensionHeaders()
+
+		return self._fragmentOffset
+
+	def sourceIp(self):
+		"""
+		Extracts the source IP (as a view, without copying).
+
+		:return: memoryview
+		"""
+		return self._data[8:24]
+
+	def destinationIp(self):
+		"""
+		Extracts the destination IP (as a view, without copying).
+
+		:return: memoryview
+		"""
+		return self._data[24:40]
+
+	def payload(self):
+		"""
+		Extracts the payload after any extension headers from the data (as a view, without copying), excluding any
+		link layer padding.
+
+		:return: memoryview
+		"""
+		if self._protocol is None:
+			self._walkExtensionHeaders()
+
+		payloadLength = self.payloadLength()
+		if payloadLength == 0:
+			#e.g. jumbograms or segmentation offload
+			return self._data[self._payloadOffset:]
+
+		return self._data[self._payloadOffset:self.HEADER_LENGTH + payloadLength]
+
+	def payloadPacket(self):
+		"""
+		Decodes the payload by its IP protocol (see IPv4.IP_PROTOCOLS), unless it is unsupported, too short, or not
+		the first fragment.
+
+		:return: TCPPacket, UDPPacket, or None
+		"""
+		if self._payloadPacket is None:
+			ipProtocol = self.ipProtocol()
+			packetType = ipProtocol.packetType() if ipProtocol is not None else None
+			if packetType is None or self._fragmentOffset != 0:
+				return None
+
+			payload = self.payload()
+			if len(payload) < packetType.HEADER_LENGTH:
+				return None
+
+			self._payloadPacket = packetType(payload)
+
+		return self._payloadPacket
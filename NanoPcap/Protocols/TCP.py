@@ -0,0 +1,163 @@
+
+# Copyright (c) 2015-2023 Agalmic Ventures LLC (www.agalmicventures.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import struct
+
+FLAG_FIN = 0x001
+FLAG_SYN = 0x002
+FLAG_RST = 0x004
+FLAG_PSH = 0x008
+FLAG_ACK = 0x010
+FLAG_URG = 0x020
+FLAG_ECE = 0x040
+FLAG_CWR = 0x080
+FLAG_NS = 0x100
+
+########## Packet ##########
+
+class TCPPacket(object):
+	"""
+	Represents a TCP segment and allows extracting its information. The header is unpacked on first access.
+
+	https://en.wikipedia.org/wiki/Transmission_Control_Protocol#TCP_segment_structure
+	"""
+
+	PROTOCOL = 6
+
+	HEADER = struct.Struct('!HHIIHHHH')
+	HEADER_LENGTH = HEADER.size
+
+	__slots__ = ('_data', '_header')
+
+	def __init__(self, data):
+		self._data = memoryview(data)
+		self._header = None
+
+	def _fields(self):
+		if self._header is None:
+			self._header = self.HEADER.unpack_from(self._data)
+
+		return self._header
+
+	def sourcePort(self):
+		"""
+		Extracts the source port.
+
+		:return: int
+		"""
+		return self._fields()[0]
+
+	def destinationPort(self):
+		"""
+		Extracts the destination port.
+
+		:return: int
+		"""
+		return self._fields()[1]
+
+	def sequenceNumber(self):
+		"""
+		Extracts the sequence number.
+
+		:return: int
+		"""
+		return self._fields()[2]
+
+	def acknowledgmentNumber(self):
+		"""
+		Extracts the acknowledgment number.
+
+		:return: int
+		"""
+		return self._fields()[3]
+
+	def dataOffset(self):
+		"""
+		Extracts the data offset (the header length in 32 bit words).
+
+		:return: int
+		"""
+		return self._fields()[4] >> 12
+
+	def headerLength(self):
+		"""
+		Computes the header length (including options) from the data offset.
+
+		:return: int
+		"""
+		return self.dataOffset() * 4
+
+	def flags(self):
+		"""
+		Extracts the flags (see the FLAG_* constants).
+
+		:return: int
+		"""
+		return self._fields()[4] & 0x1FF
+
+	def hasFlags(self, flags):
+		"""
+		Returns whether all of the given flags are set.
+
+		:param flags: int
+		:return: bool
+		"""
+		return self.flags() & flags == flags
+
+	def windowSize(self):
+		"""
+		Extracts the window size.
+
+		:return: int
+		"""
+		return self._fields()[5]
+
+	def checksum(self):
+		"""
+		Extracts the checksum.
+
+		:return: int
+		"""
+		return self._fields()[6]
+
+	def urgentPointer(self):
+		"""
+		Extracts the urgent pointer.
+
+		:return: int
+		"""
+		return self._fields()[7]
+
+	def options(self):
+		"""
+		Extracts the options from the data (as a view, without copying).
+
+		:return: memoryview
+		"""
+		return self._data[self.HEADER_LENGTH:self.headerLength()]
+
+	def payload(self):
+		"""
+		Extracts the payload from the data (as a view, without copying).
+
+		:return: memoryview
+		"""
+		return self._data[self.headerLength():]
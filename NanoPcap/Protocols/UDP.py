@@ -0,0 +1,93 @@
+
+# Copyright (c) 2015-2023 Agalmic Ventures LLC (www.agalmicventures.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import struct
+
+########## Packet ##########
+
+class UDPPacket(object):
+	"""
+	Represents a UDP datagram and allows extracting its information. The header is unpacked on first access.
+
+	https://en.wikipedia.org/wiki/User_Datagram_Protocol#UDP_datagram_structure
+	"""
+
+	PROTOCOL = 17
+
+	HEADER = struct.Struct('!HHHH')
+	HEADER_LENGTH = HEADER.size
+
+	__slots__ = ('_data', '_header')
+
+	def __init__(self, data):
+		self._data = memoryview(data)
+		self._header = None
+
+	def _fields(self):
+		if self._header is None:
+			self._header = self.HEADER.unpack_from(self._data)
+
+		return self._header
+
+	def sourcePort(self):
+		"""
+		Extracts the source port.
+
+		:return: int
+		"""
+		return self._fields()[0]
+
+	def destinationPort(self):
+		"""
+		Extracts the destination port.
+
+		:return: int
+		"""
+		return self._fields()[1]
+
+	def length(self):
+		"""
+		Extracts the length of the header and payload.
+
+		:return: int
+		"""
+		return self._fields()[2]
+
+	def checksum(self):
+		"""
+		Extracts the checksum.
+
+		:return: int
+		"""
+		return self._fields()[3]
+
+	def payload(self):
+		"""
+		Extracts the payload from the data (as a view, without copying).
+
+		:return: memoryview
+		"""
+		length = self.length()
+		if length < self.HEADER_LENGTH:
+			#e.g. jumbograms, which have a length of 0
+			return self._data[self.HEADER_LENGTH:]
+
+		return self._data[self.HEADER_LENGTH:length]
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2015-2023 Agalmic Ventures LLC (www.agalmicventures.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import argparse
+import os
+import sys
+import time
+
+import inspect
+_currentFile = os.path.abspath(inspect.getfile(inspect.currentframe()))
+_currentDir = os.path.dirname(_currentFile)
+_parentDir = os.path.dirname(os.path.dirname(_currentDir))
+sys.path.insert(0, _parentDir)
+
+from NanoPcap import Listener, Parser
+from NanoPcap.Utility import Units
+
+def timeParse(filename, blockSize, repeats, readahead=0):
+	"""
+	Times parsing a file with a given block size, taking the best of several runs.
+
+	:param filename: str The file to parse
+	:param blockSize: int The size of the blocks to read, or 0 to read each record directly
+	:param repeats: int The number of runs
+	:param readahead: int The number of blocks to decompress ahead (compressed files only)
+	:return: float The fastest run in seconds
+	"""
+	best = None
+	for _ in range(repeats):
+		start = time.perf_counter()
+		Parser.parseFile(filename, Listener.PcapDoNothingListener(), blockSize=blockSize, readahead=readahead)
+		elapsed = time.perf_counter() - start
+		best = elapsed if best is None else min(best, elapsed)
+	return best
+
+def main():
+	parser = argparse.ArgumentParser(description='PCAP Benchmark Tool -- times parsing with different block sizes.')
+	parser.add_argument('pcap', nargs='+', help='PCAP files to parse.')
+	parser.add_argument('-b', '--block-size', action='append',
+		help='A block size to time, e.g. 1M (may be repeated; 0, reading each record directly, is always timed).')
+	parser.add_argument('-n', '--repeats', type=int, default=5, action='store',
+		help='The number of runs of each block size (the fastest is reported).')
+	parser.add_argument('--readahead', type=int, default=0, action='store',
+		help='The number of blocks of compressed input to decompress ahead on a background thread.')
+	arguments = parser.parse_args(sys.argv[1:])
+
+	if arguments.repeats < 1:
+		print('Repeats must be a positive integer.')
+		return 1
+
+	blockSizes = [0] + [Units.parseUnits(blockSize, Units.UNITS_1024) for blockSize in arguments.block_size or ['1M']]
+
+	print('%-40s %12s %12s %9s' % ('File', 'Block Size', 'Time (ms)', 'Speedup'))
+	for filename in arguments.pcap:
+		baseline = None
+		for blockSize in blockSizes:
+			seconds = timeParse(filename, blockSize, arguments.repeats, readahead=arguments.readahead)
+			baseline = baseline or seconds
+			print('%-40s %12d %12.1f %8.2fx' % (filename, blockSize, 1000.0 * seconds, baseline / seconds))
+
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
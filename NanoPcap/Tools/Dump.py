@@ -115,7 +115,7 @@ class PcapDumpListener(Listener.PcapListener):
 				dataOutput,
 			))
 
-def main():
+def makeArgumentParser():
 	parser = argparse.ArgumentParser(description='PCAP Dump Diagnostic')
 	parser.add_argument('pcap', help='PCAP file to dump.')
 	parser.add_argument('-d', '--data-bytes', type=int, default=0, action='store',
@@ -132,10 +132,39 @@ def main():
 		help='Do not show records.')
 	parser.add_argument('-s', '--strict', action='store_true',
 		help='Enables strict validation rules.')
-	arguments = parser.parse_args(sys.argv[1:])
 
-	listener = PcapDumpListener(arguments)
-	Parser.parseFile(arguments.pcap, listener, strict=arguments.strict)
+	#Where to start (using the index if possible)
+	startGroup = parser.add_mutually_exclusive_group()
+	startGroup.add_argument('--start-record', type=int, default=None, action='store',
+		help='The number of the first record to process (starting at 0).')
+	startGroup.add_argument('--start-time', type=int, default=None, action='store',
+		help='The epoch nanoseconds of the earliest record to process.')
+
+	#Following files as they are written
+	parser.add_argument('-f', '--follow', action='store_true',
+		help='Follow the file as it is written, waiting for more records at the end.')
+	parser.add_argument('--poll-interval', type=float, default=0.1, action='store',
+		help='The initial number of seconds between polls for more records when following (backs off when idle).')
+	parser.add_argument('--idle-timeout', type=float, default=None, action='store',
+		help='The number of seconds without new records after which to stop following (default: never).')
+
+	return parser
+
+def makeListener(arguments):
+	return PcapDumpListener(arguments)
+
+def main():
+	arguments = makeArgumentParser().parse_args(sys.argv[1:])
+	listener = makeListener(arguments)
+	try:
+		truncatedBytes = Parser.parseFile(arguments.pcap, listener, strict=arguments.strict, flyweight=True,
+			startRecord=arguments.start_record, startTime=arguments.start_time,
+			follow=arguments.follow, pollInterval=arguments.poll_interval, idleTimeout=arguments.idle_timeout,
+			onPoll=sys.stdout.flush)
+		if truncatedBytes > 0:
+			print('WARNING: Stopped following with %d bytes of an incomplete record left' % truncatedBytes, file=sys.stderr)
+	except KeyboardInterrupt:
+		pass #The usual way to stop following
 
 	return 0
 
@@ -22,7 +22,6 @@
 
 import argparse
 import datetime
-import gzip
 import os
 import random
 import sys
@@ -33,8 +32,8 @@ _currentDir = os.path.dirname(_currentFile)
 _parentDir = os.path.dirname(os.path.dirname(_currentDir))
 sys.path.insert(0, _parentDir)
 
-from NanoPcap import Listener, Parser
-from NanoPcap.Utility import Data
+from NanoPcap import Compression, Format, Listener, Parser
+from NanoPcap.Utility import Data, Units
 
 class PcapFilterListener(Listener.PcapListener):
 
@@ -46,6 +45,11 @@ class PcapFilterListener(Listener.PcapListener):
 		self._outputFile = None
 		self._header = None
 
+	def close(self):
+		if self._outputFile is not None:
+			self._outputFile.close()
+			self._outputFile = None
+
 	def onPcapHeader(self, header):
 		self._header = header
 
@@ -110,11 +114,16 @@ class PcapFilterListener(Listener.PcapListener):
 				os.makedirs(directory)
 
 			mode = 'ab' if self._arguments.append else 'wb'
-			self._outputFile = gzip.open(self._outputFileName, mode) if self._outputFileName.endswith('.gz') else open(self._outputFileName, mode)
+			empty = mode == 'wb' or Compression.isEmptyFile(self._outputFileName)
+			outputFile = Compression.openFile(self._outputFileName, mode, level=self._arguments.compression_level,
+				threads=self._arguments.compression_threads)
+			if self._arguments.writebehind > 0 and Compression.isCompressed(self._outputFileName):
+				outputFile = Compression.WritebehindFile(outputFile, queueDepth=self._arguments.writebehind)
+			self._outputFile = Format.PcapWriter(outputFile)
 			#Write the header at the beginning, unless instructed otherwise
-			#This neatly handles append mode
-			if not self._arguments.no_header and self._outputFile.tell() == 0:
-				self._header.writeToFile(self._outputFile)
+			#Appending only needs one if there is no data yet (checked before opening, since compressed files start at position 0)
+			if not self._arguments.no_header and empty:
+				self._outputFile.writeHeader(self._header)
 
 		#Update with new snaplen
 		start = self._arguments.data_offset
@@ -128,33 +137,44 @@ class PcapFilterListener(Listener.PcapListener):
 		if self._arguments.time_shift_seconds is not None:
 			recordHeader.setTsSec(recordHeader.tsSec() + self._arguments.time_shift_seconds)
 
-		#Write the header
-		recordHeader.writeToFile(self._outputFile)
-
-		#Write the data, randomizing if necessary
+		#Write the header and data, randomizing if necessary
 		if self._arguments.data_randomization_fraction > 0:
 			newTruncatedData = Data.randomizeBytes(truncatedData, self._arguments.data_randomization_fraction)
-			self._outputFile.write(newTruncatedData)
+			self._outputFile.writeRecord(recordHeader, newTruncatedData)
 		else:
-			self._outputFile.write(truncatedData)
+			self._outputFile.writeRecord(recordHeader, truncatedData)
 
 		#Duplicate?
 		if self._arguments.duplicate_fraction > 0 and random.random() < self._arguments.duplicate_fraction:
-			recordHeader.writeToFile(self._outputFile)
-			self._outputFile.write(truncatedData)
+			self._outputFile.writeRecord(recordHeader, truncatedData)
 
 def datetimeToEpochNanos(dt):
 	seconds = (dt - datetime.datetime(1970, 1, 1)).total_seconds()
 	return seconds * 1000 * 1000 * 1000
 
-def main():
+def makeArgumentParser():
 	parser = argparse.ArgumentParser(description='PCAP Filter Tool')
 	parser.add_argument('input', help='PCAP file to use as input.')
 	parser.add_argument('output', help='Output file. May include time format strings to roll the file based on packet time stamps, e.g. %%Y/%%m/%%d/%%H.pcap for hourly output files in daily folders.')
 
 	#Validation
-	parser.add_argument('--strict', action='store_true',
+	validationGroup = parser.add_mutually_exclusive_group()
+	validationGroup.add_argument('--strict', action='store_true',
 		help='Enables strict validation rules.')
+	validationGroup.add_argument('--trusted', action='store_true',
+		help='Skip validating records, e.g. for files written by NanoPcap (faster, but invalid records go unnoticed).')
+	parser.add_argument('-m', '--mmap', action='store_true',
+		help='Memory map the input rather than reading it (ignored for compressed files).')
+	parser.add_argument('--block-size', action='store',
+		help='The size of the blocks to read the input in, e.g. 4M (defaults to 1M for compressed inputs; 0 reads each record directly).')
+	parser.add_argument('--readahead', type=int, default=0, action='store',
+		help='The number of blocks of compressed input to decompress ahead on a background thread.')
+	parser.add_argument('--writebehind', type=int, default=0, action='store',
+		help='The number of buffers of compressed output to compress behind on a background thread.')
+	parser.add_argument('--compression-level', type=int, default=None, action='store',
+		help='The compression level of compressed output (e.g. 1 for the fastest, 9 for the smallest).')
+	parser.add_argument('--compression-threads', type=int, default=0, action='store',
+		help='The number of threads compressing gzip output in parallel (0 compresses on the parsing thread).')
 
 	#"Where to cut" in bytes
 	parser.add_argument('-l', '--snaplen', type=int, default=65535, action='store',
@@ -194,8 +214,9 @@ def main():
 	parser.add_argument('--deduplication-window', type=int, default=0, action='store',
 		help='Sets the number of the packets in the deduplication window (based on contents).')
 
-	arguments = parser.parse_args(sys.argv[1:])
+	return parser
 
+def makeListener(arguments):
 	#Parse the start time
 	if arguments.start is not None:
 		try:
@@ -213,8 +234,18 @@ def main():
 		except ValueError:
 			arguments.end = datetimeToEpochNanos(datetime.datetime.strptime(arguments.end, '%Y-%m-%d %H:%M:%S.%f'))
 
-	listener = PcapFilterListener(arguments)
-	Parser.parseFile(arguments.input, listener, strict=arguments.strict)
+	return PcapFilterListener(arguments)
+
+def main():
+	arguments = makeArgumentParser().parse_args(sys.argv[1:])
+	listener = makeListener(arguments)
+	blockSize = Units.parseUnits(arguments.block_size, Units.UNITS_1024) if arguments.block_size is not None else None
+
+	#Start at the beginning of the window (using the index if possible)
+	startTime = int(arguments.start) if arguments.start is not None else None
+	Parser.parseFile(arguments.input, listener, strict=arguments.strict, trusted=arguments.trusted, mmap=arguments.mmap,
+		blockSize=blockSize, startTime=startTime, readahead=arguments.readahead)
+	listener.close()
 
 	return 0
 
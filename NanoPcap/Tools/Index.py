@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2015-2023 Agalmic Ventures LLC (www.agalmicventures.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import argparse
+import os
+import sys
+
+import inspect
+_currentFile = os.path.abspath(inspect.getfile(inspect.currentframe()))
+_currentDir = os.path.dirname(_currentFile)
+_parentDir = os.path.dirname(os.path.dirname(_currentDir))
+sys.path.insert(0, _parentDir)
+
+from NanoPcap import Compression, Index, Parser
+
+def main():
+	parser = argparse.ArgumentParser(description='PCAP Index Tool',
+		epilog='Seeks into gzip files can only start at gzip members, so files written as a single member (e.g. by the gzip command) are '
+			'still inflated from the start; recompress them with NanoPcap (which starts a new member every %dM) to avoid this.' % (
+			Compression.DEFAULT_GZIP_MEMBER_SIZE // (1024 * 1024)))
+	parser.add_argument('pcap', nargs='+', help='PCAP files to index.')
+	parser.add_argument('-i', '--interval', type=int, default=Index.DEFAULT_INDEX_INTERVAL, action='store',
+		help='The number of records between index entries.')
+	parser.add_argument('-f', '--force', action='store_true',
+		help='Rebuild indices even if they are still fresh.')
+	parser.add_argument('-s', '--strict', action='store_true',
+		help='Enables strict validation rules.')
+	arguments = parser.parse_args(sys.argv[1:])
+
+	if arguments.interval < 1:
+		print('Index interval must be a positive integer.')
+		return 1
+
+	for filename in arguments.pcap:
+		if not arguments.force and Index.loadIndexFile(filename) is not None:
+			print('%s: index is fresh' % filename)
+			continue
+
+		extension = Compression.codecExtension(filename)
+		if extension == '.gz':
+			#Read through a checkpoint file to record where each gzip member starts
+			with open(filename, 'rb') as rawFile, Index.GzipCheckpointFile(rawFile) as pcapFile:
+				index = Index.buildIndex(Parser.PcapParser(pcapFile, strict=arguments.strict), filename,
+					interval=arguments.interval, gzipFile=pcapFile)
+
+				#Only member starts are saved, so seeks into large single member files will inflate from the start
+				if len(index.gzipMembers()) == 1 and pcapFile.tell() > Compression.DEFAULT_GZIP_MEMBER_SIZE:
+					print('WARNING: %s is a single gzip member, so seeks will still inflate it from the start (recompress it with NanoPcap to avoid this)' % filename)
+		elif extension is not None:
+			with Compression.openFile(filename, 'rb') as pcapFile:
+				index = Index.buildIndex(Parser.PcapParser(pcapFile, strict=arguments.strict), filename,
+					interval=arguments.interval)
+		else:
+			with open(filename, 'rb') as pcapFile, Parser.PcapMmapParser(pcapFile, strict=arguments.strict) as pcapParser:
+				index = Index.buildIndex(pcapParser, filename, interval=arguments.interval)
+
+		Index.writeIndexFile(index, filename)
+		print('%s: wrote %d entries to %s' % (filename, len(index), Index.indexFileName(filename)))
+
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
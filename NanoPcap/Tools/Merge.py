@@ -21,7 +21,6 @@
 # SOFTWARE.
 
 import argparse
-import gzip
 import os
 import sys
 
@@ -31,7 +30,7 @@ _currentDir = os.path.dirname(_currentFile)
 _parentDir = os.path.dirname(os.path.dirname(_currentDir))
 sys.path.insert(0, _parentDir)
 
-from NanoPcap import Parser
+from NanoPcap import Compression, Format, Parser
 
 def main():
 	parser = argparse.ArgumentParser(description='PCAP Filter Tool')
@@ -47,8 +46,7 @@ def main():
 
 	arguments = parser.parse_args(sys.argv[1:])
 
-	with gzip.open(arguments.input1, 'rb') if arguments.input1.endswith('.gz') else open(arguments.input1, 'rb') as inputFile1, \
-			gzip.open(arguments.input2, 'rb') if arguments.input2.endswith('.gz') else open(arguments.input2, 'rb') as inputFile2:
+	with Compression.openFile(arguments.input1, 'rb') as inputFile1, Compression.openFile(arguments.input2, 'rb') as inputFile2:
 		parser1 = Parser.PcapParser(inputFile1, strict=arguments.strict)
 		iterator1 = parser1.parse()
 
@@ -59,9 +57,9 @@ def main():
 			print('ERROR: Mismatched link types - %s vs %s' % (parser1.header().network(), parser2.header().network()))
 			return 1
 
-		with gzip.open(arguments.output, 'wb') if arguments.output.endswith('.gz') else open(arguments.output, 'wb') as outputFile:
+		with Format.PcapWriter(Compression.openFile(arguments.output, 'wb')) as outputFile:
 			#Output the header
-			parser1.header().writeToFile(outputFile)
+			outputFile.writeHeader(parser1.header())
 
 			#Merge and output the records
 			next1 = None
@@ -78,28 +76,22 @@ def main():
 					break
 
 				if next1.epochNanos() < next2.epochNanos():
-					next1.writeToFile(outputFile)
-					outputFile.write(nextData1)
+					outputFile.writeRecord(next1, nextData1)
 					next1 = None
 				else:
-					next2.writeToFile(outputFile)
-					outputFile.write(nextData2)
+					outputFile.writeRecord(next2, nextData2)
 					next2 = None
 
 			if next1 is not None:
-				next1.writeToFile(outputFile)
-				outputFile.write(nextData1)
+				outputFile.writeRecord(next1, nextData1)
 			if next2 is not None:
-				next2.writeToFile(outputFile)
-				outputFile.write(nextData2)
+				outputFile.writeRecord(next2, nextData2)
 
 			#Dump any remaining (only one of these loops will do anything)
 			for next, nextData in iterator1:
-				next.writeToFile(outputFile)
-				outputFile.write(nextData)
+				outputFile.writeRecord(next, nextData)
 			for next, nextData in iterator2:
-				next.writeToFile(outputFile)
-				outputFile.write(nextData)
+				outputFile.writeRecord(next, nextData)
 
 	return 0
 
@@ -21,7 +21,6 @@
 # SOFTWARE.
 
 import argparse
-import gzip
 import os
 import sys
 
@@ -31,7 +30,7 @@ _currentDir = os.path.dirname(_currentFile)
 _parentDir = os.path.dirname(os.path.dirname(_currentDir))
 sys.path.insert(0, _parentDir)
 
-from NanoPcap import Listener, Parser
+from NanoPcap import Compression, Format, Listener, Parser
 
 class PcapSplitListener(Listener.PcapListener):
 
@@ -44,6 +43,9 @@ class PcapSplitListener(Listener.PcapListener):
 
 		self._resetSlice()
 
+	def close(self):
+		self._resetSlice()
+
 	def _resetSlice(self):
 		if self._outputFile is not None:
 			self._outputFile.close()
@@ -81,12 +83,17 @@ class PcapSplitListener(Listener.PcapListener):
 			fileNameFormat = '%s.pcap.gz' if self._arguments.gzip_output else '%s.pcap'
 			fileName = os.path.join(self._arguments.output, fileNameFormat % self._outputFileNumber)
 			mode = 'ab' if self._arguments.append else 'wb'
-			self._outputFile = gzip.open(fileName, mode) if fileName.endswith('.gz') else open(fileName, mode)
+			empty = mode == 'wb' or Compression.isEmptyFile(fileName)
+			outputFile = Compression.openFile(fileName, mode, level=self._arguments.compression_level,
+				threads=self._arguments.compression_threads)
+			if self._arguments.writebehind > 0 and Compression.isCompressed(fileName):
+				outputFile = Compression.WritebehindFile(outputFile, queueDepth=self._arguments.writebehind)
+			self._outputFile = Format.PcapWriter(outputFile)
 
 			#Write the header at the beginning, unless instructed otherwise
-			#This neatly handles append mode
-			if not self._arguments.no_header and self._outputFile.tell() == 0:
-				self._header.writeToFile(self._outputFile)
+			#Appending only needs one if there is no data yet (checked before opening, since compressed files start at position 0)
+			if not self._arguments.no_header and empty:
+				self._outputFile.writeHeader(self._header)
 
 		#Update with new snaplen
 		#NOTE: since the link type doesn't change, the original length shouldn't either
@@ -96,20 +103,32 @@ class PcapSplitListener(Listener.PcapListener):
 		recordHeader.setIncludedLength(len(truncatedData))
 
 		#Write the header and data
-		recordHeader.writeToFile(self._outputFile)
-		self._outputFile.write(truncatedData)
+		self._outputFile.writeRecord(recordHeader, truncatedData)
 
-def main():
+def makeArgumentParser():
 	parser = argparse.ArgumentParser(description='PCAP Splitting Tool')
 	parser.add_argument('input', help='PCAP file to use as input.')
 	parser.add_argument('output', help='Output path -- output files will be named based on the identifying attributes.')
 	parser.add_argument('--gzip-output', action='store_true',
 		help='Enables gzip for the output files.')
+	parser.add_argument('--writebehind', type=int, default=0, action='store',
+		help='The number of buffers of compressed output to compress behind on a background thread.')
+	parser.add_argument('--compression-level', type=int, default=None, action='store',
+		help='The compression level of compressed output (e.g. 1 for the fastest, 9 for the smallest).')
+	parser.add_argument('--compression-threads', type=int, default=0, action='store',
+		help='The number of threads compressing gzip output in parallel (0 compresses on the parsing thread).')
 
 	#Validation
 	parser.add_argument('--strict', action='store_true',
 		help='Enables strict validation rules.')
 
+	#Where to start (using the index if possible)
+	startGroup = parser.add_mutually_exclusive_group()
+	startGroup.add_argument('--start-record', type=int, default=None, action='store',
+		help='The number of the first record to process (starting at 0).')
+	startGroup.add_argument('--start-time', type=int, default=None, action='store',
+		help='The epoch nanoseconds of the earliest record to process.')
+
 	#Where to split
 	parser.add_argument('-b', '--max-bytes', type=int, default=None, action='store',
 		help='The maximum number of bytes in a slice.')
@@ -128,8 +147,9 @@ def main():
 	parser.add_argument('-a', '--append', action='store_true',
 		help='Append to the file (implies no header).')
 
-	arguments = parser.parse_args(sys.argv[1:])
+	return parser
 
+def makeListener(arguments):
 	if arguments.max_bytes is not None and arguments.max_bytes < 1:
 		print('Maximum bytes per slice must be a positive integer.')
 		sys.exit(1)
@@ -137,8 +157,14 @@ def main():
 		print('Maximum packets per slice must be a positive integer.')
 		sys.exit(1)
 
-	listener = PcapSplitListener(arguments)
-	Parser.parseFile(arguments.input, listener, strict=arguments.strict)
+	return PcapSplitListener(arguments)
+
+def main():
+	arguments = makeArgumentParser().parse_args(sys.argv[1:])
+	listener = makeListener(arguments)
+	Parser.parseFile(arguments.input, listener, strict=arguments.strict,
+		startRecord=arguments.start_record, startTime=arguments.start_time)
+	listener.close()
 
 	return 0
 
@@ -21,9 +21,11 @@
 # SOFTWARE.
 
 import argparse
-import gzip
+import collections
+import functools
 import os
 import sys
+import zlib
 
 import inspect
 _currentFile = os.path.abspath(inspect.getfile(inspect.currentframe()))
@@ -31,19 +33,138 @@ _currentDir = os.path.dirname(_currentFile)
 _parentDir = os.path.dirname(os.path.dirname(_currentDir))
 sys.path.insert(0, _parentDir)
 
-from NanoPcap import Listener, Parser
-from NanoPcap.Protocols import Ethernet, IPv4
+from NanoPcap import Compression, Format, Listener, Parallel, Parser
+from NanoPcap.Protocols import Ethernet, IPv4, IPv6
+
+#Flows each get their own buffer (allocated up front), so keep them small: with the default number of open files this
+#is at most 8M in total, and records which do not fit are written around the buffer anyway
+OUTPUT_BUFFER_SIZE = 8 * 1024
+
+#File descriptors left for everything other than the outputs (the input, standard streams, etc.)
+RESERVED_FILE_DESCRIPTORS = 32
+
+#The most files open at once by default (fewer if the file descriptor limit is lower), which bounds the memory used by
+#their buffers (and compressors) however high the limit is
+DEFAULT_MAX_OPEN_FILES = 1024
+
+#The packets flows are split by for each supported link type
+LINKTYPE_TO_PACKET_TYPE = collections.OrderedDict([
+	(Ethernet.EthernetPacket.LINKTYPE, Ethernet.EthernetPacket),
+	(IPv4.IPv4Packet.LINKTYPE, IPv4.IPv4Packet),
+	(IPv6.IPv6Packet.LINKTYPE, IPv6.IPv6Packet),
+])
+
+def defaultMaxOpenFiles():
+	"""
+	Returns the default number of output files to keep open at once: DEFAULT_MAX_OPEN_FILES, or fewer if the file
+	descriptor limit is lower.
+
+	:return: int
+	"""
+	try:
+		import resource
+	except ImportError:
+		return DEFAULT_MAX_OPEN_FILES
+
+	softLimit, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+	if softLimit == resource.RLIM_INFINITY:
+		return DEFAULT_MAX_OPEN_FILES
+	return max(min(softLimit - RESERVED_FILE_DESCRIPTORS, DEFAULT_MAX_OPEN_FILES), 1)
+
+def packetTypeForHeader(header):
+	"""
+	Returns the packet type of the link type of a PCAP, exiting if it is not supported.
+
+	:param header: PcapHeader
+	:return: EthernetPacket, IPv4Packet, or IPv6Packet
+	"""
+	packetType = LINKTYPE_TO_PACKET_TYPE.get(header.network())
+	if packetType is None:
+		print('ERROR: Link type is %d instead of one of %s' % (header.network(), ', '.join(str(linkType) for linkType in LINKTYPE_TO_PACKET_TYPE)))
+		sys.exit(1)
+
+	return packetType
+
+def flowPartitioner(header):
+	"""
+	Returns a function from record data to a hash of its flow, which partitions records by flow without
+	formatting keys (see Parallel.parseFilePartitioned).
+
+	:param header: PcapHeader
+	:return: function from bytes to int
+	"""
+	packetType = packetTypeForHeader(header)
+	return lambda data: zlib.crc32(packetType(data).keyBytes())
 
 class PcapSplitFlowsListener(Listener.PcapListener):
 
 	def __init__(self, arguments):
 		self._arguments = arguments
+		self._maxOpenFiles = arguments.max_open_files if arguments.max_open_files is not None else defaultMaxOpenFiles()
 
-		self._outputFiles = {}
+		#Open files from least to most recently used, and the names of all files opened so far (both by flow key
+		#bytes, so names are only formatted once per flow)
+		self._outputFiles = collections.OrderedDict()
+		self._fileNames = {}
 		self._header = None
 
+		#How flows are keyed, which depends on the packet type
+		self._keyBytes = None
+		self._keyToString = None
+
+	def close(self):
+		for outputFile in self._outputFiles.values():
+			outputFile.close()
+		self._outputFiles = collections.OrderedDict()
+
+	def _outputFile(self, key):
+		outputFile = self._outputFiles.get(key)
+		if outputFile is not None:
+			self._outputFiles.move_to_end(key)
+			return outputFile
+
+		#Make room by closing the least recently used file, which costs a single flush of its buffer
+		if len(self._outputFiles) >= self._maxOpenFiles:
+			_, leastRecentlyUsed = self._outputFiles.popitem(last=False)
+			leastRecentlyUsed.close()
+
+		#Files closed to make room are reopened for appending, without another header
+		fileName = self._fileNames.get(key)
+		reopening = fileName is not None
+		if not reopening:
+			keyString = self._keyToString(key)
+			fileName = os.path.join(self._arguments.output, keyString + ('.pcap.gz' if self._arguments.gzip_output else '.pcap'))
+		mode = 'ab' if self._arguments.append or reopening else 'wb'
+		empty = mode == 'wb' or Compression.isEmptyFile(fileName)
+		outputFile = Compression.openFile(fileName, mode, level=self._arguments.compression_level,
+			threads=self._arguments.compression_threads)
+		outputFile = Format.PcapWriter(outputFile, bufferSize=OUTPUT_BUFFER_SIZE)
+
+		#Write the header at the beginning, unless instructed otherwise
+		#Appending only needs one if there is no data yet (checked before opening, since compressed files start at position 0)
+		if not reopening and not self._arguments.no_header and empty:
+			outputFile.writeHeader(self._header)
+
+		self._fileNames[key] = fileName
+		self._outputFiles[key] = outputFile
+		return outputFile
+
 	def onPcapHeader(self, header):
 		self._header = header
+
+		#Check the link type (which is needed even without a header)
+		self._packetType = packetTypeForHeader(header)
+		if self._arguments.vlan:
+			if self._packetType is not Ethernet.EthernetPacket:
+				print('ERROR: VLANs are only supported for Ethernet (link type %d)' % Ethernet.EthernetPacket.LINKTYPE)
+				sys.exit(1)
+
+			self._keyBytes = Ethernet.EthernetPacket.vlanKeyBytes
+			self._keyToString = Ethernet.EthernetPacket.vlanKeyToString
+		else:
+			self._keyBytes = self._packetType.keyBytes
+			self._keyToString = self._packetType.keyToString
+
 		if self._arguments.no_header:
 			return
 
@@ -51,35 +172,13 @@ class PcapSplitFlowsListener(Listener.PcapListener):
 		if self._arguments.snaplen > header.snaplen():
 			print('WARNING: New snaplen is greater than original: %d > %d' % (self._arguments.snaplen, header.snaplen()))
 
-		#Check the link type
-		if header.network() == Ethernet.EthernetPacket.LINKTYPE:
-			self._packetType = Ethernet.EthernetPacket
-		elif header.network() == IPv4.IPv4Packet.LINKTYPE:
-			self._packetType = IPv4.IPv4Packet
-		else:
-			print('ERROR: Link type is %d instead of %d' % (header.network(), 1))
-			sys.exit(1)
-
 		#Update with new snaplen
 		snaplen = min(self._arguments.snaplen, header.snaplen())
 		self._header.setSnaplen(snaplen)
 
 	def onPcapRecord(self, recordHeader, data):
 		packet = self._packetType(data)
-		key = packet.key()
-
-		fileName = os.path.join(self._arguments.output, key + '.pcap')
-		outputFile = self._outputFiles.get(fileName)
-		if outputFile is None:
-			mode = 'ab' if self._arguments.append else 'wb'
-			outputFile = gzip.open(fileName, mode) if fileName.endswith('.gz') else open(fileName, mode)
-
-			#Write the header at the beginning, unless instructed otherwise
-			#This neatly handles append mode
-			if not self._arguments.no_header and outputFile.tell() == 0:
-				self._header.writeToFile(outputFile)
-
-			self._outputFiles[fileName] = outputFile
+		outputFile = self._outputFile(self._keyBytes(packet))
 
 		#Update with new snaplen
 		#NOTE: since the link type doesn't change, the original length shouldn't either
@@ -89,13 +188,20 @@ class PcapSplitFlowsListener(Listener.PcapListener):
 		recordHeader.setIncludedLength(len(truncatedData))
 
 		#Write the header and data
-		recordHeader.writeToFile(outputFile)
-		outputFile.write(truncatedData)
+		outputFile.writeRecord(recordHeader, truncatedData)
 
-def main():
+def makeArgumentParser():
 	parser = argparse.ArgumentParser(description='PCAP Flow Splitting Tool')
 	parser.add_argument('input', help='PCAP file to use as input.')
 	parser.add_argument('output', help='Output path -- output files will be named based on the identifying attributes.')
+	parser.add_argument('--gzip-output', action='store_true',
+		help='Enables gzip for the output files.')
+	parser.add_argument('--vlan', action='store_true',
+		help='Split Ethernet flows by their VLAN IDs as well as their MAC addresses.')
+	parser.add_argument('--compression-level', type=int, default=None, action='store',
+		help='The compression level of compressed output (e.g. 1 for the fastest, 9 for the smallest).')
+	parser.add_argument('--compression-threads', type=int, default=0, action='store',
+		help='The number of threads compressing gzip output in parallel (0 compresses on the parsing thread).')
 
 	#Validation
 	parser.add_argument('--strict', action='store_true',
@@ -113,10 +219,38 @@ def main():
 	parser.add_argument('-a', '--append', action='store_true',
 		help='Append to the file (implies no header).')
 
-	arguments = parser.parse_args(sys.argv[1:])
+	#Resources
+	parser.add_argument('-p', '--processes', type=int, default=1, action='store',
+		help='The number of processes to split flows with in parallel, each writing the files of a share of the flows.')
+	parser.add_argument('--max-open-files', type=int, default=None, action='store',
+		help='The most output files to keep open at once (shared between processes), closing the least recently used (default %d, or fewer if the file descriptor limit is lower).' % DEFAULT_MAX_OPEN_FILES)
 
-	listener = PcapSplitFlowsListener(arguments)
-	Parser.parseFile(arguments.input, listener, strict=arguments.strict)
+	return parser
+
+def validateArguments(arguments):
+	if arguments.max_open_files is not None and arguments.max_open_files < 1:
+		print('Maximum open files must be a positive integer.')
+		sys.exit(1)
+	if arguments.processes < 1:
+		print('Processes must be a positive integer.')
+		sys.exit(1)
+
+def makeListener(arguments):
+	validateArguments(arguments)
+	return PcapSplitFlowsListener(arguments)
+
+def main():
+	arguments = makeArgumentParser().parse_args(sys.argv[1:])
+	validateArguments(arguments)
+	if arguments.processes > 1:
+		#Each process writes a share of the flows, so gets a share of the open files
+		arguments.max_open_files = max((arguments.max_open_files or defaultMaxOpenFiles()) // arguments.processes, 1)
+		Parallel.parseFilePartitioned(arguments.input, functools.partial(PcapSplitFlowsListener, arguments), flowPartitioner,
+			processes=arguments.processes, strict=arguments.strict)
+	else:
+		listener = makeListener(arguments)
+		Parser.parseFile(arguments.input, listener, strict=arguments.strict)
+		listener.close()
 
 	return 0
 
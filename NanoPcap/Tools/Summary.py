@@ -23,10 +23,12 @@
 import argparse
 import collections
 import datetime
+import functools
 import json
 import math
 import os
 import sys
+import time
 
 import inspect
 _currentFile = os.path.abspath(inspect.getfile(inspect.currentframe()))
@@ -34,8 +36,11 @@ _currentDir = os.path.dirname(_currentFile)
 _parentDir = os.path.dirname(os.path.dirname(_currentDir))
 sys.path.insert(0, _parentDir)
 
+from NanoPcap.Compression import isCompressed
 from NanoPcap.Listener import PcapListener
+from NanoPcap.Parallel import parseFileParallel
 from NanoPcap.Parser import parseFile
+from NanoPcap.Protocols.Ethernet import EthernetPacket, vlanIdsToString
 from NanoPcap.Utility import Statistics, Units
 
 class PcapSummaryListener(PcapListener):
@@ -48,7 +53,9 @@ class PcapSummaryListener(PcapListener):
 		self._originalLengths = Statistics.SummaryStatistics()
 		self._originalLengthsOrder = Statistics.OrderStatistics()
 
+		self._firstNs = None
 		self._lastNs = None
+		self._lastPacketLength = None
 		self._interpacketNs = Statistics.SummaryStatistics()
 		self._interpacketNsOrder = Statistics.OrderStatistics()
 		self._epochNs = Statistics.SummaryStatistics()
@@ -59,6 +66,14 @@ class PcapSummaryListener(PcapListener):
 		self._byteCounts = collections.Counter()
 		self._indexValues = collections.defaultdict(set)
 
+		#Breakdown by VLAN IDs (only for Ethernet)
+		self._linkType = None
+		self._vlanPackets = collections.Counter()
+		self._vlanBytes = collections.Counter()
+
+		#Periodic reports while following
+		self._nextReportTime = time.monotonic() + arguments.report_interval if arguments.follow else None
+
 	def _formatRate1000(self, value, precision=1):
 		return Units.formatUnits(value, Units.UNITS_1000, useUnits=self._arguments.use_units, precision=precision)
 
@@ -193,6 +208,34 @@ class PcapSummaryListener(PcapListener):
 			print('    %3d   0x%02X    %8d    %.3f    %.1f' % (
 				byte, byte, count, percent, percentExcess))
 
+		if self._arguments.vlan:
+			print()
+			print('VLANs:')
+			print('   VLAN                Packets          Bytes')
+			for vlanIds, count in self._vlanPackets.most_common():
+				print('   %-16s %10d %14s' % (self._formatVlanIds(vlanIds), count, self._formatRate1024(self._vlanBytes[vlanIds])))
+
+	def _formatVlanIds(self, vlanIds):
+		return vlanIdsToString(vlanIds) if len(vlanIds) > 0 else 'untagged'
+
+	def printAnyReport(self):
+		if self._arguments.json:
+			self.printJsonReport()
+		else:
+			self.printReport()
+
+	def maybePrintPeriodicReport(self):
+		"""
+		Prints a report if the report interval has passed since the last one (only while following).
+		"""
+		if self._nextReportTime is None or time.monotonic() < self._nextReportTime:
+			return
+
+		self.printAnyReport()
+		print()
+		sys.stdout.flush()
+		self._nextReportTime = time.monotonic() + self._arguments.report_interval
+
 	def printJsonReport(self):
 		output = {
 			'includedLength': {
@@ -266,13 +309,19 @@ class PcapSummaryListener(PcapListener):
 				'max': self._dataRatesOrder.max(),
 			},
 			'byteCounts': dict(self._byteCounts),
-			'indexValues': {k: list(self._indexValues[k]) for k in self._indexValues},
+			'indexValues': {k: sorted(self._indexValues[k]) for k in self._indexValues},
 		}
 
+		if self._arguments.vlan:
+			output['vlans'] = {self._formatVlanIds(vlanIds): {
+				'packets': count,
+				'bytes': self._vlanBytes[vlanIds],
+			} for vlanIds, count in self._vlanPackets.items()}
+
 		print(json.dumps(output, indent=2, separators=(',', ': '), sort_keys=True))
 
 	def onPcapHeader(self, header):
-		pass #Nothing to do
+		self._linkType = header.network()
 
 	def onPcapRecord(self, recordHeader, data):
 		self._includedLengths.sample(recordHeader.includedLength())
@@ -284,15 +333,9 @@ class PcapSummaryListener(PcapListener):
 		self._epochNs.sample(ns)
 		self._epochNsOrder.sample(ns)
 		if self._lastNs is not None:
-			dtNs = ns - self._lastNs
-			self._interpacketNs.sample(dtNs)
-			self._interpacketNsOrder.sample(dtNs)
-
-			packetRate = 1.0e9 / dtNs if dtNs > 0 else float('inf')
-			self._packetRatesOrder.sample(packetRate)
-
-			data_rate = 1.0e9 * self._lastPacketLength / dtNs if dtNs > 0 else float('inf')
-			self._dataRatesOrder.sample(data_rate)
+			self._sampleInterpacket(ns - self._lastNs)
+		else:
+			self._firstNs = ns
 
 		self._lastNs = ns
 		self._lastPacketLength = recordHeader.originalLength()
@@ -301,22 +344,117 @@ class PcapSummaryListener(PcapListener):
 			self._byteCounts[byte] += 1
 			self._indexValues[n].add(byte)
 
-def main():
+		if self._arguments.vlan:
+			self._sampleVlan(recordHeader, data)
+
+		if self._nextReportTime is not None:
+			self.maybePrintPeriodicReport()
+
+	def _sampleVlan(self, recordHeader, data):
+		vlanIds = EthernetPacket(data).vlanIds() if self._linkType == EthernetPacket.LINKTYPE else ()
+		self._vlanPackets[vlanIds] += 1
+		self._vlanBytes[vlanIds] += recordHeader.originalLength()
+
+	def _sampleInterpacket(self, dtNs):
+		self._interpacketNs.sample(dtNs)
+		self._interpacketNsOrder.sample(dtNs)
+
+		packetRate = 1.0e9 / dtNs if dtNs > 0 else float('inf')
+		self._packetRatesOrder.sample(packetRate)
+
+		data_rate = 1.0e9 * self._lastPacketLength / dtNs if dtNs > 0 else float('inf')
+		self._dataRatesOrder.sample(data_rate)
+
+	def merge(self, other):
+		#The interpacket time across the shard boundary is only known once both sides are
+		if self._lastNs is not None and other._firstNs is not None:
+			self._sampleInterpacket(other._firstNs - self._lastNs)
+
+		self._includedLengths.merge(other._includedLengths)
+		self._includedLengthsOrder.merge(other._includedLengthsOrder)
+		self._originalLengths.merge(other._originalLengths)
+		self._originalLengthsOrder.merge(other._originalLengthsOrder)
+
+		self._interpacketNs.merge(other._interpacketNs)
+		self._interpacketNsOrder.merge(other._interpacketNsOrder)
+		self._epochNs.merge(other._epochNs)
+		self._epochNsOrder.merge(other._epochNsOrder)
+		self._packetRatesOrder.merge(other._packetRatesOrder)
+		self._dataRatesOrder.merge(other._dataRatesOrder)
+
+		if self._firstNs is None:
+			self._firstNs = other._firstNs
+		if other._lastNs is not None:
+			self._lastNs = other._lastNs
+			self._lastPacketLength = other._lastPacketLength
+
+		self._byteCounts.update(other._byteCounts)
+		for n in other._indexValues:
+			self._indexValues[n] |= other._indexValues[n]
+
+		if self._linkType is None:
+			self._linkType = other._linkType
+		self._vlanPackets.update(other._vlanPackets)
+		self._vlanBytes.update(other._vlanBytes)
+
+def makeArgumentParser():
 	parser = argparse.ArgumentParser(description='PCAP Summary Diagnostic')
 	parser.add_argument('pcap', help='PCAP file to summarize.')
 	parser.add_argument('-H', '--no-header', action='store_true',
 		help='Do not show header.')
 	parser.add_argument('-j', '--json', action='store_true',
 		help='Enable JSON output with one object per line.')
-	parser.add_argument('-s', '--strict', action='store_true',
+	validationGroup = parser.add_mutually_exclusive_group()
+	validationGroup.add_argument('-s', '--strict', action='store_true',
 		help='Enables strict validation rules.')
+	validationGroup.add_argument('--trusted', action='store_true',
+		help='Skip validating records, e.g. for files written by NanoPcap (faster, but invalid records go unnoticed).')
 	parser.add_argument('-u', '--use-units', action='store_true',
 		help='Use units to make the display friendlier.')
-	arguments = parser.parse_args(sys.argv[1:])
+	parser.add_argument('--vlan', action='store_true',
+		help='Break down the packets and bytes by VLAN (for Ethernet).')
+	parser.add_argument('-m', '--mmap', action='store_true',
+		help='Memory map the input rather than reading it (ignored for compressed files).')
+	parser.add_argument('--block-size', action='store',
+		help='The size of the blocks to read the input in, e.g. 4M (defaults to 1M for compressed inputs; 0 reads each record directly).')
+	parser.add_argument('--readahead', type=int, default=0, action='store',
+		help='The number of blocks of compressed input to decompress ahead on a background thread.')
+	parser.add_argument('-p', '--processes', type=int, default=1, action='store',
+		help='The number of processes to summarize the input with in parallel (ignored for compressed files).')
+
+	#Following files as they are written
+	parser.add_argument('-f', '--follow', action='store_true',
+		help='Follow the file as it is written, printing a summary periodically.')
+	parser.add_argument('--report-interval', type=float, default=10.0, action='store',
+		help='The number of seconds between summaries when following.')
+	parser.add_argument('--poll-interval', type=float, default=0.1, action='store',
+		help='The initial number of seconds between polls for more records when following (backs off when idle).')
+	parser.add_argument('--idle-timeout', type=float, default=None, action='store',
+		help='The number of seconds without new records after which to stop following (default: never).')
+
+	return parser
+
+def makeListener(arguments):
+	return PcapSummaryListener(arguments)
 
-	listener = PcapSummaryListener(arguments)
+def main():
+	arguments = makeArgumentParser().parse_args(sys.argv[1:])
+	listener = makeListener(arguments)
+	blockSize = Units.parseUnits(arguments.block_size, Units.UNITS_1024) if arguments.block_size is not None else None
 	try:
-		parseFile(arguments.pcap, listener, strict=arguments.strict)
+		if arguments.follow:
+			truncatedBytes = parseFile(arguments.pcap, listener, strict=arguments.strict, trusted=arguments.trusted, flyweight=True,
+				blockSize=blockSize, follow=True,
+				pollInterval=arguments.poll_interval, idleTimeout=arguments.idle_timeout,
+				onPoll=listener.maybePrintPeriodicReport)
+			if truncatedBytes > 0:
+				print('WARNING: Stopped following with %d bytes of an incomplete record left' % truncatedBytes)
+		elif arguments.processes > 1 and not isCompressed(arguments.pcap):
+			listener = parseFileParallel(arguments.pcap, functools.partial(PcapSummaryListener, arguments),
+				processes=arguments.processes, strict=arguments.strict, trusted=arguments.trusted)
+		else:
+			parseFile(arguments.pcap, listener, strict=arguments.strict, trusted=arguments.trusted, flyweight=True, mmap=arguments.mmap,
+				blockSize=blockSize, readahead=arguments.readahead)
 	except KeyboardInterrupt:
 		#Allow partial reports when hitting Ctrl + C (may be slightly inaccurate)
 		print() #Skip the ^C
@@ -324,10 +462,7 @@ def main():
 		print('DO NOT FEED OUTPUT TO DOWNSTREAM TOOLS!')
 		print()
 
-	if arguments.json:
-		listener.printJsonReport()
-	else:
-		listener.printReport()
+	listener.printAnyReport()
 
 	return 0
 
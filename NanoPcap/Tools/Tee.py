@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2015-2023 Agalmic Ventures LLC (www.agalmicventures.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import argparse
+import os
+import shlex
+import sys
+import time
+
+import inspect
+_currentFile = os.path.abspath(inspect.getfile(inspect.currentframe()))
+_currentDir = os.path.dirname(_currentFile)
+_parentDir = os.path.dirname(os.path.dirname(_currentDir))
+sys.path.insert(0, _parentDir)
+
+from NanoPcap import Listener, Parser
+from NanoPcap.Tools import Dump, Filter, Split, SplitFlows, Summary
+from NanoPcap.Utility import Units
+
+#The tools which can be run, as (name, module, function called on the listener after parsing)
+TOOLS = [
+	('dump', Dump, None),
+	('summary', Summary, lambda listener: listener.printAnyReport()),
+	('filter', Filter, lambda listener: listener.close()),
+	('split', Split, lambda listener: listener.close()),
+	('split-flows', SplitFlows, lambda listener: listener.close()),
+]
+
+def main():
+	parser = argparse.ArgumentParser(description='PCAP Tee Tool -- runs several tools over a single parse of the input.')
+	parser.add_argument('input', help='PCAP file to use as input.')
+	for name, module, _ in TOOLS:
+		parser.add_argument('--%s' % name, default=[], action='append', metavar='ARGUMENTS',
+			help='Runs %s with the given arguments, omitting the input (e.g. --%s="-h" for help). May be repeated.' % (
+				module.__name__.split('.')[-1], name))
+
+	#Reading the input (tool arguments for these and for seeking, parallelism, or following are ignored)
+	validationGroup = parser.add_mutually_exclusive_group()
+	validationGroup.add_argument('-s', '--strict', action='store_true',
+		help='Enables strict validation rules.')
+	validationGroup.add_argument('--trusted', action='store_true',
+		help='Skip validating records, e.g. for files written by NanoPcap (faster, but invalid records go unnoticed).')
+	parser.add_argument('-m', '--mmap', action='store_true',
+		help='Memory map the input rather than reading it (ignored for compressed files).')
+	parser.add_argument('--block-size', action='store',
+		help='The size of the blocks to read the input in, e.g. 4M (defaults to 1M for compressed inputs; 0 reads each record directly).')
+	parser.add_argument('--readahead', type=int, default=0, action='store',
+		help='The number of blocks of compressed input to decompress ahead on a background thread.')
+	parser.add_argument('-t', '--timing', action='store_true',
+		help='Print the time spent in each tool to stderr.')
+	arguments = parser.parse_args(sys.argv[1:])
+
+	#Create the listeners using each tool's own argument parser
+	names = []
+	listeners = []
+	finishers = []
+	for name, module, finish in TOOLS:
+		for toolArguments in getattr(arguments, name.replace('-', '_')):
+			toolParser = module.makeArgumentParser()
+			toolParser.prog = '%s --%s' % (parser.prog, name)
+			listeners.append(module.makeListener(toolParser.parse_args([arguments.input] + shlex.split(toolArguments))))
+			names.append('%s %s' % (name, toolArguments))
+			finishers.append(finish)
+
+	if len(listeners) == 0:
+		parser.error('at least one tool must be given')
+
+	blockSize = Units.parseUnits(arguments.block_size, Units.UNITS_1024) if arguments.block_size is not None else None
+	listener = Listener.PcapCompositeListener(listeners, timed=arguments.timing)
+	start = time.perf_counter()
+	Parser.parseFile(arguments.input, listener, strict=arguments.strict, trusted=arguments.trusted, mmap=arguments.mmap,
+		blockSize=blockSize, readahead=arguments.readahead)
+	elapsed = time.perf_counter() - start
+
+	for toolListener, finish in zip(listeners, finishers):
+		if finish is not None:
+			finish(toolListener)
+
+	if arguments.timing:
+		timings = listener.timings()
+		print('%-40s %12s %7s' % ('Tool', 'Time (s)', '%'), file=sys.stderr)
+		for name, seconds in zip(names + ['(parsing)'], timings + [elapsed - sum(timings)]):
+			print('%-40s %12.3f %6.1f%%' % (name, seconds, 100.0 * seconds / elapsed if elapsed > 0 else 0.0), file=sys.stderr)
+
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -55,6 +55,18 @@ class OrderStatistics(object):
 		self._samples.append(x)
 		self._dirty = True
 
+	def merge(self, other):
+		"""
+		Adds all samples of another OrderStatistics.
+
+		:param other: OrderStatistics
+		"""
+		if len(other._samples) == 0:
+			return
+
+		self._samples.extend(other._samples)
+		self._dirty = True
+
 	def n(self):
 		"""
 		Returns the number of samples so far.
@@ -154,6 +166,23 @@ class SummaryStatistics(object):
 		self._average += delta / self._n
 		self._m2 += delta * (x - self._average)
 
+	def merge(self, other):
+		"""
+		Adds all samples of another SummaryStatistics, as if they had been sampled here (up to floating
+		point rounding) using the pairwise update of Chan et al.
+
+		:param other: SummaryStatistics
+		"""
+		if other._n == 0:
+			return
+
+		n = self._n + other._n
+		delta = other._average - self._average
+		self._average += delta * other._n / n
+		self._m2 += other._m2 + delta * delta * self._n * other._n / n
+		self._n = n
+		self._sum += other._sum
+
 	def n(self):
 		"""
 		Returns the number of the samples.
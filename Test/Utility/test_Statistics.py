@@ -84,6 +84,25 @@ class OrderStatisticsTest(unittest.TestCase):
 		self.assertEqual(s.q3(), 3.0)
 		self.assertEqual(s.max(), 3.0)
 
+	def test_merge(self):
+		s = Statistics.OrderStatistics()
+		s.sample(5.0)
+		s.sample(3.0)
+		s.median() #Sorts
+
+		t = Statistics.OrderStatistics()
+		t.sample(2.0)
+		t.sample(4.0)
+		t.sample(1.0)
+
+		s.merge(Statistics.OrderStatistics())
+		s.merge(t)
+		self.assertEqual(s.n(), 5)
+		self.assertEqual(s.min(), 1.0)
+		self.assertEqual(s.median(), 3.0)
+		self.assertEqual(s.max(), 5.0)
+		self.assertEqual(t.n(), 3)
+
 class SummaryStatisticsTest(unittest.TestCase):
 
 	def test_empty(self):
@@ -115,3 +134,23 @@ class SummaryStatisticsTest(unittest.TestCase):
 		self.assertEqual(s.populationVariance(), 4.0)
 		self.assertEqual(s.populationStddev(), 2.0)
 		self.assertEqual(s.sampleVariance(), 8.0)
+
+	def test_merge(self):
+		values = [5.0, 1.0, 4.0, 4.0, 9.0, -2.0, 7.5]
+		for split in range(len(values) + 1):
+			s = Statistics.SummaryStatistics()
+			for x in values[:split]:
+				s.sample(x)
+			t = Statistics.SummaryStatistics()
+			for x in values[split:]:
+				t.sample(x)
+			serial = Statistics.SummaryStatistics()
+			for x in values:
+				serial.sample(x)
+
+			s.merge(t)
+			self.assertEqual(s.n(), serial.n())
+			self.assertEqual(s.sum(), serial.sum())
+			self.assertAlmostEqual(s.average(), serial.average())
+			self.assertAlmostEqual(s.populationVariance(), serial.populationVariance())
+			self.assertAlmostEqual(s.sampleVariance(), serial.sampleVariance())
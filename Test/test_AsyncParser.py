@@ -0,0 +1,126 @@
+
+# Copyright (c) 2015-2023 Agalmic Ventures LLC (www.agalmicventures.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import asyncio
+import os
+import socket
+import sys
+import threading
+import unittest
+
+from NanoPcap import AsyncParser, Listener, Parser
+
+import inspect
+_currentFile = os.path.abspath(inspect.getfile(inspect.currentframe()))
+_currentDir = os.path.dirname(_currentFile)
+_parentDir = os.path.dirname(_currentDir)
+_testDataPath = os.path.join(_parentDir, 'TestData')
+
+def _streamReader(data, chunkSize):
+	"""
+	Creates a StreamReader fed with the given data in chunks (must be called in a running loop).
+	"""
+	reader = asyncio.StreamReader()
+	for i in range(0, len(data), chunkSize):
+		reader.feed_data(data[i:i + chunkSize])
+	reader.feed_eof()
+	return reader
+
+class AsyncParserTest(unittest.TestCase):
+
+	def setUp(self):
+		self._expected = {}
+		for name in ['SSH_L3.pcap', 'SSH2_L3.pcap', 'Empty.pcap']:
+			with open(os.path.join(_testDataPath, name), 'rb') as pcapFile:
+				data = pcapFile.read()
+				pcapFile.seek(0)
+				parser = Parser.PcapParser(pcapFile)
+				self._expected[name] = (data, [(r.asBytes(), bytes(d)) for r, d in parser.parse()])
+
+	def test_parse(self):
+		async def run(data, chunkSize, blockSize):
+			parser = AsyncParser.AsyncPcapParser(_streamReader(data, chunkSize), blockSize=blockSize)
+			self.assertEqual(parser.header(), None)
+			records = [(r.asBytes(), d) async for r, d in parser.parse()]
+			self.assertTrue(parser.header() is not None)
+			return records
+
+		for name, (data, expected) in self._expected.items():
+			for chunkSize in [1, 7, 100, 100000]:
+				for blockSize in [1, 64, Parser.DEFAULT_BLOCK_SIZE]:
+					self.assertEqual(asyncio.run(run(data, chunkSize, blockSize)), expected)
+
+	def test_parseBatches(self):
+		async def run(data, chunkSize, batchSize):
+			parser = AsyncParser.AsyncPcapParser(_streamReader(data, chunkSize), blockSize=50)
+			return [(r.asBytes(), bytes(d)) async for batch in parser.parseBatches(batchSize) for r, d in batch.records()]
+
+		for name, (data, expected) in self._expected.items():
+			for chunkSize in [1, 33, 100000]:
+				for batchSize in [1, 3, 1000]:
+					self.assertEqual(asyncio.run(run(data, chunkSize, batchSize)), expected)
+
+	def test_truncated(self):
+		async def run(data):
+			return [r async for r in AsyncParser.AsyncPcapParser(_streamReader(data, 10)).parse()]
+
+		data, expected = self._expected['SSH_L3.pcap']
+		with self.assertRaises(ValueError):
+			asyncio.run(run(data[:10]))
+		with self.assertRaises(ValueError):
+			asyncio.run(run(data[:30]))
+		with self.assertRaises(ValueError):
+			asyncio.run(run(data[:-1]))
+
+	def test_socketpair(self):
+		data, expected = self._expected['SSH2_L3.pcap']
+
+		async def run(listener):
+			readSocket, writeSocket = socket.socketpair()
+			sender = threading.Thread(target=lambda: (writeSocket.sendall(data), writeSocket.close()))
+			sender.start()
+			writer = None
+			try:
+				reader, writer = await asyncio.open_connection(sock=readSocket)
+				await AsyncParser.parse(reader, listener, batchSize=4)
+			finally:
+				sender.join()
+				if writer is not None:
+					writer.close()
+					await writer.wait_closed()
+				readSocket.close()
+
+		for listener in [Listener.PcapRecordingListener(), Listener.PcapBatchAdapterListener(Listener.PcapRecordingListener())]:
+			asyncio.run(run(listener))
+			recordingListener = listener.listener() if hasattr(listener, 'listener') else listener
+			self.assertTrue(recordingListener.header() is not None)
+			self.assertEqual([r.asBytes() for r in recordingListener.recordHeaders()], [r for r, _ in expected])
+
+	def test_subprocess(self):
+		async def run():
+			process = await asyncio.create_subprocess_exec(sys.executable, '-c',
+				'import shutil, sys; shutil.copyfileobj(open(sys.argv[1], "rb"), sys.stdout.buffer)',
+				os.path.join(_testDataPath, 'SSH_L3.pcap'), stdout=asyncio.subprocess.PIPE)
+			records = [(r.asBytes(), d) async for r, d in AsyncParser.AsyncPcapParser(process.stdout).parse()]
+			await process.wait()
+			return records
+
+		self.assertEqual(asyncio.run(run()), self._expected['SSH_L3.pcap'][1])
@@ -0,0 +1,228 @@
+
+# Copyright (c) 2015-2023 Agalmic Ventures LLC (www.agalmicventures.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from NanoPcap import Compression, Index, Listener, Parser
+
+import inspect
+_currentFile = os.path.abspath(inspect.getfile(inspect.currentframe()))
+_currentDir = os.path.dirname(_currentFile)
+_parentDir = os.path.dirname(_currentDir)
+_testDataPath = os.path.join(_parentDir, 'TestData')
+
+class FailingFile(io.RawIOBase):
+
+	def readable(self):
+		return True
+
+	def readinto(self, b):
+		raise OSError('Read failed')
+
+class FailingWriteFile(io.RawIOBase):
+
+	def writable(self):
+		return True
+
+	def write(self, b):
+		raise OSError('Write failed')
+
+class CompressionTest(unittest.TestCase):
+
+	def setUp(self):
+		self._tempDir = tempfile.mkdtemp()
+		self._pcapFileName = os.path.join(_testDataPath, 'SSH_L3.pcap')
+		with open(self._pcapFileName, 'rb') as pcapFile:
+			self._data = pcapFile.read()
+
+		listener = Listener.PcapRecordingListener()
+		Parser.parseFile(self._pcapFileName, listener)
+		self._recordHeaders = [r.asBytes() for r in listener.recordHeaders()]
+
+	def tearDown(self):
+		shutil.rmtree(self._tempDir)
+
+	def test_codecExtension(self):
+		self.assertEqual(Compression.codecExtension('a.pcap'), None)
+		self.assertEqual(Compression.codecExtension('a.pcap.gz'), '.gz')
+		self.assertEqual(Compression.codecExtension('a.pcap.bz2'), '.bz2')
+		self.assertEqual(Compression.codecExtension('a.pcap.xz'), '.xz')
+		self.assertFalse(Compression.isCompressed('a.pcap'))
+		self.assertTrue(Compression.isCompressed('a.pcap.xz'))
+
+	def test_isEmptyFile(self):
+		fileName = os.path.join(self._tempDir, 'SSH_L3.pcap.gz')
+		self.assertTrue(Compression.isEmptyFile(fileName))
+		with Compression.openFile(fileName, 'wb', threads=2):
+			pass
+		self.assertFalse(Compression.isEmptyFile(fileName)) #The gzip header
+
+		#Compressed files opened for appending start at position 0, so their position says nothing
+		with Compression.openFile(fileName, 'ab') as outputFile:
+			self.assertEqual(outputFile.tell(), 0)
+
+	def test_readahead(self):
+		for bufferSize in [1, 7, 100, 1000000]:
+			for queueDepth in [1, 4]:
+				with Compression.ReadaheadFile(io.BytesIO(self._data), bufferSize=bufferSize, queueDepth=queueDepth) as readaheadFile:
+					self.assertEqual(readaheadFile.read(), self._data)
+					self.assertEqual(readaheadFile.read(), b'')
+
+		with Compression.ReadaheadFile(io.BytesIO(self._data), bufferSize=10) as readaheadFile:
+			self.assertEqual(readaheadFile.read(15), self._data[:15])
+			self.assertEqual(readaheadFile.read(3), self._data[15:18])
+
+		with self.assertRaises(ValueError):
+			Compression.ReadaheadFile(io.BytesIO(self._data), bufferSize=0)
+		with self.assertRaises(ValueError):
+			Compression.ReadaheadFile(io.BytesIO(self._data), queueDepth=0)
+
+	def test_readaheadError(self):
+		with Compression.ReadaheadFile(FailingFile()) as readaheadFile:
+			with self.assertRaises(OSError):
+				readaheadFile.read(1)
+
+	def test_readaheadClose(self):
+		#Closing with a full queue must not block on the reading thread
+		readaheadFile = Compression.ReadaheadFile(io.BytesIO(self._data), bufferSize=1, queueDepth=1)
+		readaheadFile.read(1)
+		readaheadFile.close()
+		self.assertTrue(readaheadFile.closed)
+		self.assertFalse(readaheadFile._thread.is_alive())
+
+	def test_writebehind(self):
+		for queueDepth in [1, 4]:
+			fileName = os.path.join(self._tempDir, 'SSH_L3.pcap.gz')
+			with Compression.WritebehindFile(Compression.openFile(fileName, 'wb'), queueDepth=queueDepth) as writebehindFile:
+				self.assertEqual(writebehindFile.tell(), 0)
+				buffer = bytearray(self._data[:100])
+				writebehindFile.write(buffer)
+				#Reusing the buffer must not change what was written
+				buffer[:] = bytes(100)
+				writebehindFile.write(memoryview(self._data)[100:])
+				self.assertEqual(writebehindFile.tell(), len(self._data))
+
+			with Compression.openFile(fileName, 'rb') as inputFile:
+				self.assertEqual(inputFile.read(), self._data)
+
+		output = io.BytesIO()
+		with Compression.WritebehindFile(output) as writebehindFile:
+			writebehindFile.write(self._data)
+		self.assertTrue(output.closed)
+
+		with self.assertRaises(ValueError):
+			Compression.WritebehindFile(io.BytesIO(), queueDepth=0)
+
+	def test_writebehindError(self):
+		writebehindFile = Compression.WritebehindFile(FailingWriteFile(), queueDepth=1)
+		with self.assertRaises(OSError):
+			#The error is raised by a later write or by closing
+			for _ in range(10):
+				writebehindFile.write(b'1234')
+			writebehindFile.close()
+		writebehindFile.close()
+		self.assertFalse(writebehindFile._thread.is_alive())
+
+	def test_parallelGzip(self):
+		fileName = os.path.join(self._tempDir, 'SSH_L3.pcap.gz')
+		for level in [0, 1, 9]:
+			for chunkSize in [1000, Compression.DEFAULT_PARALLEL_GZIP_CHUNK_SIZE]:
+				for writeSize in [1, 777, len(self._data)]:
+					with Compression.ParallelGzipFile(open(fileName, 'wb'), level=level, threads=3, chunkSize=chunkSize) as outputFile:
+						for start in range(0, len(self._data), writeSize):
+							outputFile.write(memoryview(self._data)[start:start + writeSize])
+						self.assertEqual(outputFile.tell(), len(self._data))
+
+					with open(fileName, 'rb') as inputFile:
+						self.assertEqual(gzip.decompress(inputFile.read()), self._data)
+
+		#Empty files and appending (which adds a member)
+		with Compression.openFile(fileName, 'wb', threads=2):
+			pass
+		with gzip.open(fileName, 'rb') as inputFile:
+			self.assertEqual(inputFile.read(), b'')
+		with Compression.openFile(fileName, 'ab', threads=2) as outputFile:
+			outputFile.write(self._data[:24])
+		with Compression.openFile(fileName, 'ab', level=1, threads=2) as outputFile:
+			outputFile.write(self._data[24:])
+
+		listener = Listener.PcapRecordingListener()
+		Parser.parseFile(fileName, listener)
+		self.assertEqual([r.asBytes() for r in listener.recordHeaders()], self._recordHeaders)
+
+		with self.assertRaises(ValueError):
+			Compression.ParallelGzipFile(io.BytesIO(), level=10)
+		with self.assertRaises(ValueError):
+			Compression.ParallelGzipFile(io.BytesIO(), threads=0)
+
+	def test_gzipMembers(self):
+		#Both writers start new members periodically, so that readers can seek to them
+		fileName = os.path.join(self._tempDir, 'SSH_L3.pcap.gz')
+		for makeFile in [lambda f: Compression.MultiMemberGzipFile(f, memberSize=1000),
+				lambda f: Compression.ParallelGzipFile(f, threads=2, chunkSize=300, memberSize=1000)]:
+			with makeFile(open(fileName, 'wb')) as outputFile:
+				for start in range(0, len(self._data), 100):
+					outputFile.write(self._data[start:start + 100])
+				self.assertEqual(outputFile.tell(), len(self._data))
+
+			with open(fileName, 'rb') as inputFile:
+				self.assertEqual(gzip.decompress(inputFile.read()), self._data)
+
+			with open(fileName, 'rb') as rawFile, Index.GzipCheckpointFile(rawFile) as inputFile:
+				self.assertEqual(inputFile.read(), self._data)
+				members = inputFile.gzipMembers()
+				self.assertGreater(len(members), len(self._data) // 2000)
+				self.assertTrue(all(b[0] - a[0] >= 1000 for a, b in zip(members, members[1:])))
+
+			#Known members let a fresh file start decompressing near the target
+			with open(fileName, 'rb') as rawFile, Index.GzipCheckpointFile(rawFile, gzipMembers=members) as inputFile:
+				inputFile.seek(members[-1][0] + 10)
+				self.assertEqual(inputFile.read(), self._data[members[-1][0] + 10:])
+
+		with self.assertRaises(ValueError):
+			Compression.MultiMemberGzipFile(io.BytesIO(), memberSize=0)
+		with self.assertRaises(ValueError):
+			Compression.ParallelGzipFile(io.BytesIO(), memberSize=0)
+
+	def test_compressionLevel(self):
+		for extension in sorted(Compression.CODECS):
+			fileName = os.path.join(self._tempDir, 'SSH_L3.pcap' + extension)
+			with Compression.openFile(fileName, 'wb', level=1) as outputFile:
+				outputFile.write(self._data)
+			with Compression.openFile(fileName, 'rb') as inputFile:
+				self.assertEqual(inputFile.read(), self._data)
+
+	def test_codecs(self):
+		for extension in sorted(Compression.CODECS):
+			fileName = os.path.join(self._tempDir, 'SSH_L3.pcap' + extension)
+			with Compression.openFile(fileName, 'wb') as outputFile:
+				outputFile.write(self._data)
+
+			for readahead in [0, 2]:
+				for blockSize in [0, 100, Parser.DEFAULT_BLOCK_SIZE]:
+					listener = Listener.PcapRecordingListener()
+					Parser.parseFile(fileName, listener, blockSize=blockSize, readahead=readahead)
+					self.assertEqual([r.asBytes() for r in listener.recordHeaders()], self._recordHeaders)
@@ -0,0 +1,204 @@
+
+# Copyright (c) 2015-2023 Agalmic Ventures LLC (www.agalmicventures.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import random
+import struct
+import unittest
+
+from NanoPcap import Flows, Format, Parser
+from NanoPcap.Protocols import Ethernet, IPv4, IPv6
+
+import inspect
+_currentFile = os.path.abspath(inspect.getfile(inspect.currentframe()))
+_currentDir = os.path.dirname(_currentFile)
+_parentDir = os.path.dirname(_currentDir)
+_testDataPath = os.path.join(_parentDir, 'TestData')
+
+SECOND = 1000 * 1000 * 1000
+
+def makeIpv4Packet(source, destination, protocol=17, ports=(5000, 53)):
+	udp = struct.pack('!HHHH', ports[0], ports[1], 8, 0)
+	return struct.pack('!BBHHHBBH4s4s', 0x45, 0, 28, 0, 0, 64, protocol, 0, bytes(source), bytes(destination)) + udp
+
+class FlowKeyTest(unittest.TestCase):
+
+	def test_ipv4(self):
+		forward = Flows.flowKeyBytes(IPv4.IPv4Packet(makeIpv4Packet([10, 0, 0, 2], [10, 0, 0, 1])))
+		reverse = Flows.flowKeyBytes(IPv4.IPv4Packet(makeIpv4Packet([10, 0, 0, 1], [10, 0, 0, 2], ports=(53, 5000))))
+		self.assertEqual(forward, reverse)
+		self.assertEqual(len(forward), 13)
+		self.assertEqual(Flows.flowKeyToString(forward), 'UDP_10.0.0.1:53_10.0.0.2:5000')
+
+		#Different ports are different flows
+		otherPort = Flows.flowKeyBytes(IPv4.IPv4Packet(makeIpv4Packet([10, 0, 0, 2], [10, 0, 0, 1], ports=(5001, 53))))
+		self.assertNotEqual(forward, otherPort)
+
+		#Protocols without ports use 0
+		icmp = Flows.flowKeyBytes(IPv4.IPv4Packet(makeIpv4Packet([10, 0, 0, 2], [10, 0, 0, 1], protocol=1)))
+		self.assertEqual(Flows.flowKeyToString(icmp), 'ICMP_10.0.0.1:0_10.0.0.2:0')
+
+	def test_ipv6(self):
+		udp = struct.pack('!HHHH', 5000, 53, 8, 0)
+		source = bytes.fromhex('20010DB8000000000000000000000001')
+		destination = bytes.fromhex('20010DB8000000000000000000000002')
+		packet = IPv6.IPv6Packet(struct.pack('!IHBB', 0x60000000, 8, 17, 64) + destination + source + udp)
+		key = Flows.flowKeyBytes(packet)
+		self.assertEqual(len(key), 37)
+		self.assertEqual(Flows.flowKeyToString(key), 'UDP_[2001:db8::1]:53_[2001:db8::2]:5000')
+
+class FlowTableTest(unittest.TestCase):
+
+	def setUp(self):
+		self._evicted = []
+		self._table = Flows.FlowTable(self._evicted.append, idleTimeoutNanos=10 * SECOND, tickNanos=SECOND)
+
+	def test_counters(self):
+		self._table.sample('a', 1 * SECOND, 100)
+		self._table.sample('b', 2 * SECOND, 50)
+		self._table.sample('a', 3 * SECOND, 200)
+		self.assertEqual(len(self._table), 2)
+		self.assertIn('a', self._table)
+
+		flow = self._table.flow('a')
+		self.assertEqual(flow.key(), 'a')
+		self.assertEqual(flow.packets(), 2)
+		self.assertEqual(flow.bytes(), 300)
+		self.assertEqual(flow.firstNanos(), 1 * SECOND)
+		self.assertEqual(flow.lastNanos(), 3 * SECOND)
+		self.assertEqual(flow.durationNanos(), 2 * SECOND)
+		self.assertIsNone(self._table.flow('c'))
+		self.assertEqual(sorted(flow.key() for flow in self._table.flows()), ['a', 'b'])
+
+	def test_idleEviction(self):
+		self._table.sample('a', 1 * SECOND, 100)
+		self._table.sample('b', 5 * SECOND, 100)
+
+		#Not idle for the whole timeout yet
+		self._table.advance(11 * SECOND - 1)
+		self.assertEqual(self._evicted, [])
+
+		self._table.advance(11 * SECOND)
+		self.assertEqual([flow.key() for flow in self._evicted], ['a'])
+		self.assertEqual(len(self._table), 1)
+
+		#Packets keep flows alive
+		self._table.sample('b', 14 * SECOND, 100)
+		self._table.advance(20 * SECOND)
+		self.assertEqual(len(self._evicted), 1)
+		self._table.advance(24 * SECOND)
+		self.assertEqual([flow.key() for flow in self._evicted], ['a', 'b'])
+		self.assertEqual(self._evicted[1].packets(), 2)
+		self.assertEqual(len(self._table), 0)
+
+	def test_slotReuse(self):
+		self._table.sample('a', 0, 1)
+		self._table.advance(20 * SECOND)
+		self._table.sample('b', 20 * SECOND, 2)
+		self.assertEqual(self._table.flow('b').bytes(), 2)
+		self.assertEqual(len(self._table._keys), 1)
+
+		#A returning key is a new flow
+		self._table.sample('a', 21 * SECOND, 3)
+		self.assertEqual(self._table.flow('a').packets(), 1)
+		self.assertEqual(self._table.flow('a').firstNanos(), 21 * SECOND)
+
+	def test_longGap(self):
+		for n in range(100):
+			self._table.sample(n, n * SECOND // 10, 1)
+
+		self._table.sample('late', 1000 * 24 * 3600 * SECOND, 1)
+		self.assertEqual(len(self._evicted), 100)
+		self.assertEqual(len(self._table), 1)
+
+	def test_evictAll(self):
+		self._table.sample('a', 3 * SECOND, 1)
+		self._table.sample('b', 1 * SECOND, 1)
+		self._table.sample('c', 2 * SECOND, 1)
+		self._table.evictAll()
+		self.assertEqual([flow.key() for flow in self._evicted], ['b', 'c', 'a'])
+		self.assertEqual(len(self._table), 0)
+
+		#Nothing is left on the wheel
+		self._table.advance(100 * SECOND)
+		self.assertEqual(len(self._evicted), 3)
+
+	def test_random(self):
+		rng = random.Random(1234)
+		timeout = self._table.idleTimeoutNanos()
+		lastSeen = {}
+		now = 0
+		for _ in range(20000):
+			now += rng.randrange(SECOND // 2)
+			key = rng.randrange(200)
+			self._table.sample(key, now, 1)
+
+			#Flows are evicted once idle for the timeout (before the new packet is counted), and within a tick after it
+			for flow in self._evicted:
+				self.assertGreaterEqual(now - flow.lastNanos(), timeout)
+				self.assertEqual(lastSeen.pop(flow.key()), flow.lastNanos())
+			del self._evicted[:]
+			lastSeen[key] = now
+			for key, lastNanos in lastSeen.items():
+				self.assertLess(now - lastNanos, timeout + SECOND)
+
+		self.assertEqual(len(self._table), len(lastSeen))
+
+	def test_invalid(self):
+		with self.assertRaises(ValueError):
+			Flows.FlowTable(None, idleTimeoutNanos=0)
+		with self.assertRaises(ValueError):
+			Flows.FlowTable(None, tickNanos=0)
+
+class FlowTableListenerTest(unittest.TestCase):
+
+	def test_listener(self):
+		evicted = []
+		listener = Flows.PcapFlowTableListener(Flows.FlowTable(evicted.append))
+		Parser.parseFile(os.path.join(_testDataPath, 'SSH_L3.pcap'), listener)
+		self.assertEqual(len(listener.flowTable()), 1)
+		self.assertEqual(listener.skipped(), 0)
+
+		listener.close()
+		self.assertEqual(len(evicted), 1)
+		self.assertEqual(Flows.flowKeyToString(evicted[0].key()), 'TCP_192.168.1.192:61501_192.168.1.241:22')
+		self.assertEqual(evicted[0].packets(), 21)
+
+	def test_unsupported(self):
+		listener = Flows.PcapFlowTableListener(Flows.FlowTable(None))
+		with self.assertRaises(ValueError):
+			listener.onPcapHeader(Format.PcapHeader(Format.PCAP_MAGIC_NUMBER, 2, 4, 0, 0, 65535, 105))
+
+	def test_ethernet(self):
+		listener = Flows.PcapFlowTableListener(Flows.FlowTable(None))
+		listener.onPcapHeader(Format.PcapHeader(Format.PCAP_MAGIC_NUMBER, 2, 4, 0, 0, 65535, Ethernet.EthernetPacket.LINKTYPE))
+		header = Format.PcapHeader(Format.PCAP_MAGIC_NUMBER, 2, 4, 0, 0, 65535, Ethernet.EthernetPacket.LINKTYPE)
+
+		ipv4 = bytes(12) + b'\x08\x00' + makeIpv4Packet([10, 0, 0, 2], [10, 0, 0, 1])
+		arp = bytes(12) + b'\x08\x06' + bytes(28)
+		for n, data in enumerate([ipv4, arp, ipv4]):
+			listener.onPcapRecord(Format.PcapRecordHeader(n, 0, len(data), len(data), header), data)
+
+		self.assertEqual(listener.skipped(), 1)
+		self.assertEqual([flow.packets() for flow in listener.flowTable().flows()], [2])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,119 @@
+
+# Copyright (c) 2015-2023 Agalmic Ventures LLC (www.agalmicventures.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from NanoPcap import Follow, Listener, Parser
+
+import inspect
+_currentFile = os.path.abspath(inspect.getfile(inspect.currentframe()))
+_currentDir = os.path.dirname(_currentFile)
+_parentDir = os.path.dirname(_currentDir)
+_testDataPath = os.path.join(_parentDir, 'TestData')
+
+class FollowTest(unittest.TestCase):
+
+	def setUp(self):
+		self._tempDir = tempfile.mkdtemp()
+		self._pcapFileName = os.path.join(self._tempDir, 'SSH_L3.pcap')
+		with open(os.path.join(_testDataPath, 'SSH_L3.pcap'), 'rb') as pcapFile:
+			self._data = pcapFile.read()
+
+		listener = Listener.PcapRecordingListener()
+		Parser.parseFile(os.path.join(_testDataPath, 'SSH_L3.pcap'), listener)
+		self._recordHeaders = [r.asBytes() for r in listener.recordHeaders()]
+		self._recordLengths = [len(r.asBytes()) + r.includedLength() for r in listener.recordHeaders()]
+
+	def tearDown(self):
+		shutil.rmtree(self._tempDir)
+
+	def _writeSlowly(self, chunkSize, delay):
+		"""
+		Writes the test data in chunks (splitting headers and records) from another thread.
+		"""
+		def write():
+			with open(self._pcapFileName, 'ab') as pcapFile:
+				for i in range(0, len(self._data), chunkSize):
+					pcapFile.write(self._data[i:i + chunkSize])
+					pcapFile.flush()
+					time.sleep(delay)
+
+		open(self._pcapFileName, 'wb').close()
+		writer = threading.Thread(target=write)
+		writer.start()
+		return writer
+
+	def test_followFile(self):
+		with Follow.FollowFile(io.BytesIO(self._data), pollInterval=0.001, idleTimeout=0.01) as followFile:
+			self.assertEqual(followFile.read(10), self._data[:10])
+			self.assertEqual(followFile.read(), self._data[10:])
+			self.assertEqual(followFile.read(1), b'')
+
+		with self.assertRaises(ValueError):
+			Follow.FollowFile(io.BytesIO(), pollInterval=0)
+		with self.assertRaises(ValueError):
+			Follow.FollowFile(io.BytesIO(), pollInterval=1.0, maxPollInterval=0.5)
+		with self.assertRaises(ValueError):
+			Follow.FollowFile(io.BytesIO(), backoff=0.5)
+
+	def test_follow(self):
+		for chunkSize, blockSize in [(37, 0), (100, 64), (1000, Parser.DEFAULT_BLOCK_SIZE)]:
+			writer = self._writeSlowly(chunkSize, 0.001)
+			polls = []
+			listener = Listener.PcapRecordingListener()
+			try:
+				Parser.parseFile(self._pcapFileName, listener, blockSize=blockSize, follow=True,
+					pollInterval=0.001, maxPollInterval=0.01, idleTimeout=0.2, onPoll=lambda: polls.append(None))
+			finally:
+				writer.join()
+
+			self.assertEqual([r.asBytes() for r in listener.recordHeaders()], self._recordHeaders)
+			self.assertTrue(len(polls) > 0)
+
+	def test_followTruncated(self):
+		#Following stops cleanly at the last complete record when the file stops mid-record
+		lastRecordLength = self._recordLengths[-1]
+		for truncatedBytes in [0, 10, lastRecordLength - 9]:
+			with open(self._pcapFileName, 'wb') as pcapFile:
+				pcapFile.write(self._data[:len(self._data) - lastRecordLength + truncatedBytes])
+			expected = self._recordHeaders[:-1]
+
+			for blockSize, listener in [(0, Listener.PcapRecordingListener()), (64, Listener.PcapRecordingListener()),
+					(0, Listener.PcapBatchAdapterListener(Listener.PcapRecordingListener()))]:
+				self.assertEqual(Parser.parseFile(self._pcapFileName, listener, blockSize=blockSize, follow=True,
+					pollInterval=0.01, idleTimeout=0.1), truncatedBytes)
+
+				recordingListener = listener.listener() if hasattr(listener, 'listener') else listener
+				self.assertEqual([r.asBytes() for r in recordingListener.recordHeaders()], expected)
+
+		#Without following, incomplete records are still errors
+		with self.assertRaises(ValueError):
+			Parser.parseFile(self._pcapFileName, Listener.PcapDoNothingListener())
+
+	def test_followCompressed(self):
+		with self.assertRaises(ValueError):
+			Parser.parseFile(os.path.join(_testDataPath, 'Empty.pcap.gz'), Listener.PcapDoNothingListener(), follow=True)
@@ -19,6 +19,10 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import array
+import io
+import os
+import tempfile
 import unittest
 
 from NanoPcap import Format
@@ -95,3 +99,131 @@ class FormatTest(unittest.TestCase):
 
 		self.assertEqual(recordHeader.includedLength(), initial[2])
 		self.assertEqual(recordHeader.originalLength(), initial[3])
+
+	def test_copy(self):
+		initialHeader = list(self._initialHeader)
+		initialHeader[0] = Format.PCAP_NS_MAGIC_NUMBER
+		header = Format.PcapHeader(*initialHeader)
+		headerCopy = header.copy()
+		self.assertEqual(headerCopy.asBytes(), header.asBytes())
+		headerCopy.setSnaplen(1)
+		self.assertNotEqual(header.snaplen(), 1)
+
+		recordHeader = Format.PcapRecordHeader(*self._initialRecordHeader, fileHeader=header)
+		recordHeaderCopy = recordHeader.copy()
+		self.assertEqual(recordHeaderCopy.asBytes(), recordHeader.asBytes())
+		self.assertTrue(recordHeaderCopy.fileHeader() is header)
+		recordHeaderCopy.setIncludedLength(0)
+		self.assertEqual(recordHeader.includedLength(), self._initialRecordHeader[2])
+
+	def test_fracNanos(self):
+		self.assertEqual(Format.PcapHeader(*self._initialHeader).fracNanos(), 1000)
+		initialHeader = list(self._initialHeader)
+		initialHeader[0] = Format.PCAP_NS_MAGIC_NUMBER
+		header = Format.PcapHeader(*initialHeader)
+		self.assertEqual(header.fracNanos(), 1)
+
+		self.assertEqual(Format.PcapRecordHeader(*self._initialRecordHeader).fracNanos(), 1)
+		self.assertEqual(Format.PcapRecordHeader(1, 2, 3, 4, fileHeader=header).fracNanos(), 1)
+		microsHeader = Format.PcapHeader(*self._initialHeader)
+		recordHeader = Format.PcapRecordHeader.unchecked(1, 2, 3, 4, fileHeader=microsHeader)
+		self.assertEqual(recordHeader.fracNanos(), 1000)
+		self.assertEqual(recordHeader.epochNanos(), 1000 * 1000 * 1000 + 2000)
+
+		epochNanos = Format.epochNanosArray([1, 2], [3, 999999], 1000)
+		self.assertEqual(epochNanos.typecode, Format.BATCH_ARRAY_TYPECODE)
+		self.assertEqual(list(epochNanos), [1000003000, 2999999000])
+
+	def test_recordUnchecked(self):
+		header = Format.PcapHeader(*self._initialHeader)
+		recordHeader = Format.PcapRecordHeader(*self._initialRecordHeader)
+		uncheckedRecordHeader = Format.PcapRecordHeader.unchecked(*self._initialRecordHeader)
+		self.assertEqual(uncheckedRecordHeader.asBytes(), recordHeader.asBytes())
+		self.assertEqual(uncheckedRecordHeader.epochNanos(), recordHeader.epochNanos())
+		self.assertTrue(uncheckedRecordHeader.fileHeader() is None)
+		self.assertTrue(Format.PcapRecordHeader.unchecked(1, 2, 3, 4, fileHeader=header).fileHeader() is header)
+
+		#No validation at all
+		with self.assertRaises(ValueError):
+			Format.PcapRecordHeader(0, 10 ** 9, 0, 0)
+		self.assertEqual(Format.PcapRecordHeader.unchecked(0, 10 ** 9, 0, 0).tsFrac(), 10 ** 9)
+
+	def test_recordBatchValidation(self):
+		header = Format.PcapHeader(Format.PCAP_MAGIC_NUMBER, 2, 4, 0, 0, 100, 1)
+
+		def makeBatch(tsFrac, includedLength, originalLength):
+			a = lambda value: array.array(Format.BATCH_ARRAY_TYPECODE, [value])
+			return Format.PcapRecordBatch(header, a(1), a(tsFrac), a(1000 + tsFrac), a(includedLength), a(originalLength),
+				a(24), bytes(includedLength), a(0))
+
+		makeBatch(999999, 100, 100).validate(strict=True)
+		makeBatch(0, 100, 50).validate()
+		with self.assertRaises(ValueError):
+			makeBatch(1000000, 100, 100).validate()
+		with self.assertRaises(ValueError):
+			makeBatch(0, 100, 50).validate(strict=True)
+		with self.assertRaises(ValueError):
+			makeBatch(0, 101, 101).validate(strict=True)
+
+	def _writeRecords(self, writer, header, records):
+		writer.writeHeader(header)
+		for recordHeader, data in records:
+			writer.writeRecord(recordHeader, data)
+
+	def test_writer(self):
+		header = Format.PcapHeader(Format.PCAP_MAGIC_NUMBER, 2, 4, 0, 0, 65535, 1)
+		records = []
+		for i in range(100):
+			data = bytes([i]) * (i * 7 % 300)
+			records.append((Format.PcapRecordHeader(1000 + i, i, len(data), len(data) + 1, fileHeader=header), data))
+		records.append((Format.PcapRecordHeader(2000, 0, 0, 0, fileHeader=header), b''))
+		records.append((Format.PcapRecordHeader(2001, 0, 5, 5, fileHeader=header), memoryview(b'12345')))
+		for i in range(3):
+			#Long enough to be passed to os.writev directly
+			data = bytearray([i]) * (Format.WRITEV_MIN_DATA_LENGTH + i)
+			records.append((Format.PcapRecordHeader(3000 + i, 0, len(data), len(data), fileHeader=header), data))
+		expected = header.asBytes() + b''.join(r.asBytes() + bytes(data) for r, data in records)
+
+		#Streams, with buffers large, small (forcing large records to be written directly), and flushing every record
+		for bufferSize, flushInterval in [(Format.DEFAULT_WRITER_BUFFER_SIZE, None), (64, None), (1024, 0.0)]:
+			output = io.BytesIO()
+			writer = Format.PcapWriter(output, bufferSize=bufferSize, flushInterval=flushInterval)
+			self._writeRecords(writer, header, records)
+			self.assertEqual(writer.tell(), len(expected))
+			writer.flush()
+			self.assertEqual(output.getvalue(), expected)
+
+		#Plain files, with and without writev
+		with tempfile.TemporaryDirectory() as directory:
+			fileName = os.path.join(directory, 'test.pcap')
+			for bufferSize in [Format.DEFAULT_WRITER_BUFFER_SIZE, 64]:
+				for writev in [True, False]:
+					with Format.PcapWriter(open(fileName, 'wb'), bufferSize=bufferSize, writev=writev) as writer:
+						self.assertEqual(writer.tell(), 0)
+						self._writeRecords(writer, header, records)
+						self.assertEqual(writer.tell(), len(expected))
+					with open(fileName, 'rb') as pcapFile:
+						self.assertEqual(pcapFile.read(), expected)
+
+			#Appending continues after the existing contents
+			with Format.PcapWriter(open(fileName, 'ab')) as writer:
+				self.assertEqual(writer.tell(), len(expected))
+				writer.writeRecord(*records[1])
+			with open(fileName, 'rb') as pcapFile:
+				self.assertEqual(pcapFile.read(), expected + records[1][0].asBytes() + records[1][1])
+
+	def test_writer_large_raw_write(self):
+		#Raw writes larger than the buffer stay in order with the records around them
+		header = Format.PcapHeader(Format.PCAP_MAGIC_NUMBER, 2, 4, 0, 0, 65535, 1)
+		recordHeader = Format.PcapRecordHeader(1000, 0, 3, 3, fileHeader=header)
+		expected = b'A' * 10 + b'B' * 100 + recordHeader.asBytes() + b'CCC'
+		with tempfile.TemporaryDirectory() as directory:
+			fileName = os.path.join(directory, 'test.pcap')
+			for writev in [True, False]:
+				with Format.PcapWriter(open(fileName, 'wb'), bufferSize=32, writev=writev) as writer:
+					writer.write(b'A' * 10)
+					writer.write(bytearray(b'B' * 100))
+					writer.writeRecord(recordHeader, b'CCC')
+					self.assertEqual(writer.tell(), len(expected))
+				with open(fileName, 'rb') as pcapFile:
+					self.assertEqual(pcapFile.read(), expected)
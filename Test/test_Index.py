@@ -0,0 +1,176 @@
+
+# Copyright (c) 2015-2023 Agalmic Ventures LLC (www.agalmicventures.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from NanoPcap import Index, Listener, Parser
+
+import inspect
+_currentFile = os.path.abspath(inspect.getfile(inspect.currentframe()))
+_currentDir = os.path.dirname(_currentFile)
+_parentDir = os.path.dirname(_currentDir)
+_testDataPath = os.path.join(_parentDir, 'TestData')
+
+class IndexTest(unittest.TestCase):
+
+	def setUp(self):
+		self._tempDir = tempfile.mkdtemp()
+		self._pcapFileName = os.path.join(self._tempDir, 'SSH_L3.pcap')
+		shutil.copyfile(os.path.join(_testDataPath, 'SSH_L3.pcap'), self._pcapFileName)
+
+		listener = Listener.PcapRecordingListener()
+		Parser.parseFile(self._pcapFileName, listener)
+		self._recordHeaders = [r.asBytes() for r in listener.recordHeaders()]
+		self._epochNanos = [r.epochNanos() for r in listener.recordHeaders()]
+
+	def tearDown(self):
+		shutil.rmtree(self._tempDir)
+
+	def _buildIndex(self, interval):
+		with open(self._pcapFileName, 'rb') as pcapFile:
+			return Index.buildIndex(Parser.PcapParser(pcapFile), self._pcapFileName, interval=interval)
+
+	def test_build(self):
+		index = self._buildIndex(4)
+		self.assertEqual(len(index), 6)
+		self.assertEqual(index.interval(), 4)
+		self.assertEqual(index.entry(0), (0, 24, 0))
+		self.assertEqual(index.entry(1)[0], self._epochNanos[3])
+		self.assertEqual(index.entry(1)[2], 4)
+		self.assertTrue(index.isFresh(self._pcapFileName))
+
+	def test_roundTrip(self):
+		index = self._buildIndex(3)
+		readIndex = Index.readIndex(io.BytesIO(index.asBytes()))
+		self.assertEqual(readIndex.asBytes(), index.asBytes())
+		self.assertEqual([readIndex.entry(i) for i in range(len(readIndex))], [index.entry(i) for i in range(len(index))])
+
+		with self.assertRaises(ValueError):
+			Index.readIndex(io.BytesIO(b'XXXX' + index.asBytes()[4:]))
+		with self.assertRaises(ValueError):
+			Index.readIndex(io.BytesIO(index.asBytes()[:-1]))
+
+	def test_freshness(self):
+		self.assertTrue(Index.loadIndexFile(self._pcapFileName) is None)
+
+		Index.writeIndexFile(self._buildIndex(5), self._pcapFileName)
+		self.assertTrue(os.path.exists(Index.indexFileName(self._pcapFileName)))
+		self.assertTrue(Index.loadIndexFile(self._pcapFileName) is not None)
+
+		with open(self._pcapFileName, 'ab') as pcapFile:
+			pcapFile.write(b'\x00')
+		self.assertTrue(Index.loadIndexFile(self._pcapFileName) is None)
+
+	def test_seek(self):
+		for index in [None, self._buildIndex(1), self._buildIndex(4), self._buildIndex(100)]:
+			for n in range(len(self._recordHeaders) + 2):
+				with open(self._pcapFileName, 'rb') as pcapFile:
+					parser = Parser.PcapParser(pcapFile, index=index, blockSize=64)
+					parser.seekRecord(n)
+					self.assertEqual([r.asBytes() for r, _ in parser.parse()], self._recordHeaders[n:])
+
+				with open(self._pcapFileName, 'rb') as pcapFile, Parser.PcapMmapParser(pcapFile, index=index) as parser:
+					parser.seekRecord(n)
+					self.assertEqual([r.asBytes() for r, _ in parser.parse()], self._recordHeaders[n:])
+
+			for epochNanos in set(self._epochNanos) | set([0, self._epochNanos[-1] + 1]):
+				expected = self._recordHeaders[len([t for t in self._epochNanos if t < epochNanos]):]
+
+				with open(self._pcapFileName, 'rb') as pcapFile:
+					parser = Parser.PcapParser(pcapFile, index=index)
+					parser.seekTime(epochNanos)
+					self.assertEqual([r.asBytes() for r, _ in parser.parse()], expected)
+
+				with open(self._pcapFileName, 'rb') as pcapFile, Parser.PcapMmapParser(pcapFile, index=index) as parser:
+					parser.seekTime(epochNanos)
+					self.assertEqual([r.asBytes() for batch in parser.parseBatches() for r, _ in batch.records()], expected)
+
+	def test_parseFile(self):
+		Index.writeIndexFile(self._buildIndex(2), self._pcapFileName)
+
+		listener = Listener.PcapRecordingListener()
+		Parser.parseFile(self._pcapFileName, listener, startRecord=7)
+		self.assertEqual([r.asBytes() for r in listener.recordHeaders()], self._recordHeaders[7:])
+
+		listener = Listener.PcapRecordingListener()
+		Parser.parseFile(self._pcapFileName, listener, mmap=True, startTime=self._epochNanos[12])
+		self.assertEqual([r.asBytes() for r in listener.recordHeaders()], self._recordHeaders[11:])
+
+		with self.assertRaises(ValueError):
+			Parser.parseFile(self._pcapFileName, listener, startRecord=1, startTime=1)
+
+	def _gzipPcap(self, memberSize):
+		with open(self._pcapFileName, 'rb') as pcapFile:
+			data = pcapFile.read()
+
+		#Concatenated gzip members are still a valid gzip file
+		gzipFileName = self._pcapFileName + '.gz'
+		with open(gzipFileName, 'wb') as gzipFile:
+			for i in range(0, len(data), memberSize):
+				gzipFile.write(gzip.compress(data[i:i + memberSize]))
+
+		return data, gzipFileName
+
+	def test_gzipCheckpointFile(self):
+		for memberSize in [100, 1000, 100000]:
+			data, gzipFileName = self._gzipPcap(memberSize)
+
+			with open(gzipFileName, 'rb') as rawFile, Index.GzipCheckpointFile(rawFile, spacing=1) as gzipFile:
+				self.assertEqual(gzipFile.read(), data)
+				self.assertEqual(len(gzipFile.gzipMembers()), (len(data) + memberSize - 1) // memberSize)
+				self.assertEqual(gzipFile.gzipMembers()[0], (0, 0))
+
+				for offset in [5000, 0, len(data) - 1, 24, len(data) + 1, 3333, 3334, 1]:
+					self.assertEqual(gzipFile.seek(offset), min(offset, len(data)))
+					self.assertEqual(gzipFile.read(50), data[offset:offset + 50])
+
+				gzipMembers = gzipFile.gzipMembers()
+
+			#Known members can be jumped to directly
+			with open(gzipFileName, 'rb') as rawFile, Index.GzipCheckpointFile(rawFile, gzipMembers=gzipMembers) as gzipFile:
+				self.assertEqual(gzipFile.checkpointCount(), len(gzipMembers))
+				gzipFile.seek(len(data) - 10)
+				self.assertEqual(gzipFile.read(), data[-10:])
+
+	def test_gzipIndex(self):
+		_, gzipFileName = self._gzipPcap(1000)
+
+		with open(gzipFileName, 'rb') as rawFile, Index.GzipCheckpointFile(rawFile) as gzipFile:
+			index = Index.buildIndex(Parser.PcapParser(gzipFile), gzipFileName, interval=4, gzipFile=gzipFile)
+		self.assertEqual(len(index.gzipMembers()), 10)
+
+		readIndex = Index.readIndex(io.BytesIO(index.asBytes()))
+		self.assertEqual(readIndex.gzipMembers(), index.gzipMembers())
+		Index.writeIndexFile(index, gzipFileName)
+
+		for n in [0, 5, 17, 25]:
+			listener = Listener.PcapRecordingListener()
+			Parser.parseFile(gzipFileName, listener, startRecord=n)
+			self.assertEqual([r.asBytes() for r in listener.recordHeaders()], self._recordHeaders[n:])
+
+		listener = Listener.PcapRecordingListener()
+		Parser.parseFile(gzipFileName, listener, startTime=self._epochNanos[15])
+		self.assertEqual([r.asBytes() for r in listener.recordHeaders()], self._recordHeaders[15:])
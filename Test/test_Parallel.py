@@ -0,0 +1,154 @@
+
+# Copyright (c) 2015-2023 Agalmic Ventures LLC (www.agalmicventures.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from NanoPcap import Compression, Index, Listener, Parallel, Parser
+
+import inspect
+_currentFile = os.path.abspath(inspect.getfile(inspect.currentframe()))
+_currentDir = os.path.dirname(_currentFile)
+_parentDir = os.path.dirname(_currentDir)
+_testDataPath = os.path.join(_parentDir, 'TestData')
+
+def firstBytePartitioner(header):
+	return lambda data: data[0] + data[len(data) - 1]
+
+class PartitionRecordingListener(Listener.PcapRecordingListener):
+
+	#Receive records one at a time
+	onPcapRecordBatch = None
+
+	def __init__(self):
+		super().__init__()
+		self._datas = []
+		self.closed = False
+
+	def onPcapRecord(self, recordHeader, data):
+		super().onPcapRecord(recordHeader, data)
+		self._datas.append(data)
+
+	def close(self):
+		self.closed = True
+
+class ParallelTest(unittest.TestCase):
+
+	def setUp(self):
+		self._tempDir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self._tempDir)
+
+	def _recordOffsets(self, filename):
+		with open(filename, 'rb') as pcapFile, Parser.PcapMmapParser(pcapFile) as parser:
+			return [offset for batch in parser.parseBatches() for offset in batch.fileOffsets()], parser.size()
+
+	def _recordHeaders(self, filename):
+		listener = Listener.PcapRecordingListener()
+		Parser.parseFile(filename, listener)
+		return [r.asBytes() for r in listener.recordHeaders()]
+
+	def test_findRecordBoundary(self):
+		for name in ['SSH_L3.pcap', 'SSH2_L3.pcap']:
+			filename = os.path.join(_testDataPath, name)
+			recordOffsets, size = self._recordOffsets(filename)
+			with open(filename, 'rb') as pcapFile, Parser.PcapMmapParser(pcapFile) as parser:
+				#Offsets around each boundary (including misalignments within record headers)
+				offsets = set(o + d for o in recordOffsets + [size] for d in range(-17, 18) if 0 <= o + d <= size)
+				for offset in sorted(offsets):
+					boundary = parser.findRecordBoundary(offset)
+					self.assertEqual(boundary, min([o for o in recordOffsets if o >= offset] + [size]))
+
+	def test_setRange(self):
+		filename = os.path.join(_testDataPath, 'SSH_L3.pcap')
+		recordOffsets, size = self._recordOffsets(filename)
+		recordHeaders = self._recordHeaders(filename)
+		with open(filename, 'rb') as pcapFile, Parser.PcapMmapParser(pcapFile) as parser:
+			parser.setRange(recordOffsets[3], recordOffsets[7])
+			self.assertEqual([r.asBytes() for r, _ in parser.parse()], recordHeaders[3:7])
+			self.assertEqual([r.asBytes() for batch in parser.parseBatches(2) for r, _ in batch.records()], recordHeaders[3:7])
+
+			parser.setRange(0, size * 2)
+			self.assertEqual([r.asBytes() for r, _ in parser.parse()], recordHeaders)
+
+	def test_shardFile(self):
+		filename = os.path.join(self._tempDir, 'SSH_L3.pcap')
+		shutil.copyfile(os.path.join(_testDataPath, 'SSH_L3.pcap'), filename)
+		recordOffsets, size = self._recordOffsets(filename)
+
+		for indexed in [False, True]:
+			if indexed:
+				with open(filename, 'rb') as pcapFile:
+					Index.writeIndexFile(Index.buildIndex(Parser.PcapParser(pcapFile), filename, interval=3), filename)
+
+			for shards in [1, 2, 3, 5, 100]:
+				ranges = Parallel.shardFile(filename, shards)
+				self.assertTrue(1 <= len(ranges) <= shards)
+				self.assertEqual(ranges[0][0], recordOffsets[0])
+				self.assertEqual(ranges[-1][1], size)
+				for (_, end), (start, _) in zip(ranges[:-1], ranges[1:]):
+					self.assertEqual(end, start)
+					self.assertTrue(start in recordOffsets)
+
+		with self.assertRaises(ValueError):
+			Parallel.shardFile(filename, 0)
+
+	def test_parseFileParallel(self):
+		for name in ['SSH_L3.pcap', 'SSH2_L3.pcap', 'Empty.pcap']:
+			filename = os.path.join(_testDataPath, name)
+			recordHeaders = self._recordHeaders(filename)
+			for shards in [1, 4, 100]:
+				listener = Parallel.parseFileParallel(filename, Listener.PcapRecordingListener, processes=2, shards=shards)
+				self.assertTrue(listener.header() is not None)
+				self.assertEqual([r.asBytes() for r in listener.recordHeaders()], recordHeaders)
+
+		with self.assertRaises(ValueError):
+			Parallel.parseFileParallel(os.path.join(_testDataPath, 'Empty.pcap.gz'), Listener.PcapRecordingListener)
+
+	def test_parseFilePartitioned(self):
+		for name in ['SSH_L3.pcap', 'SSH2_L3.pcap', 'Empty.pcap', 'Empty.pcap.gz']:
+			filename = os.path.join(_testDataPath, name)
+			with Compression.openFile(filename, 'rb') as pcapFile:
+				records = [(r.asBytes(), data) for r, data in Parser.PcapParser(pcapFile).parse()]
+
+			for processes in [1, 3]:
+				for batchSize in [1, 5, Parser.DEFAULT_BATCH_SIZE]:
+					for listenerFactory in [PartitionRecordingListener, Listener.PcapRecordingListener]:
+						listeners = Parallel.parseFilePartitioned(filename, listenerFactory, firstBytePartitioner,
+							processes=processes, batchSize=batchSize, maxBatchesInFlight=2)
+						self.assertEqual(len(listeners), processes)
+
+						#Each worker sees exactly the records of its partition, in order
+						for i, workerListener in enumerate(listeners):
+							self.assertTrue(workerListener.header() is not None)
+							expected = [(r, data) for r, data in records if (data[0] + data[-1]) % processes == i]
+							self.assertEqual([r.asBytes() for r in workerListener.recordHeaders()], [r for r, _ in expected])
+							if listenerFactory is PartitionRecordingListener:
+								self.assertTrue(workerListener.closed)
+								self.assertEqual(workerListener._datas, [data for _, data in expected])
+
+	def test_parseFilePartitionedError(self):
+		with self.assertRaises(RuntimeError):
+			Parallel.parseFilePartitioned(os.path.join(_testDataPath, 'SSH_L3.pcap'), Listener.PcapListener, firstBytePartitioner,
+				processes=2)
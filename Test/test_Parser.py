@@ -19,10 +19,11 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import io
 import os
 import unittest
 
-from NanoPcap import Listener, Parser
+from NanoPcap import Format, Listener, Parser
 
 
 import inspect
@@ -144,3 +145,241 @@ class ParserTest(unittest.TestCase):
 		self.assertEqual(listener.header().network(), 228)
 
 		self.assertEqual(len(listener.recordHeaders()), 20)
+
+	def test_parse_mmap(self):
+		for name in ['SSH_L3.pcap', 'SSH2_L3.pcap']:
+			with open(os.path.join(_testDataPath, name), 'rb') as pcapFile:
+				expected = [(r.asBytes(), data) for r, data in Parser.PcapParser(pcapFile).parse()]
+
+			with open(os.path.join(_testDataPath, name), 'rb') as pcapFile, Parser.PcapMmapParser(pcapFile) as parser:
+				self.assertTrue(parser.header().isMagicValid())
+				self.assertEqual(parser.header().network(), 228)
+
+				actual = [(r.asBytes(), data) for r, data in parser.parse()]
+				self.assertTrue(all(isinstance(data, memoryview) for _, data in actual))
+				self.assertEqual([(r, bytes(data)) for r, data in actual], expected)
+
+	def test_parse_mmap_inverted(self):
+		listener = Listener.PcapRecordingListener()
+		Parser.parseFile(os.path.join(_testDataPath, 'EmptyNsInverted.pcap'), listener, mmap=True)
+
+		self.assertTrue(listener.header().isMagicValid())
+		self.assertEqual(listener.header().timeResolution(), 1000 * 1000 * 1000)
+		self.assertEqual(listener.header().snaplen(), 0xFFFF)
+		self.assertEqual(listener.recordHeaders(), [])
+
+	def test_parse_mmap_gzip(self):
+		listener = Listener.PcapRecordingListener()
+		Parser.parseFile(os.path.join(_testDataPath, 'Empty.pcap.gz'), listener, mmap=True)
+
+		self.assertTrue(listener.header().isMagicValid())
+		self.assertEqual(listener.recordHeaders(), [])
+
+	def test_parse_batches(self):
+		for name in ['SSH_L3.pcap', 'SSH2_L3.pcap']:
+			with open(os.path.join(_testDataPath, name), 'rb') as pcapFile:
+				expected = [(r.asBytes(), r.epochNanos(), data) for r, data in Parser.PcapParser(pcapFile).parse()]
+
+			for batchSize in [1, 7, Parser.DEFAULT_BATCH_SIZE]:
+				with open(os.path.join(_testDataPath, name), 'rb') as pcapFile:
+					batches = list(Parser.PcapParser(pcapFile).parseBatches(batchSize))
+				with open(os.path.join(_testDataPath, name), 'rb') as pcapFile, Parser.PcapMmapParser(pcapFile) as parser:
+					mmapBatches = list(parser.parseBatches(batchSize))
+
+					for b in [batches, mmapBatches]:
+						self.assertTrue(all(0 < len(batch) <= batchSize for batch in b))
+
+						actual = []
+						for batch in b:
+							for i, (r, data) in enumerate(batch.records()):
+								actual.append((r.asBytes(), batch.epochNanos()[i], bytes(data)))
+						self.assertEqual(actual, expected)
+
+						#File offsets should point at each record header
+						offset = 24
+						for batch in b:
+							for i in range(len(batch)):
+								self.assertEqual(batch.fileOffsets()[i], offset)
+								offset += 16 + batch.includedLengths()[i]
+
+	def test_parse_batches_empty(self):
+		with open(os.path.join(_testDataPath, 'EmptyNs.pcap'), 'rb') as pcapFile:
+			self.assertEqual(list(Parser.PcapParser(pcapFile).parseBatches()), [])
+		with open(os.path.join(_testDataPath, 'EmptyNs.pcap'), 'rb') as pcapFile, Parser.PcapMmapParser(pcapFile) as parser:
+			self.assertEqual(list(parser.parseBatches()), [])
+
+	def test_parse_batch_adapter(self):
+		class CountingListener(Listener.PcapListener):
+
+			def __init__(self):
+				self.header = None
+				self.records = []
+
+			def onPcapHeader(self, header):
+				self.header = header
+
+			def onPcapRecord(self, recordHeader, data):
+				self.records.append((recordHeader.asBytes(), data))
+
+		for name in ['SSH_L3.pcap', 'SSH2_L3.pcap']:
+			perRecord = CountingListener()
+			Parser.parseFile(os.path.join(_testDataPath, name), perRecord)
+
+			adapted = CountingListener()
+			adapter = Listener.PcapBatchAdapterListener(adapted)
+			Parser.parseFile(os.path.join(_testDataPath, name), adapter, batchSize=5)
+
+			self.assertTrue(adapter.listener() is adapted)
+			self.assertEqual(adapted.header.asBytes(), perRecord.header.asBytes())
+			self.assertEqual(adapted.records, perRecord.records)
+			self.assertTrue(all(type(data) is bytes for _, data in adapted.records))
+
+	def test_parse_batch_recording(self):
+		with open(os.path.join(_testDataPath, 'SSH_L3.pcap'), 'rb') as pcapFile:
+			expected = [r.asBytes() for r, _ in Parser.PcapParser(pcapFile).parse()]
+
+		for mmap in [False, True]:
+			listener = Listener.PcapRecordingListener()
+			Parser.parseFile(os.path.join(_testDataPath, 'SSH_L3.pcap'), listener, mmap=mmap, batchSize=4)
+			self.assertEqual([r.asBytes() for r in listener.recordHeaders()], expected)
+
+			Parser.parseFile(os.path.join(_testDataPath, 'SSH_L3.pcap'), Listener.PcapDoNothingListener(), mmap=mmap)
+
+	def test_parse_composite(self):
+		class TruncatingListener(Listener.PcapRecordingListener):
+			onPcapRecordBatch = None #Per-record only
+
+			def onPcapHeader(self, header):
+				header.setSnaplen(1)
+				super().onPcapHeader(header)
+
+			def onPcapRecord(self, recordHeader, data):
+				recordHeader.setIncludedLength(0)
+				super().onPcapRecord(recordHeader, data)
+
+		with open(os.path.join(_testDataPath, 'SSH_L3.pcap'), 'rb') as pcapFile:
+			expected = [r.asBytes() for r, _ in Parser.PcapParser(pcapFile).parse()]
+
+		for mmap in [False, True]:
+			truncating = TruncatingListener()
+			recording = Listener.PcapRecordingListener()
+			adapted = Listener.PcapRecordingListener()
+			composite = Listener.PcapCompositeListener([truncating, recording, Listener.PcapBatchAdapterListener(adapted)], timed=True)
+			Parser.parseFile(os.path.join(_testDataPath, 'SSH_L3.pcap'), composite, mmap=mmap, batchSize=4)
+
+			#Edits by one listener are not seen by the others
+			self.assertEqual(truncating.header().snaplen(), 1)
+			self.assertNotEqual(recording.header().snaplen(), 1)
+			self.assertEqual(len(truncating.recordHeaders()), len(expected))
+			self.assertTrue(all(r.includedLength() == 0 for r in truncating.recordHeaders()))
+			self.assertEqual([r.asBytes() for r in recording.recordHeaders()], expected)
+			self.assertEqual([r.asBytes() for r in adapted.recordHeaders()], expected)
+
+			self.assertEqual(len(composite.timings()), 3)
+			self.assertTrue(all(t > 0 for t in composite.timings()))
+
+		#Per-record events are forwarded too
+		recording = Listener.PcapRecordingListener()
+		composite = Listener.PcapCompositeListener([TruncatingListener(), recording])
+		with open(os.path.join(_testDataPath, 'SSH_L3.pcap'), 'rb') as pcapFile:
+			Parser.parse(pcapFile, Listener.PcapBatchAdapterListener(composite))
+		self.assertEqual([r.asBytes() for r in recording.recordHeaders()], expected)
+		self.assertEqual(composite.timings(), [0.0, 0.0])
+
+	def test_parse_trusted(self):
+		for name in ['SSH_L3.pcap', 'SSH2_L3.pcap']:
+			with open(os.path.join(_testDataPath, name), 'rb') as pcapFile:
+				expected = [(r.asBytes(), bytes(data)) for r, data in Parser.PcapParser(pcapFile).parse()]
+
+			with open(os.path.join(_testDataPath, name), 'rb') as pcapFile:
+				actual = [(r.asBytes(), bytes(data)) for r, data in Parser.PcapParser(pcapFile, trusted=True).parse()]
+			self.assertEqual(actual, expected)
+
+			with open(os.path.join(_testDataPath, name), 'rb') as pcapFile:
+				batches = Parser.PcapParser(pcapFile, trusted=True).parseBatches(5)
+				actual = [(r.asBytes(), bytes(data)) for batch in batches for r, data in batch.records()]
+			self.assertEqual(actual, expected)
+
+			with open(os.path.join(_testDataPath, name), 'rb') as pcapFile, Parser.PcapMmapParser(pcapFile, trusted=True) as parser:
+				self.assertEqual([(r.asBytes(), bytes(data)) for r, data in parser.parse()], expected)
+				self.assertEqual([(r.asBytes(), bytes(data)) for batch in parser.parseBatches(5) for r, data in batch.records()], expected)
+
+			for mmap in [False, True]:
+				listener = Listener.PcapRecordingListener()
+				Parser.parseFile(os.path.join(_testDataPath, name), listener, mmap=mmap, trusted=True)
+				self.assertEqual([r.asBytes() for r in listener.recordHeaders()], [r for r, _ in expected])
+
+		with self.assertRaises(ValueError):
+			with open(os.path.join(_testDataPath, 'SSH_L3.pcap'), 'rb') as pcapFile:
+				Parser.PcapParser(pcapFile, strict=True, trusted=True)
+		with self.assertRaises(ValueError):
+			Parser.parseFile(os.path.join(_testDataPath, 'SSH_L3.pcap'), Listener.PcapDoNothingListener(), mmap=True, strict=True, trusted=True)
+
+	def test_parse_flyweight(self):
+		for name in ['SSH_L3.pcap', 'SSH2_L3.pcap']:
+			with open(os.path.join(_testDataPath, name), 'rb') as pcapFile:
+				expected = [(r.asBytes(), bytes(data)) for r, data in Parser.PcapParser(pcapFile).parse()]
+
+			for trusted in [False, True]:
+				with open(os.path.join(_testDataPath, name), 'rb') as pcapFile:
+					records = [(r, r.asBytes(), bytes(data)) for r, data in Parser.PcapParser(pcapFile, trusted=trusted, flyweight=True).parse()]
+				self.assertEqual([(r, data) for _, r, data in records], expected)
+				self.assertTrue(all(r is records[0][0] for r, _, _ in records))
+				self.assertTrue(isinstance(records[0][0], Format.PcapFlyweightRecordHeader))
+
+				with open(os.path.join(_testDataPath, name), 'rb') as pcapFile, Parser.PcapMmapParser(pcapFile, trusted=trusted, flyweight=True) as parser:
+					records = [(r, r.asBytes(), bytes(data)) for r, data in parser.parse()]
+				self.assertEqual([(r, data) for _, r, data in records], expected)
+				self.assertTrue(all(r is records[0][0] for r, _, _ in records))
+
+				#Recording listeners copy flyweight headers
+				for mmap in [False, True]:
+					listener = Listener.PcapRecordingListener()
+					listener.onPcapRecordBatch = None #Per-record
+					Parser.parseFile(os.path.join(_testDataPath, name), listener, mmap=mmap, trusted=trusted, flyweight=True)
+					self.assertEqual([r.asBytes() for r in listener.recordHeaders()], [r for r, _ in expected])
+					self.assertFalse(any(isinstance(r, Format.PcapFlyweightRecordHeader) for r in listener.recordHeaders()))
+
+		#Flyweight headers are still validated
+		with open(os.path.join(_testDataPath, 'SSH_L3.pcap'), 'rb') as pcapFile:
+			data = pcapFile.read()
+		invalid = data[:24] + Format.PCAP_RECORD_HEADER_STRUCT.pack(0, 10 ** 6, 0, 0)
+		with self.assertRaises(ValueError):
+			list(Parser.PcapParser(io.BytesIO(invalid), flyweight=True).parse())
+		self.assertEqual(len(list(Parser.PcapParser(io.BytesIO(invalid), trusted=True, flyweight=True).parse())), 1)
+
+	def test_parse_block_sizes(self):
+		for name in ['SSH_L3.pcap', 'SSH2_L3.pcap']:
+			with open(os.path.join(_testDataPath, name), 'rb') as pcapFile:
+				expected = [(r.asBytes(), data) for r, data in Parser.PcapParser(pcapFile, blockSize=0).parse()]
+
+			#Small blocks force records to straddle block boundaries, and to be larger than the block
+			for blockSize in [1, 17, 100, 1000, Parser.DEFAULT_BLOCK_SIZE]:
+				with open(os.path.join(_testDataPath, name), 'rb') as pcapFile:
+					actual = [(r.asBytes(), data) for r, data in Parser.PcapParser(pcapFile, blockSize=blockSize).parse()]
+				self.assertEqual(actual, expected)
+
+				with open(os.path.join(_testDataPath, name), 'rb') as pcapFile:
+					batches = Parser.PcapParser(pcapFile, blockSize=blockSize).parseBatches(3)
+					actual = [(r.asBytes(), bytes(data)) for batch in batches for r, data in batch.records()]
+				self.assertEqual(actual, expected)
+
+	def test_parse_block_gzip(self):
+		listener = Listener.PcapRecordingListener()
+		Parser.parseFile(os.path.join(_testDataPath, 'Empty.pcap.gz'), listener, blockSize=64)
+
+		self.assertTrue(listener.header().isMagicValid())
+		self.assertEqual(listener.recordHeaders(), [])
+
+	def test_parse_direct_offsets(self):
+		#Reading records directly keeps the offsets up to date for batches parsed afterwards
+		with open(os.path.join(_testDataPath, 'SSH_L3.pcap'), 'rb') as pcapFile:
+			offsets = list(next(Parser.PcapParser(pcapFile).parseBatches(100)).fileOffsets())
+
+		for blockSize in [0, 100]:
+			with open(os.path.join(_testDataPath, 'SSH_L3.pcap'), 'rb') as pcapFile:
+				parser = Parser.PcapParser(pcapFile, blockSize=blockSize)
+				records = parser.parse()
+				for _ in range(3):
+					next(records)
+				self.assertEqual(list(next(parser.parseBatches(2)).fileOffsets()), offsets[3:5])
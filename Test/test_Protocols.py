@@ -0,0 +1,324 @@
+
+# Copyright (c) 2015-2023 Agalmic Ventures LLC (www.agalmicventures.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import struct
+import unittest
+
+from NanoPcap import Listener, Parser
+from NanoPcap.Protocols import AddressCache, Ethernet, IPv4, IPv6, TCP, UDP
+
+import inspect
+_currentFile = os.path.abspath(inspect.getfile(inspect.currentframe()))
+_currentDir = os.path.dirname(_currentFile)
+_parentDir = os.path.dirname(_currentDir)
+_testDataPath = os.path.join(_parentDir, 'TestData')
+
+def makeUdpFrame(payload, ipProtocol=UDP.UDPPacket.PROTOCOL, flagsFragment=0x4000):
+	udp = struct.pack('!HHHH', 5353, 53, 8 + len(payload), 0xABCD) + payload
+	ipv4 = struct.pack('!BBHHHBBH4s4s', 0x45, 0x2E << 2, 20 + len(udp), 1234, flagsFragment, 64, ipProtocol, 0,
+		bytes([10, 0, 0, 2]), bytes([10, 0, 0, 1])) + udp
+	ethernet = bytes([2, 0, 0, 0, 0, 1, 2, 0, 0, 0, 0, 2]) + b'\x08\x00' + ipv4
+	return ethernet + b'\x00' * 6 + b'FCS!'
+
+IPV6_SOURCE = bytes.fromhex('20010DB8000000000000000000000001')
+IPV6_DESTINATION = bytes.fromhex('FE800000000000000000000000000002')
+
+def makeIpv6Packet(extensionHeaders, nextHeader, payload):
+	payload = extensionHeaders + payload
+	return struct.pack('!IHBB', 0x60000000 | 0x03 << 20 | 0x12345, len(payload), nextHeader, 64) + \
+		IPV6_SOURCE + IPV6_DESTINATION + payload
+
+class AddressCacheTest(unittest.TestCase):
+
+	def setUp(self):
+		AddressCache.clearCaches()
+
+	def tearDown(self):
+		AddressCache.clearCaches()
+
+	def test_memoize(self):
+		calls = []
+
+		@AddressCache.memoize('Test.memoize', maxSize=2)
+		def double(value):
+			calls.append(value)
+			return value * 2
+
+		self.assertEqual(double(1), 2)
+		self.assertEqual(double(1), 2)
+		self.assertEqual(double(2), 4)
+		self.assertEqual(double(3), 6)
+		self.assertEqual(double(1), 2)
+		self.assertEqual(calls, [1, 2, 3, 1])
+
+		info = AddressCache.cacheInfo()['Test.memoize']
+		self.assertEqual(info.hits, 1)
+		self.assertEqual(info.misses, 4)
+		self.assertEqual(info.currsize, 2)
+
+	def test_addresses(self):
+		ip = bytes([10, 0, 0, 1])
+		self.assertEqual(IPv4.ipAddressToString(ip), '10.0.0.1')
+		self.assertEqual(IPv4.ipAddressToString(memoryview(ip)), '10.0.0.1')
+		self.assertEqual(IPv4.ipAddressToString(ip, separator='-'), '10-0-0-1')
+		info = AddressCache.cacheInfo()['IPv4.ipAddressToString']
+		self.assertEqual(info.hits, 1)
+		self.assertEqual(info.misses, 2)
+
+		otherIp = bytearray([10, 0, 0, 2])
+		self.assertEqual(IPv4.ipPairToKey(otherIp, ip), '10.0.0.1_10.0.0.2')
+		self.assertEqual(IPv4.ipPairToKey(memoryview(ip), otherIp), '10.0.0.1_10.0.0.2')
+		info = AddressCache.cacheInfo()['IPv4.ipPairToKey']
+		self.assertEqual(info.hits, 1)
+		self.assertEqual(info.misses, 1)
+
+		mac = bytes([0, 1, 2, 3, 4, 0xFF])
+		self.assertEqual(Ethernet.macAddressToString(mac), '00:01:02:03:04:FF')
+		self.assertEqual(Ethernet.macPairToKey(mac, bytes(6)), '00:00:00:00:00:00_00:01:02:03:04:FF')
+
+class EthernetTest(unittest.TestCase):
+
+	def test_keys(self):
+		macs = bytes([0x10, 0, 0, 0, 0, 0xAB, 0x02, 0, 0, 0, 0, 0x01])
+		packet = Ethernet.EthernetPacket(macs + b'\x08\x00payload!')
+		reversePacket = Ethernet.EthernetPacket(macs[6:12] + macs[0:6] + b'\x08\x00payload!')
+
+		self.assertEqual(packet.key(), '02:00:00:00:00:01_10:00:00:00:00:AB')
+		self.assertEqual(packet.keyBytes(), macs[6:12] + macs[0:6])
+		self.assertEqual(packet.keyBytes(), reversePacket.keyBytes())
+		self.assertEqual(packet.keyInt(), 0x020000000001_1000000000AB)
+		self.assertEqual(packet.keyInt(), reversePacket.keyInt())
+		self.assertEqual(Ethernet.EthernetPacket.keyToString(packet.keyBytes()), packet.key())
+		self.assertEqual(Ethernet.EthernetPacket(memoryview(macs + b'\x08\x00')).keyBytes(), packet.keyBytes())
+
+	def test_decode(self):
+		packet = Ethernet.EthernetPacket(makeUdpFrame(b'hello'))
+		self.assertEqual(packet.ethertype().protocol(), 'IPv4')
+		self.assertEqual(packet.crcBytes(), b'FCS!')
+
+		ipv4 = packet.payloadPacket()
+		self.assertIsInstance(ipv4, IPv4.IPv4Packet)
+		self.assertIs(packet.payloadPacket(), ipv4)
+		self.assertEqual(ipv4.key(), '10.0.0.1_10.0.0.2')
+
+		#Padding and the frame check sequence are excluded by the IPv4 length
+		udp = ipv4.payloadPacket()
+		self.assertIsInstance(udp, UDP.UDPPacket)
+		self.assertEqual(udp.sourcePort(), 5353)
+		self.assertEqual(udp.destinationPort(), 53)
+		self.assertEqual(udp.length(), 13)
+		self.assertEqual(udp.checksum(), 0xABCD)
+		self.assertEqual(udp.payload(), b'hello')
+
+	def test_decodeUnsupported(self):
+		arp = bytes(12) + b'\x08\x06' + bytes(28)
+		self.assertIsNone(Ethernet.EthernetPacket(arp).payloadPacket())
+		self.assertIsNone(Ethernet.EthernetPacket(bytes(12) + b'\x08\x00' + bytes(10)).payloadPacket())
+
+	def test_vlan(self):
+		frame = makeUdpFrame(b'tagged')
+		tagged = Ethernet.EthernetPacket(frame[0:12] + b'\x81\x00\xA0\x64' + frame[12:])
+		self.assertEqual(tagged.ethertype().protocol(), 'VLAN-tagged Frame')
+		self.assertEqual(tagged.innerEthertype().protocol(), 'IPv4')
+		self.assertEqual(tagged.vlanIds(), (100,))
+		self.assertEqual(tagged.vlanId(), 100)
+		self.assertEqual(tagged.mplsLabels(), ())
+		self.assertEqual(tagged.payloadOffset(), 18)
+		self.assertEqual(tagged.payloadPacket().payloadPacket().payload(), b'tagged')
+
+		qinq = Ethernet.EthernetPacket(frame[0:12] + b'\x88\xA8\x00\xC8\x81\x00\x0F\xFF' + frame[12:])
+		self.assertEqual(qinq.vlanIds(), (200, 4095))
+		self.assertEqual(qinq.payloadPacket().payloadPacket().payload(), b'tagged')
+
+		untagged = Ethernet.EthernetPacket(frame)
+		self.assertEqual(untagged.vlanIds(), ())
+		self.assertIsNone(untagged.vlanId())
+		self.assertEqual(untagged.innerEthertypeId(), 0x0800)
+		self.assertEqual(untagged.payloadOffset(), 14)
+
+	def test_vlanKeys(self):
+		frame = makeUdpFrame(b'')
+		qinq = Ethernet.EthernetPacket(frame[0:12] + b'\x88\xA8\x00\xC8\x81\x00\x00\x64' + frame[12:])
+		self.assertEqual(qinq.vlanKeyBytes(), b'\x02\x00\xC8\x00\x64' + qinq.keyBytes())
+		self.assertEqual(Ethernet.EthernetPacket.vlanKeyToString(qinq.vlanKeyBytes()), 'vlan200.100_' + qinq.key())
+
+		untagged = Ethernet.EthernetPacket(frame)
+		self.assertEqual(Ethernet.EthernetPacket.vlanKeyToString(untagged.vlanKeyBytes()), untagged.key())
+
+	def test_mpls(self):
+		frame = makeUdpFrame(b'labeled')
+		labels = struct.pack('!II', 16000 << 12 | 64, 17 << 12 | 0x100 | 64)
+		packet = Ethernet.EthernetPacket(frame[0:12] + b'\x81\x00\x00\x0A\x88\x47' + labels + frame[14:])
+		self.assertEqual(packet.vlanIds(), (10,))
+		self.assertEqual(packet.mplsLabels(), (16000, 17))
+		self.assertEqual(packet.innerEthertypeId(), 0x0800)
+		self.assertEqual(packet.payloadOffset(), 26)
+		self.assertEqual(packet.payloadPacket().payloadPacket().payload(), b'labeled')
+
+		#Unknown payloads are left as MPLS
+		pseudowire = Ethernet.EthernetPacket(frame[0:12] + b'\x88\x47' + labels + bytes(20))
+		self.assertEqual(pseudowire.innerEthertype().protocol(), 'MPLS Unicast')
+		self.assertIsNone(pseudowire.payloadPacket())
+
+	def test_truncatedTags(self):
+		packet = Ethernet.EthernetPacket(bytes(12) + b'\x81\x00\x00\x0A')
+		self.assertEqual(packet.vlanIds(), ())
+		self.assertEqual(packet.innerEthertypeId(), 0x8100)
+		self.assertIsNone(packet.payloadPacket())
+
+	def test_shortFrame(self):
+		#Frames cut off before the ethertype (e.g. by the snaplen) are treated as untagged
+		for length in [0, 6, 13]:
+			packet = Ethernet.EthernetPacket(bytes(range(length)))
+			self.assertEqual(packet.vlanIds(), ())
+			self.assertEqual(packet.mplsLabels(), ())
+			self.assertEqual(packet.payloadOffset(), length)
+			self.assertIsNone(packet.innerEthertype())
+			self.assertIsNone(packet.payloadPacket())
+			self.assertEqual(packet.vlanKeyBytes(), b'\x00' + packet.keyBytes())
+
+class IPv4Test(unittest.TestCase):
+
+	def test_header(self):
+		packet = Ethernet.EthernetPacket(makeUdpFrame(b'hi')).payloadPacket()
+		self.assertEqual(packet.version(), 4)
+		self.assertEqual(packet.ihl(), 5)
+		self.assertEqual(packet.headerLength(), 20)
+		self.assertEqual(packet.dscp(), 0x2E)
+		self.assertEqual(packet.ecn(), 0)
+		self.assertEqual(packet.totalLength(), 30)
+		self.assertEqual(packet.identification(), 1234)
+		self.assertEqual(packet.flags(), 0x2)
+		self.assertEqual(packet.fragmentOffset(), 0)
+		self.assertEqual(packet.ttl(), 64)
+		self.assertEqual(packet.ipProtocol().protocol(), 'UDP')
+		self.assertEqual(packet.sourceIp(), bytes([10, 0, 0, 2]))
+		self.assertEqual(packet.options(), b'')
+
+	def test_decodeUnsupported(self):
+		icmp = Ethernet.EthernetPacket(makeUdpFrame(b'', ipProtocol=1)).payloadPacket()
+		self.assertEqual(icmp.ipProtocol().protocol(), 'ICMP')
+		self.assertIsNone(icmp.payloadPacket())
+
+		fragment = Ethernet.EthernetPacket(makeUdpFrame(b'', flagsFragment=0x0010)).payloadPacket()
+		self.assertEqual(fragment.fragmentOffset(), 16)
+		self.assertIsNone(fragment.payloadPacket())
+
+	def test_tcp(self):
+		datas = []
+		class RecordingListener(Listener.PcapListener):
+			def onPcapHeader(self, header):
+				pass
+
+			def onPcapRecord(self, recordHeader, data):
+				datas.append(data)
+
+		Parser.parseFile(os.path.join(_testDataPath, 'SSH_L3.pcap'), RecordingListener())
+
+		packet = IPv4.IPv4Packet(datas[0])
+		tcp = packet.payloadPacket()
+		self.assertIsInstance(tcp, TCP.TCPPacket)
+		self.assertEqual(tcp.sourcePort(), 22)
+		self.assertEqual(tcp.destinationPort(), 61501)
+		self.assertEqual(tcp.flags(), TCP.FLAG_PSH | TCP.FLAG_ACK)
+		self.assertTrue(tcp.hasFlags(TCP.FLAG_ACK))
+		self.assertFalse(tcp.hasFlags(TCP.FLAG_SYN | TCP.FLAG_ACK))
+		self.assertEqual(tcp.headerLength(), 32)
+		self.assertEqual(len(tcp.options()), 12)
+		self.assertEqual(len(tcp.payload()), len(datas[0]) - 20 - 32)
+
+
+	def test_keys(self):
+		header = bytes(12)
+		packet = IPv4.IPv4Packet(header + bytes([192, 168, 1, 241, 192, 168, 1, 192]))
+		reversePacket = IPv4.IPv4Packet(header + bytes([192, 168, 1, 192, 192, 168, 1, 241]))
+
+		self.assertEqual(packet.key(), '192.168.1.192_192.168.1.241')
+		self.assertEqual(packet.keyBytes(), bytes([192, 168, 1, 192, 192, 168, 1, 241]))
+		self.assertEqual(packet.keyBytes(), reversePacket.keyBytes())
+		self.assertEqual(packet.keyInt(), 0xC0A801C0C0A801F1)
+		self.assertEqual(IPv4.IPv4Packet.keyToString(packet.keyBytes()), packet.key())
+		self.assertEqual(IPv4.ipKeyBytesToKey(packet.keyBytes(), separator='-'), '192.168.1.192-192.168.1.241')
+
+class IPv6Test(unittest.TestCase):
+
+	def test_header(self):
+		packet = IPv6.IPv6Packet(makeIpv6Packet(b'', UDP.UDPPacket.PROTOCOL, bytes(8)))
+		self.assertEqual(packet.version(), 6)
+		self.assertEqual(packet.trafficClass(), 3)
+		self.assertEqual(packet.flowLabel(), 0x12345)
+		self.assertEqual(packet.payloadLength(), 8)
+		self.assertEqual(packet.nextHeader(), UDP.UDPPacket.PROTOCOL)
+		self.assertEqual(packet.hopLimit(), 64)
+		self.assertEqual(packet.protocol(), UDP.UDPPacket.PROTOCOL)
+		self.assertEqual(packet.sourceIp(), IPV6_SOURCE)
+		self.assertEqual(packet.destinationIp(), IPV6_DESTINATION)
+
+	def test_keys(self):
+		packet = IPv6.IPv6Packet(makeIpv6Packet(b'', UDP.UDPPacket.PROTOCOL, bytes(8)))
+		self.assertEqual(packet.key(), '2001:db8::1_fe80::2')
+		self.assertEqual(packet.keyBytes(), IPV6_SOURCE + IPV6_DESTINATION)
+		self.assertEqual(packet.keyInt(), int.from_bytes(IPV6_SOURCE + IPV6_DESTINATION, 'big'))
+		self.assertEqual(IPv6.IPv6Packet.keyToString(packet.keyBytes()), packet.key())
+
+		reverse = bytearray(packet._data)
+		reverse[8:40] = IPV6_DESTINATION + IPV6_SOURCE
+		self.assertEqual(IPv6.IPv6Packet(reverse).keyBytes(), packet.keyBytes())
+
+	def test_extensionHeaders(self):
+		hopByHop = bytes([IPv6.NEXT_HEADER_ROUTING, 0]) + bytes(6)
+		routing = bytes([IPv6.NEXT_HEADER_FRAGMENT, 1]) + bytes(14)
+		fragment = bytes([UDP.UDPPacket.PROTOCOL, 0, 0, 0]) + bytes(4)
+		udp = struct.pack('!HHHH', 1234, 53, 12, 0) + b'data'
+		data = makeIpv6Packet(hopByHop + routing + fragment, IPv6.NEXT_HEADER_HOP_BY_HOP, udp) + b'padding'
+
+		packet = IPv6.IPv6Packet(data)
+		self.assertEqual(packet.nextHeader(), IPv6.NEXT_HEADER_HOP_BY_HOP)
+		self.assertEqual(packet.protocol(), UDP.UDPPacket.PROTOCOL)
+		self.assertEqual(packet.ipProtocol().protocol(), 'UDP')
+		self.assertEqual(packet.fragmentOffset(), 0)
+		self.assertEqual(packet.payload(), udp)
+		self.assertEqual(packet.payloadPacket().destinationPort(), 53)
+		self.assertEqual(packet.payloadPacket().payload(), b'data')
+
+	def test_fragment(self):
+		fragment = bytes([UDP.UDPPacket.PROTOCOL, 0, 0x05, 0x01]) + bytes(4)
+		packet = IPv6.IPv6Packet(makeIpv6Packet(fragment, IPv6.NEXT_HEADER_FRAGMENT, bytes(16)))
+		self.assertEqual(packet.protocol(), UDP.UDPPacket.PROTOCOL)
+		self.assertEqual(packet.fragmentOffset(), 0xA0)
+		self.assertIsNone(packet.payloadPacket())
+
+	def test_truncated(self):
+		hopByHop = bytes([UDP.UDPPacket.PROTOCOL, 4]) + bytes(6)
+		packet = IPv6.IPv6Packet(makeIpv6Packet(hopByHop, IPv6.NEXT_HEADER_HOP_BY_HOP, bytes(8)))
+		self.assertEqual(packet.payload(), b'')
+		self.assertIsNone(packet.payloadPacket())
+
+	def test_ethernet(self):
+		data = makeIpv6Packet(b'', TCP.TCPPacket.PROTOCOL, struct.pack('!HHIIHHHH', 443, 50000, 1, 2, 0x5012, 0, 0, 0))
+		packet = Ethernet.EthernetPacket(bytes(12) + b'\x86\xDD' + data).payloadPacket()
+		self.assertIsInstance(packet, IPv6.IPv6Packet)
+		self.assertEqual(packet.payloadPacket().sourcePort(), 443)
+		self.assertTrue(packet.payloadPacket().hasFlags(TCP.FLAG_SYN | TCP.FLAG_ACK))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,106 @@
+
+# Copyright (c) 2015-2023 Agalmic Ventures LLC (www.agalmicventures.com)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import collections
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from NanoPcap import Format, Listener, Parser
+from NanoPcap.Protocols import IPv4
+from NanoPcap.Tools import SplitFlows
+
+class RecordingListener(Listener.PcapListener):
+
+	def __init__(self):
+		self.header = None
+		self.records = []
+
+	def onPcapHeader(self, header):
+		self.header = header
+
+	def onPcapRecord(self, recordHeader, data):
+		self.records.append((recordHeader.asBytes(), bytes(data)))
+
+def makeIpv4Packet(source, destination, payload):
+	return struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(payload), 0, 0, 64, 17, 0, bytes(source), bytes(destination)) + payload
+
+class SplitFlowsTest(unittest.TestCase):
+
+	def setUp(self):
+		self._tempDir = tempfile.mkdtemp()
+		self._outputDir = os.path.join(self._tempDir, 'Flows')
+		os.mkdir(self._outputDir)
+
+		#Many flows, interleaved so that each is evicted and reopened several times, with some records larger than the buffer
+		self._header = Format.PcapHeader(Format.PCAP_MAGIC_NUMBER, 2, 4, 0, 0, 65535, IPv4.IPv4Packet.LINKTYPE)
+		self._records = []
+		for n in range(400):
+			flow = (n * 7) % 40
+			payload = bytes([n % 256]) * (SplitFlows.OUTPUT_BUFFER_SIZE + 100 if n % 50 == 0 else 10 + n)
+			data = makeIpv4Packet([10, 0, 0, flow], [10, 0, 1, flow], payload)
+			self._records.append((Format.PcapRecordHeader(n, 0, len(data), len(data), self._header), data))
+
+		self._inputFileName = os.path.join(self._tempDir, 'Input.pcap')
+		with Format.PcapWriter(open(self._inputFileName, 'wb')) as writer:
+			writer.writeHeader(self._header)
+			for recordHeader, data in self._records:
+				writer.writeRecord(recordHeader, data)
+
+	def tearDown(self):
+		shutil.rmtree(self._tempDir)
+
+	def _split(self, *options):
+		arguments = SplitFlows.makeArgumentParser().parse_args([self._inputFileName, self._outputDir] + list(options))
+		listener = SplitFlows.makeListener(arguments)
+		Parser.parseFile(self._inputFileName, listener)
+		listener.close()
+
+	def _checkOutput(self, extension):
+		expected = collections.defaultdict(list)
+		for recordHeader, data in self._records:
+			key = IPv4.IPv4Packet.keyToString(IPv4.IPv4Packet(data).keyBytes())
+			expected[key + extension].append((recordHeader.asBytes(), data))
+
+		self.assertEqual(sorted(os.listdir(self._outputDir)), sorted(expected))
+		for fileName, records in expected.items():
+			listener = RecordingListener()
+			Parser.parseFile(os.path.join(self._outputDir, fileName), listener)
+			self.assertEqual(listener.header.asBytes(), self._header.asBytes())
+			self.assertEqual(listener.records, records)
+
+	def test_maxOpenFiles(self):
+		self._split('--max-open-files', '3')
+		self._checkOutput('.pcap')
+
+	def test_maxOpenFiles_gzip(self):
+		self._split('--max-open-files', '3', '--gzip-output')
+		self._checkOutput('.pcap.gz')
+
+	def test_defaultMaxOpenFiles(self):
+		maxOpenFiles = SplitFlows.defaultMaxOpenFiles()
+		self.assertGreaterEqual(maxOpenFiles, 1)
+		self.assertLessEqual(maxOpenFiles, SplitFlows.DEFAULT_MAX_OPEN_FILES)
+
+if __name__ == '__main__':
+	unittest.main()